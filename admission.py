@@ -0,0 +1,197 @@
+"""Global admission control for LLM-backed chat turns.
+
+At most ``max_concurrent`` turns run the tool loop at once; the rest wait
+in a bounded queue ordered by priority, then arrival. A turn is shed up
+front (``OverloadedError``, answered 503 with ``Retry-After``) when the
+queue is full or its expected wait would not leave time to answer before
+the request deadline, and while queued when that wait runs out. Messages
+about immediate danger go in the urgent lane: they are served before any
+normal turn and, with the queue full, take the place of the newest normal
+one.
+"""
+
+import asyncio
+import heapq
+import itertools
+import re
+from collections import Counter
+from contextlib import asynccontextmanager
+
+import metrics
+from location_index import fold
+
+URGENT = 0
+NORMAL = 1
+PRIORITY_NAMES = {URGENT: "urgent", NORMAL: "normal"}
+
+SERVICE_EWMA_ALPHA = 0.2
+
+# Matched against fold(message): lower case, no accents or punctuation.
+URGENT_RE = re.compile(
+    r"\b("
+    r"(cabos?|fios?|linhas?|postes?) (eletricos? )?(caid[oa]s?|no chao|partid[oa]s?)"
+    r"|112|emergencia|perigo|choque eletrico|eletrocut\w*|faiscas?"
+    r"|incendio|fogo|fumo|cheiro a queimado|monoxido"
+    r"|equipamentos? medicos?|oxigenio|ventilador|concentrador|hemodialise"
+    r")\b"
+)
+
+
+def priority_for(message: str) -> int:
+    """``URGENT`` for messages mentioning immediate danger, else ``NORMAL``."""
+    return URGENT if URGENT_RE.search(fold(message)) else NORMAL
+
+
+class OverloadedError(Exception):
+    """The turn was not admitted; retry after ``retry_after`` seconds."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """A priority-queued semaphore that sheds load it cannot serve in time."""
+
+    def __init__(self, max_concurrent: int, max_queue: int):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.in_flight = 0
+        # (priority, arrival, future); entries whose future is done are stale.
+        self._heap: list[tuple[int, int, asyncio.Future]] = []
+        self._arrivals = itertools.count()
+        self._queued = Counter({URGENT: 0, NORMAL: 0})
+        self.service_ewma: float | None = None
+        self.admitted = 0
+        self.shed: Counter[str] = Counter()
+
+    @property
+    def queued(self) -> int:
+        return sum(self._queued.values())
+
+    def expected_wait(self, priority: int = NORMAL) -> float:
+        """Estimated queueing time for a turn arriving now, in seconds."""
+        if self.in_flight < self.max_concurrent and not self.queued:
+            return 0.0
+        ahead = sum(n for p, n in self._queued.items() if p <= priority)
+        return (ahead + 1) * (self.service_ewma or 0.0) / self.max_concurrent
+
+    @asynccontextmanager
+    async def slot(self, priority: int = NORMAL, deadline: float | None = None):
+        """Hold one slot for a turn that must finish by ``deadline``.
+
+        ``deadline`` is in event-loop time (``asyncio.Timeout.when()``).
+        Raises :class:`OverloadedError` if the turn is shed.
+        """
+        loop = asyncio.get_running_loop()
+        arrived = loop.time()
+        if self.in_flight < self.max_concurrent and not self.queued:
+            self.in_flight += 1
+        else:
+            await self._wait(priority, deadline, loop)
+        self.admitted += 1
+        started = loop.time()
+        metrics.ADMISSION_WAIT.labels(PRIORITY_NAMES[priority]).observe(
+            started - arrived
+        )
+        metrics.ADMISSION_IN_FLIGHT.set(self.in_flight)
+        try:
+            yield
+        finally:
+            service = loop.time() - started
+            self.service_ewma = (
+                service
+                if self.service_ewma is None
+                else SERVICE_EWMA_ALPHA * service
+                + (1 - SERVICE_EWMA_ALPHA) * self.service_ewma
+            )
+            self._release()
+
+    async def _wait(self, priority: int, deadline: float | None, loop) -> None:
+        budget = None
+        if deadline is not None:
+            # Leave the turn its usual running time before the deadline.
+            budget = deadline - loop.time() - (self.service_ewma or 0.0)
+        expected = self.expected_wait(priority)
+        if budget is not None and expected > budget:
+            self._shed(priority, "deadline", expected)
+        if self.queued >= self.max_queue and not (
+            priority == URGENT and self._displace_newest_normal()
+        ):
+            self._shed(priority, "queue_full", expected)
+
+        future = loop.create_future()
+        heapq.heappush(self._heap, (priority, next(self._arrivals), future))
+        self._queued[priority] += 1
+        self._export_queue(priority)
+        try:
+            async with asyncio.timeout(budget):
+                await future
+        except BaseException as e:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                # The slot was handed over just as we gave up; pass it on.
+                self._release()
+            else:
+                future.cancel()
+            if isinstance(e, TimeoutError):
+                self._shed(priority, "timeout", self.expected_wait(priority))
+            raise
+        finally:
+            self._queued[priority] -= 1
+            self._export_queue(priority)
+
+    def _displace_newest_normal(self) -> bool:
+        """Shed the latest queued normal turn to make room; False if none."""
+        waiting = [
+            (arrival, future)
+            for p, arrival, future in self._heap
+            if p == NORMAL and not future.done()
+        ]
+        if not waiting:
+            return False
+        _, future = max(waiting, key=lambda item: item[0])
+        self.shed["displaced"] += 1
+        metrics.ADMISSION_SHED.labels("normal", "displaced").inc()
+        future.set_exception(
+            OverloadedError(
+                "displaced by an urgent request",
+                retry_after=max(1.0, self.expected_wait(NORMAL)),
+            )
+        )
+        return True
+
+    def _shed(self, priority: int, reason: str, expected: float) -> None:
+        self.shed[reason] += 1
+        metrics.ADMISSION_SHED.labels(PRIORITY_NAMES[priority], reason).inc()
+        raise OverloadedError(
+            f"not admitted ({reason}); expected wait {expected:.1f}s",
+            retry_after=max(1.0, expected),
+        )
+
+    def _release(self) -> None:
+        """Hand the slot to the best waiter, or free it."""
+        while self._heap:
+            _, _, future = heapq.heappop(self._heap)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.in_flight -= 1
+        metrics.ADMISSION_IN_FLIGHT.set(self.in_flight)
+
+    def _export_queue(self, priority: int) -> None:
+        metrics.ADMISSION_QUEUE.labels(PRIORITY_NAMES[priority]).set(
+            self._queued[priority]
+        )
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "max_concurrent": self.max_concurrent,
+            "queued": {PRIORITY_NAMES[p]: n for p, n in self._queued.items()},
+            "expected_wait_seconds": round(self.expected_wait(), 3),
+            "service_seconds_ewma": round(self.service_ewma, 3)
+            if self.service_ewma is not None
+            else None,
+            "admitted": self.admitted,
+            "shed": dict(self.shed),
+        }
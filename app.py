@@ -3,129 +3,251 @@
 import asyncio
 import json
 import logging
+import math
 import time
 import uuid
 from contextlib import asynccontextmanager
-from dataclasses import dataclass, field
+from dataclasses import dataclass
 from pathlib import Path
 
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from openai import APIConnectionError, AsyncOpenAI, BadRequestError, InternalServerError
+from openai import BadRequestError
 from pydantic import BaseModel, Field
-from slowapi import Limiter
-from slowapi.errors import RateLimitExceeded
-from slowapi.util import get_remote_address
-from starlette.middleware.base import BaseHTTPMiddleware
 
+import eredes_api
+import fast_path
+import metrics
+import outage_data
+import tracing
+from admission import AdmissionController, OverloadedError, priority_for
 from config import settings
-from logging_config import generate_request_id, setup_logging
+from logging_config import generate_request_id, request_id_var, setup_logging
+from llm_router import LLMRouter, create_router
 from openai_tools import TOOLS, handle_tool_call
+from response_cache import ResponseCache, question_key
+from resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    UpstreamError,
+    UpstreamRateLimitError,
+    UpstreamUnavailableError,
+    decorrelated_jitter,
+)
+from session_locks import SessionBusyError, SessionLocks, message_key
+from session_store import SessionStore, create_session_store
+from prompt_sections import system_prompt_for
+from rate_limit import (
+    FAST_PATH,
+    LLM,
+    Rate,
+    RateLimiter,
+    client_ip,
+    create_rate_limit_store,
+    parse_networks,
+)
+from summarizer import Summarizer, is_summary
 from system_prompt import SYSTEM_PROMPT
+from token_budget import estimate_prompt_tokens, fit_to_budget
 
-setup_logging(settings.log_level)
+setup_logging(settings.log_level, settings.log_sample_rates)
 logger = logging.getLogger(__name__)
 
+if settings.trace_file:
+    tracing.configure(
+        tracing.Tracer(
+            tracing.OTLPFileExporter(settings.trace_file),
+            sample_ratio=settings.trace_sample_ratio,
+            tail_threshold_seconds=settings.trace_tail_threshold_seconds,
+        )
+    )
+
+
+# ── Session store ───────────────────────────────────────────────────────────
+session_store: SessionStore = create_session_store(
+    settings.session_backend,
+    ttl_seconds=settings.session_ttl_seconds,
+    max_count=settings.session_max_count,
+    redis_url=settings.redis_url,
+    max_bytes=settings.session_max_bytes,
+)
+response_cache = ResponseCache(
+    max_entries=settings.response_cache_max_entries,
+    ttl=settings.response_cache_ttl_seconds,
+    max_entry_bytes=settings.response_cache_max_entry_bytes,
+)
+admission = AdmissionController(
+    max_concurrent=settings.admission_max_concurrent,
+    max_queue=settings.admission_max_queue,
+)
+session_locks = SessionLocks(
+    max_queued=settings.session_max_queued_turns,
+    wait_seconds=settings.session_lock_wait_seconds,
+)
+
+# ── Rate limiting ───────────────────────────────────────────────────────────
+limiter = RateLimiter(
+    create_rate_limit_store(settings.rate_limit_backend, redis_url=settings.redis_url),
+    {
+        FAST_PATH: (
+            Rate.parse(settings.rate_limit_fast_path),
+            Rate.parse(settings.rate_limit_fast_path_session),
+        ),
+        LLM: (
+            Rate.parse(settings.rate_limit),
+            Rate.parse(settings.rate_limit_session),
+        ),
+    },
+)
+TRUSTED_PROXIES = parse_networks(settings.trusted_proxies)
+
+# ── LLM backends (OpenAI-compatible) ───────────────────────────────────────
+router: LLMRouter | None = None
 
-# ── Session dataclass ──────────────────────────────────────────────────────
-@dataclass
-class Session:
-    messages: list[dict] = field(default_factory=list)
-    last_accessed: float = field(default_factory=time.time)
 
+async def _complete_summary(messages: list[dict]) -> str:
+    """One completion for the summarizer, on the cheaper simple-turn tier."""
+    if router is None:
+        raise RuntimeError("no LLM backend configured")
+    backend = router.choose(simple=True)
+    response = await backend.create(
+        model=settings.summary_model or None,
+        messages=messages,
+        max_tokens=settings.summary_max_tokens,
+    )
+    return response.choices[0].message.content or ""
 
-# ── In-memory session store ─────────────────────────────────────────────────
-sessions: dict[str, Session] = {}
 
-SESSION_MAX_AGE_SECONDS = 2 * 60 * 60  # 2 hours
-SESSION_MAX_COUNT = 1000
-SESSION_CLEANUP_INTERVAL = 5 * 60  # 5 minutes
+summarizer = Summarizer(
+    session_store,
+    _complete_summary,
+    trigger_tokens=settings.summary_trigger_tokens,
+    trigger_messages=settings.summary_trigger_messages,
+    keep_turns=settings.summary_keep_turns,
+    timeout=settings.summary_timeout_seconds,
+    # Summaries can wait; skip them while chat turns are queueing.
+    should_defer=lambda: admission.queued > 0,
+)
 
-# ── Groq client (OpenAI-compatible) ─────────────────────────────────────────
-client: AsyncOpenAI | None = None
+
+def _new_breaker(name: str) -> CircuitBreaker:
+    return CircuitBreaker(
+        name,
+        failure_ratio=settings.groq_breaker_failure_ratio,
+        window=settings.groq_breaker_window,
+        min_calls=settings.groq_breaker_min_calls,
+        cooldown_seconds=settings.groq_breaker_cooldown_seconds,
+    )
+
+MAX_TOOL_ITERATIONS = 10
+FALLBACK_REPLY = (
+    "Peço desculpa, não consegui processar o seu pedido. "
+    "Por favor, tente novamente ou contacte a Linha de Avarias: "
+    "800 506 506."
+)
 
 
 async def _session_cleanup_loop():
-    """Background task that evicts stale sessions every 5 minutes."""
+    """Background task that periodically evicts idle sessions."""
     while True:
-        await asyncio.sleep(SESSION_CLEANUP_INTERVAL)
-        now = time.time()
-        expired = [
-            sid
-            for sid, s in sessions.items()
-            if now - s.last_accessed > SESSION_MAX_AGE_SECONDS
-        ]
-        for sid in expired:
-            del sessions[sid]
-        if expired:
-            logger.info("sessions_cleaned", extra={"evicted": len(expired)})
-
-        # Cap total sessions
-        if len(sessions) > SESSION_MAX_COUNT:
-            by_age = sorted(sessions, key=lambda s: sessions[s].last_accessed)
-            to_remove = by_age[: len(sessions) - SESSION_MAX_COUNT]
-            for sid in to_remove:
-                del sessions[sid]
-            logger.info("sessions_capped", extra={"evicted": len(to_remove)})
+        await asyncio.sleep(settings.session_cleanup_interval_seconds)
+        try:
+            evicted = await session_store.cleanup()
+        except Exception as e:
+            logger.error("sessions_cleanup_failed", extra={"error": str(e)})
+            continue
+        if evicted:
+            logger.info("sessions_cleaned", extra={"evicted": evicted})
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global client
-    if settings.groq_api_key:
-        client = AsyncOpenAI(
-            api_key=settings.groq_api_key, base_url=settings.groq_base_url
-        )
+    global router
+    backends = settings.llm_backend_configs()
+    if backends:
+        router = create_router(backends, _new_breaker)
     else:
         logger.warning(
             "GROQ_API_KEY not set. Chat will not work until "
             "the key is provided via environment variable."
         )
 
-    cleanup_task = asyncio.create_task(_session_cleanup_loop())
+    background = [asyncio.create_task(_session_cleanup_loop())]
+    if settings.outage_data_file:
+        outage_data.publish_snapshot(
+            await asyncio.to_thread(
+                outage_data.load_outage_file, settings.outage_data_file
+            )
+        )
+        background.append(
+            asyncio.create_task(
+                outage_data.watch_outage_file(
+                    settings.outage_data_file, settings.outage_data_poll_seconds
+                )
+            )
+        )
+
+    eredes_api.get_client()
+    if eredes_api.mirror is not None:
+        background.append(asyncio.create_task(eredes_api.run_mirror_sync()))
     yield
-    cleanup_task.cancel()
-    try:
-        await cleanup_task
-    except asyncio.CancelledError:
-        pass
+    await summarizer.close()
+    for task in background:
+        task.cancel()
+    for task in background:
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    await eredes_api.close_client()
+    await session_store.close()
+    await limiter.store.close()
+    if router is not None:
+        await router.close()
+    tracing.tracer.shutdown()
 
 
-limiter = Limiter(key_func=get_remote_address)
 app = FastAPI(title="E-REDES Chatbot — Tempestade Kristin", lifespan=lifespan)
-app.state.limiter = limiter
 
 
 # ── Request ID middleware ──────────────────────────────────────────────────
-class RequestIdMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
+class RequestIdMiddleware:
+    """Tags each HTTP request with an id: in logs, traces and ``X-Request-ID``.
+
+    Plain ASGI rather than ``BaseHTTPMiddleware``, which runs the endpoint
+    in a separate task and pipes the body through a memory stream.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
         request_id = generate_request_id()
+        token = request_id_var.set(request_id)
         logger.info(
             "request_started",
-            extra={
-                "request_id": request_id,
-                "method": request.method,
-                "path": request.url.path,
-            },
+            extra={"method": scope["method"], "path": scope["path"]},
         )
-        response = await call_next(request)
-        response.headers["X-Request-ID"] = request_id
-        return response
+        header = (b"x-request-id", request_id.encode())
 
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", ()), header]
+            await send(message)
 
-app.add_middleware(RequestIdMiddleware)
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_var.reset(token)
 
 
-@app.exception_handler(RateLimitExceeded)
-async def rate_limit_handler(request: Request, exc: RateLimitExceeded):
-    return JSONResponse(
-        status_code=429,
-        content={
-            "detail": "Limite de pedidos atingido. Por favor, aguarde um momento antes de tentar novamente."
-        },
-    )
+app.add_middleware(RequestIdMiddleware)
 
 
 # ── CORS middleware ────────────────────────────────────────────────────────
@@ -137,21 +259,80 @@ app.add_middleware(
 )
 
 
-def get_session(session_id: str) -> list[dict]:
-    if session_id not in sessions:
-        sessions[session_id] = Session(
-            messages=[{"role": "system", "content": SYSTEM_PROMPT}]
-        )
-    session = sessions[session_id]
-    session.last_accessed = time.time()
-    return session.messages
+async def get_session(session_id: str, message: str | None = None) -> list[dict]:
+    """Return the conversation so far, starting with the system prompt.
+
+    With ``PROMPT_RETRIEVAL`` on, the prompt holds the core instructions
+    plus only the sections relevant to ``message``, the new user message.
+    """
+    system = SYSTEM_PROMPT
+    if settings.prompt_retrieval and message is not None:
+        system = system_prompt_for(message, settings.prompt_section_min_score)
+    return [{"role": "system", "content": system}] + await session_store.load(
+        session_id
+    )
+
+
+async def save_turn(session_id: str, new_messages: list[dict]) -> None:
+    """Persist a completed turn, keeping only the last MAX_MESSAGES messages.
+
+    Long histories are then summarized in the background.
+    """
+    await session_store.append(session_id, new_messages, settings.max_messages)
+    if settings.summary_enabled:
+        summarizer.schedule(session_id)
+
 
+def trim_session(messages: list[dict], model: str | None = None) -> list[dict]:
+    """Fit the history into the model's prompt-token budget.
 
-def trim_session(messages: list[dict]) -> list[dict]:
-    """Keep system prompt + last MAX_MESSAGES messages."""
-    if len(messages) <= settings.max_messages + 1:
-        return messages
-    return [messages[0]] + messages[-(settings.max_messages):]
+    Whole turns are dropped, never splitting a ``tool_calls`` message from
+    its ``tool`` replies; older tool payloads are elided first.
+    """
+    model = model or settings.groq_model
+    budget = settings.model_prompt_token_budgets.get(
+        model, settings.prompt_token_budget
+    )
+    return fit_to_budget(messages, budget)
+
+
+def _trim_for_turn(messages: list[dict]) -> list[dict]:
+    """Trim to the budget of the backend the router would send the turn to."""
+    backend = router.preferred(simple=_is_simple_turn(messages))
+    return trim_session(messages, backend.model if backend else None)
+
+
+@dataclass
+class ChatUsage:
+    """Token usage accumulated over every LLM call of one chat request."""
+
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    llm_calls: int = 0
+    prompt_tokens_estimate: int = 0
+
+    def add(self, usage) -> None:
+        self.llm_calls += 1
+        if usage is not None:
+            prompt, completion = usage.prompt_tokens or 0, usage.completion_tokens or 0
+            self.prompt_tokens += prompt
+            self.completion_tokens += completion
+            metrics.LLM_PROMPT_TOKENS.inc(prompt)
+            metrics.LLM_COMPLETION_TOKENS.inc(completion)
+
+    def observe(self) -> None:
+        """Record this request's totals in the per-request histograms."""
+        metrics.CHAT_LLM_CALLS.observe(self.llm_calls)
+        metrics.CHAT_PROMPT_TOKENS.observe(self.prompt_tokens)
+        metrics.CHAT_COMPLETION_TOKENS.observe(self.completion_tokens)
+
+    def log_fields(self) -> dict:
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "llm_calls": self.llm_calls,
+            "prompt_tokens_estimate": self.prompt_tokens_estimate,
+        }
 
 
 # ── Request / Response models ───────────────────────────────────────────────
@@ -170,109 +351,717 @@ class ChatResponse(BaseModel):
 async def health():
     return {
         "status": "healthy",
-        "groq_configured": client is not None,
-        "active_sessions": len(sessions),
+        "groq_configured": router is not None,
+        "active_sessions": await session_store.count(),
+        "eredes_pool": eredes_api.pool_stats(),
+        "eredes_cache": eredes_api.cache_stats(),
+        "eredes_mirror": eredes_api.mirror_stats(),
+        "fast_path": fast_path.stats(),
+        "session_locks": session_locks.stats(),
+        "rate_limit": limiter.stats(),
+        "summaries": summarizer.stats(),
+        "response_cache": response_cache.stats(),
+        "admission": admission.stats(),
+        "llm": router.stats() if router is not None else None,
+        "outage_data_version": outage_data.current_snapshot().version,
     }
 
 
+@app.get("/metrics")
+async def metrics_endpoint():
+    metrics.SESSIONS_ACTIVE.set(await session_store.count())
+    # A running total: scrapes never walk the stored histories.
+    memory = session_store.memory_bytes()
+    if memory is not None:
+        metrics.SESSION_STORE_BYTES.set(memory)
+    return PlainTextResponse(
+        metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+def _observe_chat(endpoint: str, outcome: str, started: float) -> None:
+    metrics.CHAT_SECONDS.labels(endpoint, outcome).observe(
+        time.perf_counter() - started
+    )
+
+
+async def _rate_limit(request: Request, session_id: str, kind: str) -> None:
+    """Take one ``kind`` turn from the client's budgets, or raise 429."""
+    ip = client_ip(
+        request.client.host if request.client else None,
+        request.headers.get("x-forwarded-for"),
+        TRUSTED_PROXIES,
+    )
+    decision = await limiter.check(kind, ip, session_id)
+    if decision.allowed:
+        return
+    metrics.RATE_LIMITED.labels("client").inc()
+    logger.info(
+        "rate_limited",
+        extra={"session_id": session_id, "client_ip": ip, "budget": kind},
+    )
+    raise HTTPException(
+        status_code=429,
+        detail="Limite de pedidos atingido. Por favor, aguarde um momento "
+        "antes de tentar novamente.",
+        headers={"Retry-After": str(max(1, math.ceil(decision.retry_after)))},
+    )
+
+
+async def _charge_llm_turn(request: Request, session_id: str, message: str) -> None:
+    """Take one LLM turn from the client's budgets unless the cache answers it.
+
+    Only an opening question can be replayed, so the stored history is read
+    to tell. Call it once the turn is known not to be a coalesced duplicate
+    or refused as busy.
+    """
+    if not await session_store.load(session_id) and response_cache.answers(
+        _first_turn_key(message)
+    ):
+        return
+    await _rate_limit(request, session_id, LLM)
+
+
+async def _try_fast_path(
+    request: Request, req: ChatRequest
+) -> fast_path.FastAnswer | None:
+    """Answer bare location/summary queries locally and record the turn.
+
+    The turn holds the session lock like any other, so its history check
+    and save cannot interleave with an LLM turn. While another turn is in
+    flight the message goes to the LLM path, which queues behind it and
+    shares the reply with duplicates. If the data cannot be rendered, the
+    message goes to the LLM instead.
+    """
+    if session_locks.busy(req.session_id):
+        return None
+    try:
+        async with session_locks.turn(req.session_id, None):
+            try:
+                answer = await fast_path.try_answer(
+                    req.message, lambda: session_store.load(req.session_id)
+                )
+            except (KeyError, TypeError, ValueError, IndexError) as e:
+                logger.error(
+                    "fast_path_render_failed",
+                    extra={
+                        "session_id": req.session_id,
+                        "error": f"{type(e).__name__}: {e}",
+                    },
+                )
+                return None
+            if answer is None:
+                return None
+            await _rate_limit(request, req.session_id, FAST_PATH)
+            await save_turn(
+                req.session_id,
+                [{"role": "user", "content": req.message}, *answer.messages],
+            )
+    except SessionBusyError:
+        return None
+    logger.info(
+        "chat_fast_path",
+        extra={"session_id": req.session_id, "reply_length": len(answer.reply)},
+    )
+    return answer
+
+
 # ── Chat endpoint ───────────────────────────────────────────────────────────
 @app.post("/api/chat", response_model=ChatResponse)
-@limiter.limit(settings.rate_limit)
+@tracing.traced("chat", tracing.SERVER)
 async def chat(request: Request, req: ChatRequest):
     if not req.message.strip():
         raise HTTPException(status_code=400, detail="A mensagem não pode estar vazia.")
 
-    if client is None:
+    started = time.perf_counter()
+    answer = await _try_fast_path(request, req)
+    if answer is not None:
+        _observe_chat("chat", "fast_path", started)
+        tracing.current_span().set_attribute("chat.fast_path", True)
+        return ChatResponse(reply=answer.reply, session_id=req.session_id)
+
+    if router is None:
         raise HTTPException(
             status_code=503,
             detail="Serviço temporariamente indisponível. Por favor, tente mais tarde.",
         )
+    key = message_key(req.message)
+    shared = session_locks.pending(req.session_id, key)
+    if shared is not None:
+        # The same message is already being answered: share that reply.
+        outcome = "coalesced_error"
+        try:
+            reply = await asyncio.shield(shared)
+            outcome = "coalesced"
+        except HTTPException:
+            raise
+        except SessionBusyError as e:
+            raise _session_busy_error(e)
+        except OverloadedError as e:
+            raise _overloaded_error(e)
+        except UpstreamError as e:
+            # Raised by a shared streaming turn, which has no HTTP status.
+            status_code, detail = _upstream_error_response(e)
+            raise HTTPException(status_code=status_code, detail=detail)
+        except Exception as e:
+            logger.error(
+                "chat_error", extra={"session_id": req.session_id, "error": str(e)}
+            )
+            raise HTTPException(
+                status_code=502,
+                detail="Erro interno do serviço. Por favor, tente novamente.",
+            )
+        finally:
+            _observe_chat("chat", outcome, started)
+        logger.info("chat_coalesced", extra={"session_id": req.session_id})
+        return ChatResponse(reply=reply, session_id=req.session_id)
 
+    try:
+        session_locks.check(req.session_id)
+        await _charge_llm_turn(request, req.session_id, req.message)
+        async with session_locks.turn(req.session_id, key) as result:
+            reply = await _chat_turn(req, started)
+            result.set_result(reply)
+    except SessionBusyError as e:
+        _observe_chat("chat", "busy", started)
+        raise _session_busy_error(e)
+    return ChatResponse(reply=reply, session_id=req.session_id)
+
+
+async def _chat_turn(req: ChatRequest, started: float) -> str:
+    """Answer one message with the LLM; the caller holds the session lock."""
     session_id = req.session_id or str(uuid.uuid4())
-    messages = get_session(session_id)
+    tracing.current_span().set_attribute("session.id", session_id)
+    messages = await get_session(session_id, req.message)
     messages.append({"role": "user", "content": req.message})
+    # Keyed before trimming, which can make a follow-up look like a first turn.
+    cache_key = _response_cache_key(messages)
+    messages = _trim_for_turn(messages)
+    checkpoint = len(messages) - 1
+    usage = ChatUsage(prompt_tokens_estimate=estimate_prompt_tokens(messages))
 
     logger.info(
         "chat_request",
         extra={"session_id": session_id, "message_length": len(req.message)},
     )
 
+    priority = priority_for(req.message)
+    tracing.current_span().set_attribute("chat.priority", priority)
     try:
-        reply = await asyncio.wait_for(
-            _process_chat(messages),
-            timeout=settings.chat_timeout_seconds,
-        )
-    except asyncio.TimeoutError:
-        messages.pop()
+        async with (
+            asyncio.timeout(settings.chat_timeout_seconds) as deadline,
+            response_cache.turn(cache_key) as cached,
+        ):
+            if cached.messages is not None:
+                reply = _replay_turn(messages, cached.messages)
+            else:
+                async with admission.slot(priority, deadline.when()):
+                    reply = await _process_chat(
+                        messages, usage, deadline=deadline.when()
+                    )
+                turn = messages[checkpoint + 1 :]
+                cached.store(turn, cacheable=_is_cacheable(turn))
+    except TimeoutError:
         logger.warning("chat_timeout", extra={"session_id": session_id})
+        _observe_chat("chat", "timeout", started)
         raise HTTPException(
             status_code=504,
             detail="O pedido demorou demasiado tempo. Por favor, tente novamente.",
         )
+    except OverloadedError as e:
+        logger.warning(
+            "chat_overloaded", extra={"session_id": session_id, "error": str(e)}
+        )
+        _observe_chat("chat", "overloaded", started)
+        raise _overloaded_error(e)
+    except UpstreamError as e:
+        logger.warning(
+            "chat_upstream_error",
+            extra={
+                "session_id": session_id,
+                "error_type": type(e).__name__,
+                "error": str(e),
+            },
+        )
+        status_code, detail = _upstream_error_response(e)
+        _observe_chat("chat", "upstream_error", started)
+        if status_code == 429:
+            metrics.RATE_LIMITED.labels("upstream").inc()
+        headers = (
+            {"Retry-After": str(math.ceil(e.retry_after))}
+            if e.retry_after is not None
+            else None
+        )
+        raise HTTPException(status_code=status_code, detail=detail, headers=headers)
     except Exception as e:
-        messages.pop()
-        err_str = str(e)
-        if "rate_limit" in err_str.lower() or "429" in err_str:
-            raise HTTPException(
-                status_code=429,
-                detail="Limite de utilização atingido. Por favor, tente novamente dentro de alguns segundos.",
-            )
         logger.error("chat_error", extra={"session_id": session_id, "error": str(e)})
+        _observe_chat("chat", "error", started)
         raise HTTPException(
             status_code=502,
             detail="Erro interno do serviço. Por favor, tente novamente.",
         )
 
+    replayed = cached.messages is not None
+    tracing.current_span().set_attribute("chat.cached", replayed)
     logger.info(
         "chat_response",
-        extra={"session_id": session_id, "reply_length": len(reply)},
+        extra={
+            "session_id": session_id,
+            "reply_length": len(reply),
+            "cached": replayed,
+            **usage.log_fields(),
+        },
     )
 
-    # Trim session to avoid unbounded growth
-    sessions[session_id].messages = trim_session(messages)
+    await save_turn(session_id, messages[checkpoint:])
+    if replayed:
+        _observe_chat("chat", "cached", started)
+    else:
+        usage.observe()
+        _observe_chat("chat", "ok", started)
+    return reply
+
+
+def _response_cache_key(messages: list[dict]) -> tuple | None:
+    """Cache key for a first turn (system prompt + one question), else None.
 
-    return ChatResponse(reply=reply, session_id=session_id)
+    ``messages`` must be the untrimmed history.
+    """
+    if len(messages) != 2:
+        return None
+    return _first_turn_key(messages[-1]["content"])
 
 
-async def _call_groq_with_retry(messages: list[dict], use_tools: bool = True):
-    """Call Groq API with retry on 5xx / connection errors (max 2 retries)."""
-    max_retries = 2
-    for attempt in range(max_retries + 1):
+def _first_turn_key(question: str) -> tuple:
+    return (
+        question_key(question),
+        outage_data.current_snapshot().version,
+        tuple(backend.model for backend in router.backends),
+    )
+
+
+def _replay_turn(messages: list[dict], cached: list[dict]) -> str:
+    """Append a cached turn's messages as if the tool loop had produced them."""
+    messages.extend(dict(m) for m in cached)
+    return messages[-1]["content"]
+
+
+async def _admitted(events, priority: int, deadline: float):
+    """Pass ``events`` through while holding an admission slot."""
+    async with admission.slot(priority, deadline):
+        async for event in events:
+            yield event
+
+
+async def _replay_events(messages: list[dict], cached: list[dict]):
+    """``_stream_chat``'s events for a cached turn: the whole reply at once."""
+    reply = _replay_turn(messages, cached)
+    yield "token", {"text": reply}
+    yield "done", {"reply": reply}
+
+
+def _is_cacheable(turn: list[dict]) -> bool:
+    """A clean answer: no fallback reply and no failed tool call."""
+    if turn[-1]["content"] == FALLBACK_REPLY:
+        return False
+    return not any(
+        m["role"] == "tool" and m["content"].startswith('{"erro"') for m in turn
+    )
+
+
+def _overloaded_error(error: OverloadedError) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail=(
+            "O serviço está com muita procura. Por favor, tente novamente "
+            "dentro de alguns segundos. Em caso de perigo, ligue 112."
+        ),
+        headers={"Retry-After": str(math.ceil(error.retry_after))},
+    )
+
+
+def _session_busy_error(error: SessionBusyError) -> HTTPException:
+    """429 when the session's queue is full, 409 when the wait timed out."""
+    if error.queue_full:
+        return HTTPException(
+            status_code=429,
+            detail=(
+                "Ainda estamos a responder às suas mensagens anteriores. "
+                "Por favor, aguarde pela resposta."
+            ),
+        )
+    return HTTPException(
+        status_code=409,
+        detail=(
+            "Outro pedido desta conversa está em curso. "
+            "Por favor, tente novamente dentro de momentos."
+        ),
+    )
+
+
+def _upstream_error_response(error: UpstreamError) -> tuple[int, str]:
+    """HTTP status and user-facing message for a typed upstream failure."""
+    if isinstance(error, UpstreamRateLimitError):
+        return 429, (
+            "Limite de utilização atingido. Por favor, tente novamente "
+            "dentro de alguns segundos."
+        )
+    if isinstance(error, CircuitOpenError):
+        return 503, (
+            "Serviço temporariamente indisponível. Por favor, tente "
+            "novamente dentro de alguns segundos."
+        )
+    return 502, "Erro interno do serviço. Por favor, tente novamente."
+
+
+def _sse(event: str, data: dict) -> str:
+    """Format one Server-Sent Event frame."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+# ── Streaming chat endpoint (SSE) ──────────────────────────────────────────
+@app.post("/api/chat/stream")
+async def chat_stream(request: Request, req: ChatRequest):
+    if not req.message.strip():
+        raise HTTPException(status_code=400, detail="A mensagem não pode estar vazia.")
+
+    started = time.perf_counter()
+    answer = await _try_fast_path(request, req)
+    if answer is not None:
+        _observe_chat("chat_stream", "fast_path", started)
+        done = {"reply": answer.reply, "session_id": req.session_id}
+        return StreamingResponse(
+            iter([_sse("token", {"text": answer.reply}), _sse("done", done)]),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    if router is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Serviço temporariamente indisponível. Por favor, tente mais tarde.",
+        )
+    session_id = req.session_id
+    key = message_key(req.message)
+    shared = session_locks.pending(session_id, key)
+    if shared is None:
         try:
-            kwargs = {
-                "model": settings.groq_model,
-                "messages": messages,
-            }
-            if use_tools:
-                kwargs["tools"] = TOOLS
-            return await client.chat.completions.create(**kwargs)
-        except (InternalServerError, APIConnectionError) as e:
-            if attempt < max_retries:
-                wait = 2 ** attempt
-                logger.warning(
-                    "groq_retry",
-                    extra={"attempt": attempt + 1, "wait": wait, "error": str(e)},
+            session_locks.check(session_id)
+        except SessionBusyError as e:
+            _observe_chat("chat_stream", "busy", started)
+            raise _session_busy_error(e)
+        await _charge_llm_turn(request, session_id, req.message)
+
+    async def frames():
+        outcome = "disconnected"
+        try:
+            if shared is not None:
+                # The same message is already being answered: share that reply.
+                reply = await asyncio.shield(shared)
+                outcome = "coalesced"
+                logger.info("chat_coalesced", extra={"session_id": session_id})
+                yield _sse("token", {"text": reply})
+                yield _sse("done", {"reply": reply, "session_id": session_id})
+                return
+
+            # The lock is taken here, not in the endpoint, so that a response
+            # whose body never runs cannot leave the session locked.
+            async with session_locks.turn(session_id, key) as result:
+                messages = await get_session(session_id, req.message)
+                messages.append({"role": "user", "content": req.message})
+                cache_key = _response_cache_key(messages)
+                messages = _trim_for_turn(messages)
+                checkpoint = len(messages) - 1
+                usage = ChatUsage(
+                    prompt_tokens_estimate=estimate_prompt_tokens(messages)
+                )
+                logger.info(
+                    "chat_stream_request",
+                    extra={
+                        "session_id": session_id,
+                        "message_length": len(req.message),
+                    },
                 )
+
+                async with (
+                    asyncio.timeout(settings.chat_timeout_seconds) as deadline,
+                    response_cache.turn(cache_key) as cached,
+                ):
+                    if cached.messages is not None:
+                        events = _replay_events(messages, cached.messages)
+                    else:
+                        events = _admitted(
+                            _stream_chat(messages, usage, deadline=deadline.when()),
+                            priority_for(req.message),
+                            deadline.when(),
+                        )
+                    async for event, data in events:
+                        if event == "done":
+                            replayed = cached.messages is not None
+                            if not replayed:
+                                turn = messages[checkpoint + 1 :]
+                                cached.store(turn, cacheable=_is_cacheable(turn))
+                            # Persist before the final frame so a client that
+                            # disconnects right after it still has the turn saved.
+                            await save_turn(session_id, messages[checkpoint:])
+                            result.set_result(data["reply"])
+                            if replayed:
+                                outcome = "cached"
+                            else:
+                                usage.observe()
+                                outcome = "ok"
+                            logger.info(
+                                "chat_response",
+                                extra={
+                                    "session_id": session_id,
+                                    "reply_length": len(data["reply"]),
+                                    "cached": replayed,
+                                    **usage.log_fields(),
+                                },
+                            )
+                            data = {**data, "session_id": session_id}
+                        yield _sse(event, data)
+        except SessionBusyError as e:
+            outcome = "busy"
+            error = _session_busy_error(e)
+            yield _sse("error", {"detail": error.detail, "status": error.status_code})
+        except OverloadedError as e:
+            logger.warning(
+                "chat_overloaded", extra={"session_id": session_id, "error": str(e)}
+            )
+            outcome = "overloaded"
+            error = _overloaded_error(e)
+            yield _sse(
+                "error",
+                {"detail": error.detail, "status": 503, "retry_after": e.retry_after},
+            )
+        except HTTPException as e:
+            # A shared /api/chat turn failed.
+            outcome = "error"
+            yield _sse("error", {"detail": e.detail, "status": e.status_code})
+        except TimeoutError:
+            logger.warning("chat_timeout", extra={"session_id": session_id})
+            outcome = "timeout"
+            yield _sse(
+                "error",
+                {"detail": "O pedido demorou demasiado tempo. Por favor, tente novamente."},
+            )
+        except UpstreamError as e:
+            logger.warning(
+                "chat_upstream_error",
+                extra={
+                    "session_id": session_id,
+                    "error_type": type(e).__name__,
+                    "error": str(e),
+                },
+            )
+            status_code, detail = _upstream_error_response(e)
+            outcome = "upstream_error"
+            if status_code == 429:
+                metrics.RATE_LIMITED.labels("upstream").inc()
+            yield _sse(
+                "error",
+                {"detail": detail, "status": status_code, "retry_after": e.retry_after},
+            )
+        except Exception as e:
+            logger.error("chat_error", extra={"session_id": session_id, "error": str(e)})
+            outcome = "error"
+            yield _sse(
+                "error",
+                {"detail": "Erro interno do serviço. Por favor, tente novamente."},
+            )
+        finally:
+            _observe_chat("chat_stream", outcome, started)
+            if outcome not in ("ok", "coalesced", "cached"):
+                tracing.current_span().set_error(outcome)
+
+    async def event_stream():
+        with tracing.span("chat_stream", tracing.SERVER, **{"session.id": session_id}):
+            async for frame in frames():
+                yield frame
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _is_simple_turn(messages: list[dict]) -> bool:
+    """A short opening message with no tool round yet: fine for a smaller model.
+
+    Follow-ups, however short ("e amanhã?"), lean on the earlier turns (or
+    their summary) and stay with the main model.
+    """
+    last = messages[-1]
+    return (
+        last["role"] == "user"
+        and len(last.get("content") or "") <= settings.llm_simple_turn_max_chars
+        and all(m["role"] == "system" and not is_summary(m) for m in messages[:-1])
+    )
+
+
+@tracing.traced("llm")
+async def _call_groq_with_retry(
+    messages: list[dict],
+    use_tools: bool = True,
+    stream: bool = False,
+    deadline: float | None = None,
+):
+    """Route a completion to an LLM backend, failing over and retrying.
+
+    A backend that is rate limited or failing is swapped for another usable
+    one straight away. Once every backend has been tried, 5xx and connection
+    errors are retried with decorrelated jitter and 429s after the upstream's
+    ``Retry-After``. A retry is only attempted if its wait still ends before
+    ``deadline`` (event-loop time); otherwise, or once ``GROQ_MAX_RETRIES``
+    is spent, a typed :class:`UpstreamError` is raised. Other 4xx errors
+    propagate unchanged.
+    """
+    kwargs = {}
+    if use_tools:
+        kwargs["tools"] = TOOLS
+    if stream:
+        kwargs["stream"] = True
+        kwargs["stream_options"] = {"include_usage": True}
+
+    loop = asyncio.get_running_loop()
+    simple = _is_simple_turn(messages)
+    tried = []
+    delay = settings.groq_retry_base_seconds
+    for attempt in range(settings.groq_max_retries + 1):
+        backend = router.choose(simple=simple, exclude=tried)
+        # A failover may land on a model with a smaller budget.
+        kwargs["messages"] = trim_session(messages, backend.model)
+        with tracing.span(
+            "llm.attempt",
+            tracing.CLIENT,
+            **{
+                "llm.backend": backend.name,
+                "llm.model": backend.model,
+                "llm.attempt": attempt + 1,
+                "llm.stream": stream,
+            },
+        ) as span:
+            try:
+                return await backend.create(**kwargs)
+            except (UpstreamRateLimitError, UpstreamUnavailableError) as e:
+                error = e
+                span.set_error(f"{type(e).__name__}: {e}")
+        tried.append(backend)
+
+        if attempt == settings.groq_max_retries:
+            raise error
+        if router.candidates(simple=simple, exclude=tried):
+            wait = 0.0
+        elif isinstance(error, UpstreamRateLimitError) and error.retry_after is not None:
+            wait = error.retry_after
+        else:
+            wait = delay = decorrelated_jitter(
+                delay, settings.groq_retry_base_seconds, settings.groq_retry_max_seconds
+            )
+        if deadline is not None and loop.time() + wait >= deadline:
+            raise error
+        logger.warning(
+            "groq_retry",
+            extra={
+                "attempt": attempt + 1,
+                "backend": backend.name,
+                "wait": round(wait, 3),
+                "error_type": type(error).__name__,
+                "error": str(error),
+            },
+        )
+        if wait:
+            with tracing.span("llm.retry_wait", **{"retry.wait_seconds": wait}):
                 await asyncio.sleep(wait)
-            else:
-                raise
 
 
-async def _process_chat(messages: list[dict]) -> str:
+_TOOL_NAMES = frozenset(tool["function"]["name"] for tool in TOOLS)
+
+
+async def _execute_tool_call(call: dict, semaphore: asyncio.Semaphore) -> dict:
+    """Run one tool call, turning bad arguments and failures into tool errors."""
+    fn_name = call["function"]["name"]
+    # Names come from the model; keep the metric's label set bounded.
+    tool_label = fn_name if fn_name in _TOOL_NAMES else "unknown"
+    started = time.perf_counter()
+    try:
+        fn_args = json.loads(call["function"]["arguments"] or "{}")
+        if not isinstance(fn_args, dict):
+            raise ValueError("arguments must be a JSON object")
+    except ValueError as e:
+        logger.warning("tool_bad_arguments", extra={"tool": fn_name, "error": str(e)})
+        result = {"erro": f"Argumentos inválidos para a ferramenta {fn_name}."}
+        outcome = "bad_arguments"
+    else:
+        async with semaphore:
+            try:
+                with tracing.span("tool", **{"tool.name": fn_name}):
+                    content = await asyncio.wait_for(
+                        handle_tool_call(fn_name, fn_args),
+                        timeout=settings.tool_timeout_seconds,
+                    )
+                metrics.TOOL_SECONDS.labels(tool_label, "ok").observe(
+                    time.perf_counter() - started
+                )
+                return {"role": "tool", "tool_call_id": call["id"], "content": content}
+            except asyncio.TimeoutError:
+                logger.warning("tool_timeout", extra={"tool": fn_name})
+                result = {"erro": f"A ferramenta {fn_name} excedeu o tempo limite."}
+                outcome = "timeout"
+            except Exception as e:
+                logger.error("tool_error", extra={"tool": fn_name, "error": str(e)})
+                result = {"erro": f"Erro ao executar a ferramenta {fn_name}."}
+                outcome = "error"
+
+    metrics.TOOL_SECONDS.labels(tool_label, outcome).observe(
+        time.perf_counter() - started
+    )
+    return {
+        "role": "tool",
+        "tool_call_id": call["id"],
+        "content": json.dumps(result, ensure_ascii=False),
+    }
+
+
+async def _run_tool_calls(tool_calls: list[dict]) -> list[dict]:
+    """Execute the tool calls of one assistant turn concurrently.
+
+    At most ``settings.tool_concurrency`` run at once. Replies come back in
+    the order of ``tool_calls`` so the history stays valid for the API.
+    """
+    semaphore = asyncio.Semaphore(settings.tool_concurrency)
+    return list(
+        await asyncio.gather(
+            *(_execute_tool_call(call, semaphore) for call in tool_calls)
+        )
+    )
+
+
+@tracing.traced("process_chat")
+async def _process_chat(
+    messages: list[dict],
+    usage: ChatUsage | None = None,
+    deadline: float | None = None,
+) -> str:
     """Run the tool-call loop and return the final reply text."""
-    max_iterations = 10
     reply = ""
 
-    for _ in range(max_iterations):
+    for _ in range(MAX_TOOL_ITERATIONS):
         try:
-            response = await _call_groq_with_retry(messages)
+            response = await _call_groq_with_retry(messages, deadline=deadline)
         except BadRequestError as e:
             if "tool_use_failed" in str(e):
                 logger.warning("Tool call failed, retrying without tools: %s", e)
-                response = await _call_groq_with_retry(messages, use_tools=False)
+                response = await _call_groq_with_retry(
+                    messages, use_tools=False, deadline=deadline
+                )
             else:
                 raise
 
+        if usage is not None:
+            usage.add(response.usage)
         choice = response.choices[0]
 
         if choice.finish_reason == "tool_calls" or choice.message.tool_calls:
@@ -292,34 +1081,93 @@ async def _process_chat(messages: list[dict]) -> str:
                 ],
             }
             messages.append(assistant_msg)
-
-            for tool_call in choice.message.tool_calls:
-                fn_name = tool_call.function.name
-                fn_args = json.loads(tool_call.function.arguments)
-                result = await handle_tool_call(fn_name, fn_args)
-
-                messages.append(
-                    {
-                        "role": "tool",
-                        "tool_call_id": tool_call.id,
-                        "content": result,
-                    }
-                )
+            messages.extend(await _run_tool_calls(assistant_msg["tool_calls"]))
         else:
             reply = choice.message.content or ""
             messages.append({"role": "assistant", "content": reply})
             break
     else:
-        reply = (
-            "Peço desculpa, não consegui processar o seu pedido. "
-            "Por favor, tente novamente ou contacte a Linha de Avarias: "
-            "800 506 506."
-        )
+        reply = FALLBACK_REPLY
         messages.append({"role": "assistant", "content": reply})
 
     return reply
 
 
+async def _stream_chat(
+    messages: list[dict],
+    usage: ChatUsage | None = None,
+    deadline: float | None = None,
+):
+    """Run the tool-call loop, streaming assistant content as it arrives.
+
+    Yields ``(event, data)`` tuples: ``token`` for each content delta,
+    ``tool`` before each tool runs and a final ``done`` with the full reply.
+    """
+    for _ in range(MAX_TOOL_ITERATIONS):
+        try:
+            stream = await _call_groq_with_retry(
+                messages, stream=True, deadline=deadline
+            )
+        except BadRequestError as e:
+            if "tool_use_failed" in str(e):
+                logger.warning("Tool call failed, retrying without tools: %s", e)
+                stream = await _call_groq_with_retry(
+                    messages, use_tools=False, stream=True, deadline=deadline
+                )
+            else:
+                raise
+
+        content_parts: list[str] = []
+        tool_calls: dict[int, dict] = {}
+        chunk_usage = None
+        async for chunk in stream:
+            # With include_usage the last chunk carries usage and no choices.
+            chunk_usage = getattr(chunk, "usage", None) or chunk_usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                content_parts.append(delta.content)
+                yield "token", {"text": delta.content}
+            # Tool calls arrive as fragments keyed by index; stitch them.
+            for tc in delta.tool_calls or []:
+                entry = tool_calls.setdefault(
+                    tc.index,
+                    {
+                        "id": "",
+                        "type": "function",
+                        "function": {"name": "", "arguments": ""},
+                    },
+                )
+                if tc.id:
+                    entry["id"] = tc.id
+                if tc.function:
+                    if tc.function.name:
+                        entry["function"]["name"] += tc.function.name
+                    if tc.function.arguments:
+                        entry["function"]["arguments"] += tc.function.arguments
+
+        if usage is not None:
+            usage.add(chunk_usage)
+        content = "".join(content_parts)
+        if not tool_calls:
+            messages.append({"role": "assistant", "content": content})
+            yield "done", {"reply": content}
+            return
+
+        calls = [tool_calls[i] for i in sorted(tool_calls)]
+        messages.append(
+            {"role": "assistant", "content": content or None, "tool_calls": calls}
+        )
+        for call in calls:
+            yield "tool", {"name": call["function"]["name"]}
+        messages.extend(await _run_tool_calls(calls))
+
+    messages.append({"role": "assistant", "content": FALLBACK_REPLY})
+    yield "token", {"text": FALLBACK_REPLY}
+    yield "done", {"reply": FALLBACK_REPLY}
+
+
 # ── Serve static frontend ───────────────────────────────────────────────────
 static_dir = Path(__file__).parent / "static"
 app.mount("/static", StaticFiles(directory=static_dir), name="static")
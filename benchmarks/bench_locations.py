@@ -0,0 +1,79 @@
+"""Microbenchmark: location index lookups against a national-size gazetteer.
+
+Builds the index from the outage dataset plus a synthetic gazetteer of
+~300 municipalities and ~3000 parishes, then times exact, accent-folded,
+misspelt and postal-code lookups.
+
+    python -m benchmarks.bench_locations
+"""
+
+import argparse
+import json
+import random
+import time
+
+from location_index import LocationIndex
+from outage_data import OUTAGE_DATA, POSTAL_CODE_DISTRICT_MAP
+
+# Consonant-vowel(-coda) syllables give names about as varied as real
+# Portuguese toponyms; a tiny syllable set would make every trigram common.
+SYLLABLES = [
+    onset + vowel + coda
+    for onset in ("b", "c", "d", "f", "g", "l", "m", "n", "p", "r", "s", "t", "v", "br", "ch", "tr")
+    for vowel in "aeiou"
+    for coda in ("", "r", "s", "l")
+]
+
+
+def _synthetic_gazetteer(rng: random.Random, size: int) -> dict[str, str]:
+    districts = list(OUTAGE_DATA)
+    names = {}
+    while len(names) < size:
+        words = [
+            "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).title()
+            for _ in range(rng.randint(1, 3))
+        ]
+        names[" ".join(words)] = rng.choice(districts)
+    return names
+
+
+def _time(fn, queries, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for q in queries:
+            fn(q)
+    return (time.perf_counter() - started) / (repeat * len(queries)) * 1e9
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--names", type=int, default=3300)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    gazetteer = _synthetic_gazetteer(rng, args.names)
+    started = time.perf_counter()
+    index = LocationIndex.from_outage_data(
+        OUTAGE_DATA, POSTAL_CODE_DISTRICT_MAP, aliases=gazetteer
+    )
+    build_ms = (time.perf_counter() - started) * 1000
+
+    sample = rng.sample(sorted(gazetteer), 50)
+    typos = [name[:2] + name[3:] for name in sample]
+    results = {
+        "names_indexed": len(index),
+        "build_ms": round(build_ms, 2),
+        "ns_per_lookup": {
+            "exact": round(_time(index.lookup_name, ["Leiria", "Pombal"], args.repeat * 25), 1),
+            "folded": round(_time(index.lookup_name, ["SANTAREM", "Montemor o Velho"], args.repeat * 25), 1),
+            "gazetteer_exact": round(_time(index.lookup_name, [s.lower() for s in sample], args.repeat), 1),
+            "fuzzy": round(_time(index.lookup_name, typos, args.repeat // 10 or 1), 1),
+            "postal_cp7": round(_time(index.lookup_postal, ["2400-001", "3000-123"], args.repeat * 25), 1),
+        },
+    }
+    print(json.dumps({"benchmark": "locations", "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
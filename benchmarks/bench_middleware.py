@@ -0,0 +1,134 @@
+"""Microbenchmark: per-request overhead of the request-id and logging stack.
+
+Serves the real ``/health`` handler behind the previous stack (a
+``BaseHTTPMiddleware`` request-id middleware logging synchronously through
+a ``StreamHandler``) and the current one (plain ASGI middleware, queued
+logging, fast JSON), both writing logs to ``/dev/null``, and reports the
+mean time per request over an in-process ASGI transport.
+
+    python -m benchmarks.bench_middleware --requests 5000 --concurrency 1 16
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+
+from fastapi import FastAPI, Request
+from httpx import ASGITransport, AsyncClient
+from starlette.middleware.base import BaseHTTPMiddleware
+
+import app as app_module
+import logging_config
+from logging_config import generate_request_id, request_id_var
+
+try:
+    from pythonjsonlogger.json import JsonFormatter as _PreviousFormatter
+except ImportError:  # the previous formatter's package is no longer required
+    _PreviousFormatter = None
+
+logger = logging.getLogger("app")
+
+
+class _PreviousRequestIdMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        request_id = generate_request_id()
+        request_id_var.set(request_id)
+        logger.info(
+            "request_started",
+            extra={
+                "request_id": request_id,
+                "method": request.method,
+                "path": request.url.path,
+            },
+        )
+        response = await call_next(request)
+        response.headers["X-Request-ID"] = request_id
+        return response
+
+
+def _previous_logging(devnull) -> str:
+    logging_config.shutdown_logging()
+    handler = logging.StreamHandler(devnull)
+    if _PreviousFormatter is not None:
+        handler.setFormatter(
+            _PreviousFormatter(
+                fmt="%(asctime)s %(levelname)s %(name)s %(message)s",
+                rename_fields={"asctime": "timestamp", "levelname": "level"},
+            )
+        )
+        formatter = "python-json-logger"
+    else:
+        handler.setFormatter(logging_config.JsonFormatter())
+        formatter = "JsonFormatter (python-json-logger not installed)"
+    root = logging.getLogger()
+    root.handlers.clear()
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
+    return formatter
+
+
+def _health_app(middleware) -> FastAPI:
+    bench_app = FastAPI()
+    bench_app.get("/health")(app_module.health)
+    bench_app.add_middleware(middleware)
+    return bench_app
+
+
+async def _time_requests(bench_app, requests: int, concurrency: int) -> float:
+    async with AsyncClient(
+        transport=ASGITransport(app=bench_app), base_url="http://bench"
+    ) as client:
+        for _ in range(50):
+            await client.get("/health")
+
+        async def worker(count: int) -> None:
+            for _ in range(count):
+                resp = await client.get("/health")
+                assert "x-request-id" in resp.headers
+
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(worker(requests // concurrency) for _ in range(concurrency))
+        )
+        elapsed = time.perf_counter() - started
+    return elapsed / (requests // concurrency * concurrency) * 1e6
+
+
+async def _run(requests: int, concurrencies: list[int]) -> dict:
+    results = {}
+    with open(os.devnull, "w") as devnull:
+        formatter = _previous_logging(devnull)
+        before = _health_app(_PreviousRequestIdMiddleware)
+        before_us = {
+            c: await _time_requests(before, requests, c) for c in concurrencies
+        }
+
+        logging_config.setup_logging("INFO", stream=devnull)
+        after = _health_app(app_module.RequestIdMiddleware)
+        after_us = {c: await _time_requests(after, requests, c) for c in concurrencies}
+        logging_config.shutdown_logging()
+
+    for c in concurrencies:
+        results[f"concurrency_{c}"] = {
+            "before_us_per_request": round(before_us[c], 1),
+            "after_us_per_request": round(after_us[c], 1),
+            "saved_us_per_request": round(before_us[c] - after_us[c], 1),
+        }
+    results["previous_formatter"] = formatter
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16])
+    args = parser.parse_args()
+    results = asyncio.run(_run(args.requests, args.concurrency))
+    print(json.dumps({"benchmark": "middleware", "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
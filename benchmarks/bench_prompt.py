@@ -0,0 +1,78 @@
+"""Microbenchmark: system-prompt tokens saved by retrieving sections.
+
+For a set of typical questions, compares the estimated tokens of the full
+system prompt (sent on every LLM call before) with the core prompt plus
+the sections retrieved for the question, per LLM call and per request
+(``--llm-calls`` calls for a turn with one tool round), and times the
+retrieval itself.
+
+    python -m benchmarks.bench_prompt --llm-calls 2
+"""
+
+import argparse
+import json
+import time
+
+from prompt_sections import INDEX, system_prompt_for
+from system_prompt import SYSTEM_PROMPT
+from token_budget import estimate_tokens
+
+QUESTIONS = [
+    "Quando volta a luz em Leiria?",
+    "Há interrupções programadas no meu concelho esta semana?",
+    "Qual é a situação geral da tempestade no país?",
+    "Obrigado! E em Coimbra, como está a situação?",
+    "Tenho um gerador, é seguro ligá-lo à instalação elétrica de casa?",
+    "Caiu um cabo elétrico na minha rua, o que faço?",
+    "Tenho direito a compensação por estar 3 dias sem luz?",
+    "Qual é o número da linha de avarias?",
+]
+
+
+def _tokens(prompt: str) -> int:
+    return estimate_tokens({"role": "system", "content": prompt})
+
+
+def _time_selection(repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for question in QUESTIONS:
+            system_prompt_for(question)
+    return (time.perf_counter() - started) / (repeat * len(QUESTIONS)) * 1e6
+
+
+def _run(llm_calls: int, repeat: int) -> dict:
+    before = _tokens(SYSTEM_PROMPT)
+    questions = {}
+    for question in QUESTIONS:
+        after = _tokens(system_prompt_for(question))
+        questions[question] = {
+            "sections": INDEX.select(question),
+            "system_tokens": after,
+            "saved_tokens_per_request": (before - after) * llm_calls,
+        }
+    saved = [q["saved_tokens_per_request"] for q in questions.values()]
+    return {
+        "full_system_tokens": before,
+        "llm_calls_per_request": llm_calls,
+        "mean_saved_tokens_per_request": round(sum(saved) / len(saved), 1),
+        "selection_us": round(_time_selection(repeat), 2),
+        "questions": questions,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--llm-calls", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+    results = _run(args.llm_calls, args.repeat)
+    print(
+        json.dumps(
+            {"benchmark": "prompt", "results": results}, indent=2, ensure_ascii=False
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Microbenchmark: resident memory of the in-memory session store.
+
+Fills the store with ``--sessions`` sessions of ``--turns`` realistic
+turns each (fast-path answers, tool-call rounds with district payloads,
+free-text replies), built from fresh strings as requests would deliver
+them. Compares the previous representation (one dict per message, nested
+dicts for tool calls) with the compact one, measured with ``tracemalloc``,
+and reports the store's own running estimate next to one that counts
+shared strings once (a full walk of the store).
+
+    python -m benchmarks.bench_session_memory --sessions 50000 --turns 3
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import random
+import tracemalloc
+import uuid
+
+from benchmarks.fake_servers import LOCATIONS
+from fast_path import try_answer
+from openai_tools import handle_tool_call
+from session_store import MemorySessionStore, Session
+
+QUESTIONS = [
+    "Quando é que a luz volta na minha rua? Estou sem eletricidade desde ontem.",
+    "Obrigado! E em Coimbra, como está a situação?",
+    "Tenho um gerador, é seguro ligá-lo à instalação elétrica de casa?",
+]
+
+
+class _PreviousStore(MemorySessionStore):
+    """The previous layout: the appended dicts, kept as they are."""
+
+    async def append(self, session_id, messages, max_messages):
+        session = self.sessions.setdefault(session_id, Session())
+        session.messages.extend(messages)
+        if len(session.messages) > max_messages:
+            del session.messages[: len(session.messages) - max_messages]
+
+
+def _fresh(messages: list[dict]) -> list[dict]:
+    # Requests and LLM responses arrive as newly parsed JSON.
+    return json.loads(json.dumps(messages, ensure_ascii=False))
+
+
+async def _turn(rng: random.Random) -> list[dict]:
+    kind = rng.random()
+    if kind < 0.3:
+        # Answered locally, as the load test's fast-path messages are.
+        location = rng.choice(LOCATIONS[:4])
+        answer = await try_answer(location)
+        return [*_fresh([{"role": "user", "content": location}]), *answer.messages]
+
+    question = rng.choice(QUESTIONS)
+    reply = f"{rng.choice(QUESTIONS)} {uuid.uuid4().hex} " * 8
+    if kind < 0.7:
+        return _fresh([{"role": "user", "content": question}]) + [
+            {"role": "assistant", "content": reply}
+        ]
+    location = rng.choice(LOCATIONS)
+    arguments = {"localizacao": location}
+    call_id = f"call_{uuid.uuid4().hex[:12]}"
+    content = await handle_tool_call("consultar_estado_tempestade_kristin", arguments)
+    turn = _fresh(
+        [
+            {"role": "user", "content": question},
+            {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [
+                    {
+                        "id": call_id,
+                        "type": "function",
+                        "function": {
+                            "name": "consultar_estado_tempestade_kristin",
+                            "arguments": json.dumps(arguments, ensure_ascii=False),
+                        },
+                    }
+                ],
+            },
+        ]
+    )
+    # Storm tool results are shared strings in both layouts.
+    return turn + [
+        {"role": "tool", "tool_call_id": call_id, "content": content},
+        {"role": "assistant", "content": reply},
+    ]
+
+
+async def _measure(store_cls, sessions: int, turns: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    gc.collect()
+    tracemalloc.start()
+    store = store_cls(ttl_seconds=3600, max_count=sessions)
+    for i in range(sessions):
+        for _ in range(turns):
+            await store.append(f"s{i}", await _turn(rng), max_messages=50)
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result = {
+        "traced_mib": round(current / 2**20, 1),
+        "bytes_per_session": round(current / sessions),
+    }
+    if store_cls is MemorySessionStore:
+        result["estimated_mib"] = round(store.memory_bytes() / 2**20, 1)
+        seen: set[int] = set()
+        deduplicated = sum(s.memory_bytes(seen) for s in store.sessions.values())
+        result["estimated_deduplicated_mib"] = round(deduplicated / 2**20, 1)
+        result["session_bytes_estimate"] = store.session_bytes("s0")
+    return result
+
+
+async def _run(sessions: int, turns: int, seed: int) -> dict:
+    return {
+        "sessions": sessions,
+        "turns_per_session": turns,
+        "before": await _measure(_PreviousStore, sessions, turns, seed),
+        "after": await _measure(MemorySessionStore, sessions, turns, seed),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=50_000)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    results = asyncio.run(_run(args.sessions, args.turns, args.seed))
+    print(json.dumps({"benchmark": "session_memory", "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Microbenchmark: per-request overhead of the in-memory session store.
+
+Fills the store to its cap, then replays a mix of returning visitors and
+new visitors (each new one forcing an LRU eviction) and reports the mean
+cost of one load + append round trip. The numbers should stay flat as the
+store grows.
+
+    python -m benchmarks.bench_sessions --sizes 1000 10000 100000
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from session_store import MemorySessionStore
+
+TURN = [
+    {"role": "user", "content": "Quando volta a luz em Leiria?"},
+    {"role": "assistant", "content": "A previsão de reposição é 2026-02-05."},
+]
+
+
+async def _bench_size(size: int, requests: int, new_ratio: float) -> dict:
+    store = MemorySessionStore(ttl_seconds=3600, max_count=size)
+    for i in range(size):
+        await store.append(f"s{i}", TURN, max_messages=50)
+
+    rng = random.Random(size)
+    next_id = size
+    started = time.perf_counter()
+    for _ in range(requests):
+        if rng.random() < new_ratio:
+            session_id = f"s{next_id}"
+            next_id += 1
+        else:
+            session_id = f"s{rng.randrange(next_id - size, next_id)}"
+        await store.load(session_id)
+        await store.append(session_id, TURN, max_messages=50)
+    elapsed = time.perf_counter() - started
+
+    cleanup_started = time.perf_counter()
+    await store.cleanup()
+    cleanup_elapsed = time.perf_counter() - cleanup_started
+
+    return {
+        "sessions": size,
+        "requests": requests,
+        "us_per_request": round(elapsed / requests * 1e6, 3),
+        "cleanup_us": round(cleanup_elapsed * 1e6, 3),
+        "evicted": store.evicted_capped,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--requests", type=int, default=50_000)
+    parser.add_argument("--new-ratio", type=float, default=0.3)
+    args = parser.parse_args()
+
+    results = [
+        await _bench_size(size, args.requests, args.new_ratio) for size in args.sizes
+    ]
+    print(json.dumps({"benchmark": "sessions", "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,77 @@
+"""Microbenchmark: per-call cost of the storm tools.
+
+Compares the per-request work the handler used to do (look up, re-sum every
+district for the summary, ``json.dumps`` the result) with the current
+handler, which returns strings serialized once per dataset version.
+
+    python -m benchmarks.bench_tools
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import outage_data
+from openai_tools import handle_tool_call
+
+LOCATIONS = ["Leiria", "2400-001", "Santarém", "coimbra"]
+
+
+def _before_location(location: str) -> str:
+    snapshot = outage_data.current_snapshot()
+    data = snapshot.lookup(location)
+    return json.dumps({**data, "versao_dados": snapshot.version}, ensure_ascii=False)
+
+
+def _before_summary() -> str:
+    snapshot = outage_data.current_snapshot()
+    summary = outage_data._national_summary(snapshot.districts, snapshot.storm_date)
+    return json.dumps({**summary, "versao_dados": snapshot.version}, ensure_ascii=False)
+
+
+def _time_sync(fn, calls: list[tuple], repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for args in calls:
+            fn(*args)
+    return (time.perf_counter() - started) / (repeat * len(calls)) * 1e9
+
+
+async def _time_tool(name: str, calls: list[dict], repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for arguments in calls:
+            await handle_tool_call(name, arguments)
+    return (time.perf_counter() - started) / (repeat * len(calls)) * 1e9
+
+
+async def _run(repeat: int) -> dict:
+    location_calls = [{"localizacao": loc} for loc in LOCATIONS]
+    for arguments in location_calls:
+        content = await handle_tool_call("consultar_estado_tempestade_kristin", arguments)
+        assert content == _before_location(arguments["localizacao"])
+    assert await handle_tool_call("resumo_nacional_tempestade", {}) == _before_summary()
+
+    return {
+        "consultar_estado_tempestade_kristin": {
+            "before_ns": round(_time_sync(_before_location, [(loc,) for loc in LOCATIONS], repeat), 1),
+            "after_ns": round(await _time_tool("consultar_estado_tempestade_kristin", location_calls, repeat), 1),
+        },
+        "resumo_nacional_tempestade": {
+            "before_ns": round(_time_sync(_before_summary, [()], repeat * 4), 1),
+            "after_ns": round(await _time_tool("resumo_nacional_tempestade", [{}], repeat * 4), 1),
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20000)
+    args = parser.parse_args()
+    results = asyncio.run(_run(args.repeat))
+    print(json.dumps({"benchmark": "tools", "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
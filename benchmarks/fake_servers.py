@@ -0,0 +1,171 @@
+"""Local stand-ins for Groq and the E-REDES open data API, for load tests.
+
+``FakeGroqServer`` extends the test server with jittered latency, random
+error responses and tool calls: a user turn is answered with one of the
+configured tool-call patterns (or plain text), a turn ending in tool
+results with plain text. ``FakeOpenDataServer`` serves the opendatasoft
+``records`` endpoint with generated scheduled-work records.
+"""
+
+import asyncio
+import json
+import random
+import uuid
+from collections import deque
+from collections.abc import Sequence
+from urllib.parse import parse_qs, urlsplit
+
+from tests.fake_openai import FakeHTTPServer, FakeOpenAIServer
+from token_budget import estimate_prompt_tokens
+
+LOCATIONS = ["Leiria", "Coimbra", "Santarém", "Pombal", "2400-001", "Ourém"]
+MUNICIPALITIES = ["Leiria", "Coimbra", "Pombal", "Tomar", "Ourém", "Batalha"]
+
+DEFAULT_TOOL_PATTERNS: tuple[tuple[str, ...], ...] = (
+    ("consultar_estado_tempestade_kristin",),
+    ("consultar_interrupcoes_programadas",),
+    ("consultar_estado_tempestade_kristin", "consultar_interrupcoes_programadas"),
+    ("resumo_nacional_tempestade",),
+)
+
+
+def _jittered(rng: random.Random, mean: float, jitter: float) -> float:
+    """``mean`` spread uniformly by ±``jitter`` of itself."""
+    return max(0.0, mean * rng.uniform(1 - jitter, 1 + jitter)) if mean else 0.0
+
+
+def _tool_arguments(rng: random.Random, name: str) -> dict:
+    if name == "consultar_estado_tempestade_kristin":
+        return {"localizacao": rng.choice(LOCATIONS)}
+    if name == "consultar_interrupcoes_programadas":
+        return {"concelho": rng.choice(MUNICIPALITIES)}
+    return {}
+
+
+class FakeGroqServer(FakeOpenAIServer):
+    def __init__(
+        self,
+        latency: float = 0.3,
+        jitter: float = 0.5,
+        tool_ratio: float = 0.7,
+        tool_patterns: Sequence[tuple[str, ...]] = DEFAULT_TOOL_PATTERNS,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        seed: int | None = None,
+    ):
+        super().__init__(
+            reply="Segundo os dados mais recentes, a reposição está em curso.",
+            latency=latency,
+        )
+        self.jitter = jitter
+        self.tool_ratio = tool_ratio
+        self.tool_patterns = [tuple(p) for p in tool_patterns]
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.rng = random.Random(seed)
+        # Only the latest request bodies; a long run must not grow memory.
+        self.requests = deque(maxlen=100)
+        self.calls = 0
+        self.errors = 0
+        # Estimated prompt tokens over every call, as the app counts them.
+        self.prompt_tokens = 0
+
+    def _latency(self) -> float:
+        return _jittered(self.rng, self.latency, self.jitter)
+
+    def _error(self, payload):
+        self.calls += 1
+        self.prompt_tokens += estimate_prompt_tokens(payload.get("messages", []))
+        scripted = super()._error(payload)
+        if scripted is not None:
+            return scripted
+        draw = self.rng.random()
+        if draw < self.rate_limit_rate:
+            self.errors += 1
+            return 429, {"retry-after": "1"}
+        if draw < self.rate_limit_rate + self.error_rate:
+            self.errors += 1
+            return 503, {}
+        return None
+
+    def _message(self, payload):
+        messages = payload.get("messages") or [{}]
+        if (
+            messages[-1].get("role") != "user"
+            or not payload.get("tools")
+            or self.rng.random() >= self.tool_ratio
+        ):
+            return super()._message(payload)
+        pattern = self.rng.choice(self.tool_patterns)
+        return {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [
+                {
+                    "id": f"call_{uuid.uuid4().hex[:12]}",
+                    "type": "function",
+                    "function": {
+                        "name": name,
+                        "arguments": json.dumps(
+                            _tool_arguments(self.rng, name), ensure_ascii=False
+                        ),
+                    },
+                }
+                for name in pattern
+            ],
+        }
+
+
+class FakeOpenDataServer(FakeHTTPServer):
+    """Serves ``GET .../{dataset}/records`` like opendatasoft's v2 API."""
+
+    path = "/api/v2/catalog/datasets"
+
+    def __init__(
+        self,
+        latency: float = 0.1,
+        jitter: float = 0.5,
+        error_rate: float = 0.0,
+        records: int = 5,
+        seed: int | None = None,
+    ):
+        super().__init__()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.records = records
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+
+    def _record(self, municipality: str, i: int) -> dict:
+        return {
+            "record": {
+                "fields": {
+                    "zipcode": f"24{i:02d}-001",
+                    "municipality": municipality.upper(),
+                    "parish": f"Freguesia {i}",
+                    "startdatetime": f"2026-02-{10 + i:02d}T09:00:00+00:00",
+                    "enddatetime": f"2026-02-{10 + i:02d}T13:00:00+00:00",
+                    "durationallocation": "4h",
+                }
+            }
+        }
+
+    async def _route(self, method, target, body):
+        self.requests += 1
+        if latency := _jittered(self.rng, self.latency, self.jitter):
+            await asyncio.sleep(latency)
+        if self.rng.random() < self.error_rate:
+            self.errors += 1
+            return 503, {"content-type": "application/json"}, b'{"error": "fake"}'
+
+        query = parse_qs(urlsplit(target).query)
+        where = query.get("where", [""])[0]
+        municipality = where.split('"')[1] if '"' in where else "Leiria"
+        limit = min(int(query.get("limit", ["10"])[0]), self.records)
+        payload = {
+            "total_count": self.records,
+            "records": [self._record(municipality, i) for i in range(limit)],
+        }
+        return 200, {"content-type": "application/json"}, json.dumps(payload).encode()
@@ -0,0 +1,339 @@
+"""Load test: the full app under many concurrent chat sessions, offline.
+
+Starts the app with uvicorn on a local port, pointed at a fake Groq and a
+fake E-REDES open data server (both with configurable latency and error
+rates; Groq also with tool-call patterns), then drives ``/api/chat`` (or
+``/api/chat/stream``) with ``--sessions`` sessions of ``--turns`` turns
+each, at most ``--concurrency`` requests in flight. Reports throughput,
+latency percentiles, event-loop lag and memory per session as JSON, so
+runs of two builds can be diffed.
+
+Everything shares one event loop, so the numbers include the client and
+fake servers; compare builds on the same machine and settings.
+
+    python -m benchmarks.load_test --sessions 500 --turns 4 --concurrency 64
+    python -m benchmarks.load_test --stream --error-rate 0.05 --output run.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from collections import Counter
+
+import httpx
+import uvicorn
+
+import app as app_module
+from benchmarks.fake_servers import (
+    DEFAULT_TOOL_PATTERNS,
+    LOCATIONS,
+    FakeGroqServer,
+    FakeOpenDataServer,
+)
+
+LLM_MESSAGES = [
+    "Há interrupções programadas no meu concelho esta semana?",
+    "Quando é que a luz volta na minha rua? Estou sem eletricidade desde ontem.",
+    "Qual é a situação geral da tempestade no país?",
+    "Tenho um gerador, é seguro ligá-lo à instalação elétrica de casa?",
+    "Obrigado! E em Coimbra, como está a situação?",
+]
+# Bare locations and summary queries are answered without the LLM.
+FAST_PATH_MESSAGES = [*LOCATIONS[:4], "resumo nacional"]
+
+
+def _percentiles(values: list[float]) -> dict:
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def pick(q: float) -> float:
+        index = min(len(ordered) - 1, max(0, round(q * len(ordered)) - 1))
+        return round(ordered[index] * 1000, 2)
+
+    return {
+        "p50_ms": pick(0.50),
+        "p90_ms": pick(0.90),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+        "max_ms": round(ordered[-1] * 1000, 2),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2),
+    }
+
+
+def _git_revision() -> str | None:
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            timeout=5,
+        )
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+class _LoopLagMonitor:
+    """Measures how late a periodic timer fires: the event loop's backlog."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.lags: list[float] = []
+        self._task: asyncio.Task | None = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, loop.time() - started - self.interval))
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+class _Results:
+    def __init__(self):
+        self.latencies: list[float] = []
+        self.first_token: list[float] = []
+        self.statuses: Counter[str] = Counter()
+
+
+async def _send(
+    client: httpx.AsyncClient,
+    session_id: str,
+    message: str,
+    stream: bool,
+    results: _Results,
+) -> None:
+    payload = {"session_id": session_id, "message": message}
+    started = time.perf_counter()
+    try:
+        if not stream:
+            response = await client.post("/api/chat", json=payload)
+            status = str(response.status_code)
+        else:
+            status = "no_done"
+            async with client.stream("POST", "/api/chat/stream", json=payload) as r:
+                if r.status_code != 200:
+                    status = str(r.status_code)
+                event = first_token = None
+                async for line in r.aiter_lines():
+                    if line.startswith("event: "):
+                        event = line[7:]
+                        if event == "token" and first_token is None:
+                            first_token = time.perf_counter() - started
+                            results.first_token.append(first_token)
+                        elif event == "done":
+                            status = "200"
+                    elif line.startswith("data: ") and event == "error":
+                        status = f"error_{json.loads(line[6:]).get('status', 500)}"
+    except httpx.HTTPError as e:
+        status = type(e).__name__
+    results.latencies.append(time.perf_counter() - started)
+    results.statuses[status] += 1
+
+
+async def _session(
+    index: int,
+    args,
+    client: httpx.AsyncClient,
+    semaphore: asyncio.Semaphore,
+    results: _Results,
+) -> None:
+    rng = random.Random(args.seed * 100_003 + index)
+    for _ in range(args.turns):
+        if rng.random() < args.fast_path_ratio:
+            message = rng.choice(FAST_PATH_MESSAGES)
+        else:
+            message = rng.choice(LLM_MESSAGES)
+        async with semaphore:
+            await _send(client, f"load-{index}", message, args.stream, results)
+        if args.think_time:
+            await asyncio.sleep(rng.uniform(0, 2 * args.think_time))
+
+
+def _configure_app(groq: FakeGroqServer, opendata: FakeOpenDataServer, args) -> None:
+    # Per-request INFO logs would dominate the profile and flood stderr.
+    logging.getLogger().setLevel(args.log_level)
+    settings = app_module.settings
+    settings.groq_api_key = "load-test"
+    settings.groq_base_url = groq.base_url
+    settings.groq_fallback_model = ""
+    settings.llm_backends = []
+    settings.eredes_api_base = opendata.base_url
+    if not args.eredes_cache:
+        settings.eredes_cache_ttl_seconds = 0
+        settings.eredes_cache_error_ttl_seconds = 0
+    settings.prompt_retrieval = args.prompt_retrieval
+    app_module.limiter.enabled = False
+    if hasattr(app_module.session_store, "max_count"):
+        app_module.session_store.max_count = max(
+            app_module.session_store.max_count, args.sessions
+        )
+
+
+async def _run(args) -> dict:
+    groq = FakeGroqServer(
+        latency=args.llm_latency,
+        jitter=args.jitter,
+        tool_ratio=args.tool_ratio,
+        tool_patterns=[tuple(p.split("+")) for p in args.tool_patterns],
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        seed=args.seed,
+    )
+    opendata = FakeOpenDataServer(
+        latency=args.eredes_latency,
+        jitter=args.jitter,
+        error_rate=args.eredes_error_rate,
+        seed=args.seed,
+    )
+    async with groq, opendata:
+        _configure_app(groq, opendata, args)
+        server = uvicorn.Server(
+            uvicorn.Config(
+                app_module.app,
+                host="127.0.0.1",
+                port=0,
+                log_level="warning",
+                access_log=False,
+                lifespan="on",
+            )
+        )
+        serving = asyncio.create_task(server.serve())
+        while not server.started:
+            if serving.done():
+                serving.result()
+            await asyncio.sleep(0.01)
+        port = server.servers[0].sockets[0].getsockname()[1]
+
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        results = _Results()
+        monitor = _LoopLagMonitor()
+        limits = httpx.Limits(max_connections=args.concurrency)
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=120.0
+        ) as client:
+            semaphore = asyncio.Semaphore(args.concurrency)
+            monitor.start()
+            started = time.perf_counter()
+            await asyncio.gather(
+                *(
+                    _session(i, args, client, semaphore, results)
+                    for i in range(args.sessions)
+                )
+            )
+            elapsed = time.perf_counter() - started
+            await monitor.stop()
+            health = (await client.get("/health")).json()
+
+        sessions = await app_module.session_store.count()
+        store_bytes = app_module.session_store.memory_bytes()
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        server.should_exit = True
+        await serving
+
+    requests = len(results.latencies)
+    return {
+        "requests": requests,
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 2),
+        "statuses": dict(results.statuses),
+        "latency": _percentiles(results.latencies),
+        "time_to_first_token": _percentiles(results.first_token),
+        "event_loop_lag": _percentiles(monitor.lags),
+        "memory": {
+            "sessions": sessions,
+            "store_bytes_per_session": round(store_bytes / sessions)
+            if store_bytes is not None and sessions
+            else None,
+            # ru_maxrss is in KiB on Linux.
+            "peak_rss_growth_kib": rss_after - rss_before,
+        },
+        "upstream": {
+            "llm_calls": groq.calls,
+            "llm_errors": groq.errors,
+            "llm_prompt_tokens_estimate": groq.prompt_tokens,
+            "llm_prompt_tokens_per_request": round(groq.prompt_tokens / requests, 1)
+            if requests
+            else None,
+            "eredes_calls": opendata.requests,
+            "eredes_errors": opendata.errors,
+        },
+        "health": health,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--think-time", type=float, default=0.0,
+                        help="mean pause between a session's turns, seconds")
+    parser.add_argument("--stream", action="store_true",
+                        help="drive /api/chat/stream instead of /api/chat")
+    parser.add_argument("--fast-path-ratio", type=float, default=0.2)
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--eredes-latency", type=float, default=0.1)
+    parser.add_argument("--jitter", type=float, default=0.5,
+                        help="latency spread as a fraction of the mean")
+    parser.add_argument("--tool-ratio", type=float, default=0.7,
+                        help="share of user turns the fake LLM answers with tool calls")
+    parser.add_argument(
+        "--tool-patterns",
+        nargs="+",
+        default=["+".join(p) for p in DEFAULT_TOOL_PATTERNS],
+        help="tool-call patterns; parallel calls joined with '+'",
+    )
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="share of LLM calls answered 503")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0,
+                        help="share of LLM calls answered 429")
+    parser.add_argument("--eredes-error-rate", type=float, default=0.0)
+    parser.add_argument("--eredes-cache", action=argparse.BooleanOptionalAction,
+                        default=True, help="keep the E-REDES response cache on")
+    parser.add_argument("--prompt-retrieval", action=argparse.BooleanOptionalAction,
+                        default=True,
+                        help="send only the relevant system-prompt sections")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = {
+        "benchmark": "load",
+        "build": {
+            "revision": _git_revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+        },
+        "config": vars(args),
+        "results": asyncio.run(_run(args)),
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
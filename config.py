@@ -1,8 +1,17 @@
 """Application settings loaded from environment variables and .env file."""
 
+from pydantic import BaseModel
 from pydantic_settings import BaseSettings
 
 
+class LLMBackendConfig(BaseModel):
+    name: str
+    api_key: str
+    model: str
+    base_url: str = "https://api.groq.com/openai/v1"
+    tier: str = "primary"  # "primary", or "fallback" for a cheaper model
+
+
 class Settings(BaseSettings):
     model_config = {"env_file": ".env", "env_file_encoding": "utf-8"}
 
@@ -10,23 +19,137 @@ class Settings(BaseSettings):
     groq_api_key: str = ""
     groq_base_url: str = "https://api.groq.com/openai/v1"
     groq_model: str = "llama-3.3-70b-versatile"
+    groq_max_retries: int = 2
+    groq_retry_base_seconds: float = 0.5
+    groq_retry_max_seconds: float = 8.0
+    groq_breaker_failure_ratio: float = 0.5
+    groq_breaker_window: int = 20
+    groq_breaker_min_calls: int = 5
+    groq_breaker_cooldown_seconds: float = 30.0
+    # Cheaper model on the same key for simple turns and when the primary is
+    # saturated, e.g. "llama-3.1-8b-instant"
+    groq_fallback_model: str = ""
+    # Full backend pool; overrides the GROQ_* key/URL/model settings above, e.g.
+    # LLM_BACKENDS='[{"name": "a", "api_key": "...", "model": "llama-3.3-70b-versatile"}]'
+    llm_backends: list[LLMBackendConfig] = []
+    # Opening messages up to this length (with no tool round yet) count as simple
+    llm_simple_turn_max_chars: int = 80
 
     # E-REDES API
     eredes_api_base: str = "https://e-redes.opendatasoft.com/api/v2/catalog/datasets"
     eredes_dataset: str = "network-scheduling-work"
+    eredes_http2: bool = True
+    eredes_max_connections: int = 20
+    eredes_max_keepalive_connections: int = 10
+    eredes_keepalive_expiry_seconds: float = 30.0
+    eredes_timeout_seconds: float = 15.0
+    eredes_connect_timeout_seconds: float = 5.0
+    eredes_pool_timeout_seconds: float = 5.0
+    eredes_cache_ttl_seconds: float = 300.0
+    eredes_cache_error_ttl_seconds: float = 15.0
+    eredes_cache_max_entries: int = 1000
+    eredes_mirror_enabled: bool = False
+    eredes_mirror_file: str = ""
+    eredes_mirror_sync_interval_seconds: float = 15 * 60
+    eredes_mirror_max_age_seconds: float = 60 * 60
+    eredes_mirror_full_sync_seconds: float = 6 * 60 * 60
+    eredes_mirror_modified_field: str = "record_timestamp"
+
+    # Outage dataset (empty = built-in data)
+    outage_data_file: str = ""
+    outage_data_poll_seconds: float = 10.0
 
     # Chat
     max_messages: int = 50
+    prompt_token_budget: int = 6000
+    # Per-model overrides, e.g. MODEL_PROMPT_TOKEN_BUDGETS='{"llama-3.1-8b-instant": 4000}'
+    model_prompt_token_budgets: dict[str, int] = {}
+    # Send only the system-prompt sections relevant to each message
+    prompt_retrieval: bool = True
+    prompt_section_min_score: float = 0.7
     chat_timeout_seconds: int = 60
+    # Older turns are condensed into a summary in the background once the
+    # stored history reaches either threshold; the last turns stay verbatim.
+    summary_enabled: bool = True
+    summary_trigger_tokens: int = 2500
+    summary_trigger_messages: int = 30
+    summary_keep_turns: int = 2
+    summary_model: str = ""  # empty: the simple-turn (fallback) backend's model
+    summary_max_tokens: int = 300
+    summary_timeout_seconds: float = 20.0
+    tool_concurrency: int = 4
+    tool_timeout_seconds: float = 20.0
+    # First-turn answers replayed for identical opening questions (TTL 0 = off)
+    response_cache_ttl_seconds: float = 300.0
+    response_cache_max_entries: int = 500
+    response_cache_max_entry_bytes: int = 64 * 1024
+    # LLM-backed turns running at once; more wait in a queue of this size
+    admission_max_concurrent: int = 32
+    admission_max_queue: int = 64
 
-    # Rate limiting
-    rate_limit: str = "10/minute"
+    # Sessions
+    session_backend: str = "memory"  # "memory" (single worker) or "redis"
+    session_ttl_seconds: int = 2 * 60 * 60
+    session_max_count: int = 1000
+    # Cap on the in-memory histories' estimated size; LRU sessions go first
+    session_max_bytes: int = 256 * 1024 * 1024
+    session_cleanup_interval_seconds: int = 5 * 60
+    # Turns of one session run one at a time; extra ones queue up to this
+    # many deep (more get 429) and wait at most this long (then 409).
+    session_max_queued_turns: int = 1
+    session_lock_wait_seconds: float = 30.0
+    redis_url: str = "redis://localhost:6379/0"
+
+    # Rate limiting: token buckets per client IP and per session, with
+    # separate budgets for LLM turns and fast-path answers. "memory" counts
+    # per worker; "redis" (REDIS_URL) shares the limits between workers.
+    rate_limit_backend: str = "memory"
+    rate_limit: str = "30/minute"  # LLM turns per IP
+    rate_limit_session: str = "10/minute"  # LLM turns per session
+    rate_limit_fast_path: str = "120/minute"
+    rate_limit_fast_path_session: str = "60/minute"
+    # Comma-separated proxy addresses/CIDRs whose X-Forwarded-For is believed
+    trusted_proxies: str = ""
 
     # CORS
     allowed_origins: str = "*"
 
     # Logging
     log_level: str = "INFO"
+    # Share of INFO records kept per event, e.g. LOG_SAMPLE_RATES='{"request_started": 0.1}'
+    log_sample_rates: dict[str, float] = {}
+
+    # Tracing (empty = off); OTLP/JSON lines, one trace per line
+    trace_file: str = ""
+    trace_sample_ratio: float = 1.0
+    # > 0: also keep unsampled traces that took at least this long or failed
+    trace_tail_threshold_seconds: float = 0.0
+
+    def llm_backend_configs(self) -> list[LLMBackendConfig]:
+        """The configured backend pool; empty when no key is set."""
+        if self.llm_backends:
+            return self.llm_backends
+        if not self.groq_api_key:
+            return []
+        configs = [
+            LLMBackendConfig(
+                name="groq",
+                api_key=self.groq_api_key,
+                model=self.groq_model,
+                base_url=self.groq_base_url,
+            )
+        ]
+        if self.groq_fallback_model:
+            configs.append(
+                LLMBackendConfig(
+                    name="groq-fallback",
+                    api_key=self.groq_api_key,
+                    model=self.groq_fallback_model,
+                    base_url=self.groq_base_url,
+                    tier="fallback",
+                )
+            )
+        return configs
 
 
 settings = Settings()
@@ -1,10 +1,118 @@
 """Real E-REDES Open Data API client for scheduled interruptions."""
 
+import asyncio
+import logging
+import os
 import re
+import time
 
 import httpx
 
+import tracing
+from cache import TTLCache
 from config import settings
+from eredes_mirror import ScheduledWorkMirror
+
+logger = logging.getLogger(__name__)
+
+
+# ── Shared HTTP client ─────────────────────────────────────────────────────
+class _PoolStatsTransport(httpx.AsyncHTTPTransport):
+    """HTTP transport that records how long requests wait for a connection.
+
+    httpcore emits its first trace event once a request has been assigned a
+    connection, so the gap between entering the transport and that event is
+    the time spent queued on the pool.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.requests_total = 0
+        self.requests_waiting = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        acquired = False
+        self.requests_total += 1
+        self.requests_waiting += 1
+
+        def _mark_acquired() -> None:
+            nonlocal acquired
+            if acquired:
+                return
+            acquired = True
+            waited = time.perf_counter() - started
+            self.requests_waiting -= 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+        async def trace(event_name: str, info: dict) -> None:
+            _mark_acquired()
+
+        request.extensions = {**request.extensions, "trace": trace}
+        try:
+            return await super().handle_async_request(request)
+        finally:
+            _mark_acquired()
+
+    def stats(self) -> dict:
+        connections = self._pool.connections
+        idle = sum(1 for conn in connections if conn.is_idle())
+        return {
+            "connections_in_use": len(connections) - idle,
+            "connections_idle": idle,
+            "requests_waiting": self.requests_waiting,
+            "requests_total": self.requests_total,
+            "pool_wait_ms_avg": round(
+                self.wait_seconds_total / self.requests_total * 1000, 3
+            )
+            if self.requests_total
+            else 0.0,
+            "pool_wait_ms_max": round(self.wait_seconds_max * 1000, 3),
+        }
+
+
+_client: httpx.AsyncClient | None = None
+_transport: _PoolStatsTransport | None = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Return the process-wide E-REDES client, creating it on first use."""
+    global _client, _transport
+    if _client is None:
+        limits = httpx.Limits(
+            max_connections=settings.eredes_max_connections,
+            max_keepalive_connections=settings.eredes_max_keepalive_connections,
+            keepalive_expiry=settings.eredes_keepalive_expiry_seconds,
+        )
+        _transport = _PoolStatsTransport(http2=settings.eredes_http2, limits=limits)
+        _client = httpx.AsyncClient(
+            transport=_transport,
+            timeout=httpx.Timeout(
+                settings.eredes_timeout_seconds,
+                connect=settings.eredes_connect_timeout_seconds,
+                pool=settings.eredes_pool_timeout_seconds,
+            ),
+        )
+    return _client
+
+
+async def close_client() -> None:
+    """Close the shared client and release its pooled connections."""
+    global _client, _transport
+    if _client is not None:
+        await _client.aclose()
+    _client = None
+    _transport = None
+
+
+def pool_stats() -> dict:
+    """Connection pool statistics for the health endpoint."""
+    if _transport is None:
+        return {"open": False}
+    return {"open": True, **_transport.stats()}
 
 
 def _sanitize_search_term(term: str) -> str:
@@ -14,10 +122,108 @@ def _sanitize_search_term(term: str) -> str:
     return cleaned.strip()[:100]
 
 
+# ── Result cache ───────────────────────────────────────────────────────────
+_cache = TTLCache(
+    max_entries=settings.eredes_cache_max_entries,
+    ttl=settings.eredes_cache_ttl_seconds,
+)
+
+
+def _cache_key(
+    municipality: str | None, postal_code: str | None, limit: int
+) -> tuple[str, str, int]:
+    safe_municipality = _sanitize_search_term(municipality) if municipality else ""
+    safe_postal = (
+        _sanitize_search_term(postal_code.strip().replace("-", ""))
+        if postal_code
+        else ""
+    )
+    return safe_municipality.casefold(), safe_postal, limit
+
+
+def _cache_ttl(result: dict) -> float:
+    if "erro" in result:
+        return settings.eredes_cache_error_ttl_seconds
+    return settings.eredes_cache_ttl_seconds
+
+
+def cache_stats() -> dict:
+    """Hit/miss/coalesced counters of the scheduled-interruptions cache."""
+    return _cache.stats()
+
+
+# ── Local mirror ───────────────────────────────────────────────────────────
+mirror: ScheduledWorkMirror | None = (
+    ScheduledWorkMirror(
+        max_age_seconds=settings.eredes_mirror_max_age_seconds,
+        modified_field=settings.eredes_mirror_modified_field,
+        full_sync_seconds=settings.eredes_mirror_full_sync_seconds,
+    )
+    if settings.eredes_mirror_enabled
+    else None
+)
+
+
+def mirror_stats() -> dict:
+    if mirror is None:
+        return {"enabled": False}
+    return {"enabled": True, **mirror.stats()}
+
+
+async def run_mirror_sync() -> None:
+    """Background task keeping the local mirror in sync with the export API.
+
+    Seeds from ``EREDES_MIRROR_FILE`` if it exists and writes it back after
+    every successful sync, so a restart starts warm.
+    """
+    path = settings.eredes_mirror_file
+    if path and os.path.exists(path):
+        try:
+            await asyncio.to_thread(mirror.load_file, path)
+        except (OSError, ValueError, KeyError) as e:
+            logger.error("eredes_mirror_load_failed", extra={"error": str(e)})
+
+    export_url = f"{settings.eredes_api_base}/{settings.eredes_dataset}/exports/json"
+    while True:
+        try:
+            await mirror.sync(get_client(), export_url)
+            if path:
+                await asyncio.to_thread(mirror.save_file, path)
+        except (httpx.HTTPError, OSError, ValueError) as e:
+            logger.error("eredes_mirror_sync_failed", extra={"error": str(e)})
+        await asyncio.sleep(settings.eredes_mirror_sync_interval_seconds)
+
+
 async def query_scheduled_interruptions(
     municipality: str | None = None,
     postal_code: str | None = None,
     limit: int = 10,
+) -> dict:
+    """Answer from the local mirror when fresh, else the cached live API.
+
+    Identical live lookups (after sanitizing) within the TTL are served from
+    memory and concurrent misses share one upstream request. Error results
+    are cached for a shorter time. The returned dict is shared between
+    callers and must not be mutated.
+    """
+    if mirror is not None and mirror.is_fresh():
+        return mirror.query(
+            municipality=_sanitize_search_term(municipality) if municipality else None,
+            postal_code=postal_code,
+            limit=limit,
+        )
+    return await _cache.get_or_load(
+        _cache_key(municipality, postal_code, limit),
+        lambda: _fetch_scheduled_interruptions(municipality, postal_code, limit),
+        ttl_for=_cache_ttl,
+    )
+
+
+@tracing.traced("eredes.fetch", tracing.CLIENT)
+async def _fetch_scheduled_interruptions(
+    municipality: str | None = None,
+    postal_code: str | None = None,
+    limit: int = 10,
 ) -> dict:
     """Query the E-REDES API for scheduled network interruptions.
 
@@ -48,10 +254,9 @@ async def query_scheduled_interruptions(
         params["where"] = " AND ".join(where_clauses)
 
     try:
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            resp = await client.get(url, params=params)
-            resp.raise_for_status()
-            data = resp.json()
+        resp = await get_client().get(url, params=params)
+        resp.raise_for_status()
+        data = resp.json()
 
         records = data.get("records", [])
         results = []
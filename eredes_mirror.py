@@ -0,0 +1,278 @@
+"""Local mirror of the E-REDES scheduled-work dataset.
+
+A background task bulk-exports ``network-scheduling-work`` through the
+Open Data export endpoint (incrementally, by modification date) and keeps
+it in memory as a column-oriented table with indexes on municipality,
+postal-code prefix and start datetime. ``eredes_api`` answers
+``query_scheduled_interruptions`` from it while it is fresh and falls back
+to the live API otherwise.
+"""
+
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+import sys
+import time
+from collections import defaultdict
+from collections.abc import Callable
+from pathlib import Path
+
+import httpx
+
+from location_index import fold
+
+logger = logging.getLogger(__name__)
+
+# Dataset fields kept per record, and the keys tool results expose them
+# under (the same shape as the live API client returns).
+COLUMNS = {
+    "zipcode": "codigo_postal",
+    "municipality": "concelho",
+    "parish": "freguesia",
+    "startdatetime": "inicio",
+    "enddatetime": "fim",
+    "durationallocation": "duracao",
+}
+
+
+def _zip_digits(zipcode: str) -> str:
+    return "".join(c for c in zipcode if c.isdigit())
+
+
+class _Table:
+    """Immutable columnar snapshot with rows sorted by start datetime."""
+
+    def __init__(self, records: dict[str, dict], modified_max: str = ""):
+        rows = sorted(records.items(), key=lambda item: item[1]["startdatetime"])
+        self.ids = [record_id for record_id, _ in rows]
+        self.modified_max = modified_max
+        # Municipality, parish and duration values repeat heavily; interning
+        # makes each distinct string exist once.
+        self.columns = {
+            name: [sys.intern(record[name]) for _, record in rows] for name in COLUMNS
+        }
+        self.by_municipality: dict[str, list[int]] = defaultdict(list)
+        self.by_zip4: dict[str, list[int]] = defaultdict(list)
+        for row in range(len(rows)):
+            self.by_municipality[fold(self.columns["municipality"][row])].append(row)
+            self.by_zip4[_zip_digits(self.columns["zipcode"][row])[:4]].append(row)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def records(self) -> dict[str, dict]:
+        return {
+            record_id: {name: column[row] for name, column in self.columns.items()}
+            for row, record_id in enumerate(self.ids)
+        }
+
+
+def _normalize_record(record: dict, modified_field: str) -> tuple[str, dict]:
+    """Return ``(record_id, fields)`` for an exported record.
+
+    The v1 export nests fields under ``record`` next to a ``recordid``; the
+    v2 ``exports/json`` format returns flat field objects without one. Those
+    are keyed by a hash of their fields (bar the modification date), which
+    is stable across exports of the same record.
+    """
+    fields = record.get("record", {}).get("fields", record)
+    values = {name: str(fields.get(name) or "") for name in COLUMNS}
+    record_id = record.get("recordid") or fields.get("recordid")
+    if not record_id:
+        identity = {k: v for k, v in fields.items() if k != modified_field}
+        encoded = json.dumps(identity, sort_keys=True, default=str).encode()
+        record_id = hashlib.sha1(encoded).hexdigest()
+    return str(record_id), values
+
+
+class ScheduledWorkMirror:
+    def __init__(
+        self,
+        max_age_seconds: float,
+        modified_field: str = "record_timestamp",
+        full_sync_seconds: float = 6 * 60 * 60,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.max_age_seconds = max_age_seconds
+        self.modified_field = modified_field
+        self.full_sync_seconds = full_sync_seconds
+        self._clock = clock
+        self._table = _Table({})
+        self.synced_at: float | None = None
+        self.full_synced_at: float | None = None
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+    def is_fresh(self) -> bool:
+        """Whether queries can be answered locally; never with no records."""
+        return (
+            len(self._table) > 0
+            and self.synced_at is not None
+            and self._clock() - self.synced_at <= self.max_age_seconds
+        )
+
+    # ── Queries ────────────────────────────────────────────────────────────
+    @staticmethod
+    def _municipality_rows(table: _Table, municipality: str) -> list[int]:
+        key = fold(municipality)
+        rows = table.by_municipality.get(key)
+        if rows is not None:
+            return rows
+        # Like the API's full-text search, also match names containing the
+        # query as whole words ("Vila Nova" -> "Vila Nova de Gaia").
+        padded = f" {key} "
+        return sorted(
+            row
+            for name, name_rows in table.by_municipality.items()
+            if padded in f" {name} "
+            for row in name_rows
+        )
+
+    @staticmethod
+    def _zip_rows(table: _Table, digits: str) -> list[int]:
+        if len(digits) >= 4:
+            rows = table.by_zip4.get(digits[:4], [])
+        else:
+            rows = sorted(
+                row
+                for zip4, zip_rows in table.by_zip4.items()
+                if zip4.startswith(digits)
+                for row in zip_rows
+            )
+        zipcodes = table.columns["zipcode"]
+        return [row for row in rows if _zip_digits(zipcodes[row]).startswith(digits)]
+
+    def query(
+        self,
+        municipality: str | None = None,
+        postal_code: str | None = None,
+        limit: int = 10,
+        start_after: str | None = None,
+    ) -> dict:
+        """Same contract as the live ``query_scheduled_interruptions``.
+
+        Results are ordered by start datetime, most recent first.
+        """
+        table = self._table
+        rows: list[int] | range = range(len(table))
+        if municipality:
+            rows = self._municipality_rows(table, municipality)
+        digits = _zip_digits(postal_code or "")
+        if digits:
+            zip_rows = self._zip_rows(table, digits)
+            if municipality:
+                allowed = set(zip_rows)
+                rows = [row for row in rows if row in allowed]
+            else:
+                rows = zip_rows
+        if start_after:
+            # Rows are sorted by start, so the cut-off is a single bisect.
+            first = bisect.bisect_right(table.columns["startdatetime"], start_after)
+            rows = rows[bisect.bisect_left(rows, first) :]
+
+        results = [
+            {out: table.columns[name][row] for name, out in COLUMNS.items()}
+            for row in reversed(rows[-limit:] if limit > 0 else [])
+        ]
+        return {"total_encontrados": len(rows), "resultados": results}
+
+    # ── Sync ───────────────────────────────────────────────────────────────
+    def _merge(self, exported: list[dict], full: bool) -> _Table:
+        records = {} if full else self._table.records()
+        modified_max = "" if full else self._table.modified_max
+        for record in exported:
+            record_id, values = _normalize_record(record, self.modified_field)
+            records[record_id] = values
+            modified = str(record.get(self.modified_field) or "")
+            modified_max = max(modified_max, modified)
+        return _Table(records, modified_max)
+
+    def _apply_export(self, body: bytes, full: bool) -> tuple[_Table, int]:
+        """Parse an export body and merge it; both are blocking."""
+        exported = json.loads(body)
+        return self._merge(exported, full), len(exported)
+
+    async def sync(
+        self, client: httpx.AsyncClient, export_url: str, timeout: float = 120.0
+    ) -> int:
+        """Pull new/changed records and swap in a rebuilt table.
+
+        Incremental syncs ask only for records modified since the newest one
+        seen; a periodic full export also drops records deleted upstream.
+        Returns the number of records received.
+        """
+        now = self._clock()
+        full = (
+            not self._table.modified_max
+            or self.full_synced_at is None
+            or now - self.full_synced_at > self.full_sync_seconds
+        )
+        params = {}
+        if not full:
+            params["where"] = (
+                f"{self.modified_field} >= date'{self._table.modified_max}'"
+            )
+        resp = await client.get(export_url, params=params, timeout=timeout)
+        resp.raise_for_status()
+
+        # A full export is large: parse it off the event loop with the merge.
+        self._table, received = await asyncio.to_thread(
+            self._apply_export, resp.content, full
+        )
+        self.synced_at = now
+        if full:
+            self.full_synced_at = now
+        logger.info(
+            "eredes_mirror_synced",
+            extra={"received": received, "records": len(self._table), "full": full},
+        )
+        return received
+
+    # ── Persistence ────────────────────────────────────────────────────────
+    def load_file(self, path: str | Path) -> None:
+        """Seed the mirror from an export file or a previous ``save_file``.
+
+        Blocking; run it off the event loop. The seeded data counts as
+        synced at the file's modification time.
+        """
+        path = Path(path)
+        payload = json.loads(path.read_text(encoding="utf-8"))
+        if isinstance(payload, dict):
+            columns = payload["columns"]
+            records = {
+                record_id: {name: columns[name][row] for name in COLUMNS}
+                for row, record_id in enumerate(payload["ids"])
+            }
+            self._table = _Table(records, payload.get("modified_max", ""))
+        else:
+            self._table = self._merge(payload, full=True)
+        self.synced_at = self.full_synced_at = path.stat().st_mtime
+
+    def save_file(self, path: str | Path) -> None:
+        """Write the table as compact columnar JSON, atomically. Blocking."""
+        table = self._table
+        path = Path(path)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_text(
+            json.dumps(
+                {
+                    "ids": table.ids,
+                    "columns": table.columns,
+                    "modified_max": table.modified_max,
+                },
+                ensure_ascii=False,
+                separators=(",", ":"),
+            ),
+            encoding="utf-8",
+        )
+        tmp.replace(path)
+
+    def stats(self) -> dict:
+        return {
+            "records": len(self._table),
+            "synced_at": self.synced_at,
+            "fresh": self.is_fresh(),
+        }
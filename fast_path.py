@@ -0,0 +1,188 @@
+"""Deterministic answers for bare location and national-summary queries.
+
+Messages that are nothing but a postal code, a district or concelho name, or
+a request for the national summary are answered by running the tool locally
+and filling a Portuguese template, without calling the LLM. The exchange is
+recorded as a regular tool-call turn so follow-up LLM turns see the data.
+Anything else returns ``None`` and goes to Groq.
+"""
+
+import json
+import re
+import uuid
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+
+from location_index import POSTAL_CODE_RE, fold
+from openai_tools import handle_tool_call
+from outage_data import current_snapshot, get_outage_by_location
+
+NATIONAL_SUMMARY_RE = re.compile(
+    r"^(?:qual (?:e )?o )?(?:resumo|ponto de situacao|situacao)(?: nacional| geral)?$"
+)
+
+CONTACTS_FOOTER = (
+    "Para comunicar avarias, contacte a Linha de Avarias: **800 506 506** "
+    "(gratuita, 24h). Em caso de perigo imediato, ligue **112**."
+)
+
+MONTHS = (
+    "janeiro fevereiro março abril maio junho julho agosto setembro outubro "
+    "novembro dezembro"
+).split()
+
+
+@dataclass
+class FastAnswer:
+    reply: str
+    messages: list[dict]
+
+
+class _Stats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def as_dict(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+_stats = _Stats()
+
+
+def stats() -> dict:
+    """Fast-path hit/miss counters."""
+    return _stats.as_dict()
+
+
+def _number(n: int) -> str:
+    return f"{n:,}".replace(",", " ")
+
+
+def _date(iso: str) -> str:
+    year, month, day = (int(part) for part in iso.split("-"))
+    return f"{day} de {MONTHS[month - 1]} de {year}"
+
+
+def render_location(location: str, data: dict) -> str:
+    if "info" in data:
+        return data["info"]
+
+    header = f"**Distrito de {data['distrito']}** — {data['estado']}"
+    if POSTAL_CODE_RE.match(location):
+        header = (
+            f"O código postal {location} pertence ao distrito de "
+            f"{data['distrito']}.\n\n{header}"
+        )
+    return (
+        f"{header}\n\n"
+        f"- Clientes afetados: {_number(data['clientes_afetados'])}\n"
+        f"- Ainda sem eletricidade: {_number(data['clientes_sem_luz'])} "
+        f"({data['percentagem_reposta']}% já reposto)\n"
+        f"- Equipas no terreno: {data['equipas_no_terreno']}\n"
+        f"- Geradores instalados: {data['geradores_instalados']}\n"
+        f"- Previsão de reposição: {_date(data['data_estimada_reposicao'])}\n\n"
+        f"Concelhos mais afetados: "
+        f"{', '.join(data['concelhos_mais_afetados'])}.\n\n"
+        f"{CONTACTS_FOOTER}"
+    )
+
+
+def render_summary(data: dict) -> str:
+    return (
+        f"**Resumo nacional — {data['evento']}**\n\n"
+        f"- Clientes afetados: {_number(data['total_clientes_afetados'])}\n"
+        f"- Ainda sem eletricidade: {_number(data['total_clientes_sem_luz'])} "
+        f"({data['percentagem_global_reposta']}% já reposto)\n"
+        f"- Equipas no terreno: {data['total_equipas_no_terreno']}\n"
+        f"- Geradores instalados: {data['total_geradores_instalados']}\n"
+        f"- Postos de transformação afetados: "
+        f"{_number(data['total_postos_transformacao_afetados'])}\n\n"
+        f"Distritos afetados: {', '.join(data['distritos_afetados'])}.\n"
+        f"Estado: {data['estado_geral']}.\n\n"
+        f"{CONTACTS_FOOTER}"
+    )
+
+
+def _route(message: str) -> tuple[str, dict] | None:
+    """Pick the tool call for an unambiguous message, or ``None``."""
+    text = message.strip().rstrip("?!. ")
+    if POSTAL_CODE_RE.match(text):
+        if len(text) == 7:
+            text = f"{text[:4]}-{text[4:]}"
+        return "consultar_estado_tempestade_kristin", {"localizacao": text}
+
+    normalized = fold(text)
+    if NATIONAL_SUMMARY_RE.match(normalized):
+        return "resumo_nacional_tempestade", {}
+    # Only exact (accent/case-insensitive) names: a fuzzy hit on a lone
+    # word is too ambiguous to answer without the LLM.
+    if current_snapshot().location_index.is_ambiguous(text):
+        return None  # e.g. "Figueira da Foz", listed under two districts
+    if normalized and get_outage_by_location(text, fuzzy=False) is not None:
+        return "consultar_estado_tempestade_kristin", {"localizacao": text}
+    return None
+
+
+def _asked_question(history: list[dict]) -> bool:
+    """Whether the last assistant reply in ``history`` asked the user something."""
+    for message in reversed(history):
+        if message["role"] == "assistant" and message.get("content"):
+            return "?" in message["content"]
+    return False
+
+
+async def try_answer(
+    message: str,
+    load_history: Callable[[], Awaitable[list[dict]]] | None = None,
+) -> FastAnswer | None:
+    """Answer ``message`` locally if it is a bare location or summary query.
+
+    ``load_history`` returns the session's stored messages; it is only
+    awaited for messages the fast path could answer. A bare name sent in
+    reply to a question from the assistant is left to the LLM, which can
+    read it in context.
+    """
+    routed = _route(message)
+    if routed is None or (
+        load_history is not None and _asked_question(await load_history())
+    ):
+        _stats.misses += 1
+        return None
+    _stats.hits += 1
+
+    name, arguments = routed
+    content = await handle_tool_call(name, arguments)
+    data = json.loads(content)
+    if name == "resumo_nacional_tempestade":
+        reply = render_summary(data)
+    else:
+        reply = render_location(arguments["localizacao"], data)
+
+    call_id = f"fast_{uuid.uuid4().hex[:12]}"
+    return FastAnswer(
+        reply=reply,
+        messages=[
+            {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [
+                    {
+                        "id": call_id,
+                        "type": "function",
+                        "function": {
+                            "name": name,
+                            "arguments": json.dumps(arguments, ensure_ascii=False),
+                        },
+                    }
+                ],
+            },
+            {"role": "tool", "tool_call_id": call_id, "content": content},
+            {"role": "assistant", "content": reply},
+        ],
+    )
@@ -0,0 +1,305 @@
+"""Routing of chat completions across a pool of OpenAI-compatible backends.
+
+Each backend is one (base URL, API key, model) triple with its own circuit
+breaker, a latency EWMA and the rate-limit headroom last reported in its
+``x-ratelimit-*`` response headers. ``LLMRouter.choose`` prefers the
+primary tier (or the cheaper fallback tier for simple turns), skips
+backends that are broken or out of quota, and picks the best-scoring one
+of the rest.
+"""
+
+import re
+import time
+from collections.abc import Callable, Iterable, Mapping
+
+from openai import (
+    APIConnectionError,
+    APIStatusError,
+    AsyncOpenAI,
+    DefaultAsyncHttpxClient,
+    InternalServerError,
+    RateLimitError,
+)
+
+import metrics
+from config import LLMBackendConfig
+from resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    UpstreamRateLimitError,
+    UpstreamUnavailableError,
+    retry_after_seconds,
+)
+
+PRIMARY = "primary"
+FALLBACK = "fallback"
+
+LATENCY_EWMA_ALPHA = 0.3
+# Below this share of quota left, a backend counts as saturated.
+MIN_HEADROOM = 0.05
+
+_DURATION_RE = re.compile(r"([\d.]+)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_reset(value: str | None) -> float | None:
+    """Seconds from a Groq/OpenAI reset header such as ``"2m59.56s"``."""
+    if not value:
+        return None
+    parts = _DURATION_RE.findall(value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(n) * _DURATION_UNITS[unit] for n, unit in parts)
+
+
+class Backend:
+    """One OpenAI-compatible endpoint + model, with its health and quota."""
+
+    def __init__(
+        self,
+        name: str,
+        model: str,
+        client: AsyncOpenAI,
+        tier: str = PRIMARY,
+        breaker: CircuitBreaker | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.model = model
+        self.client = client
+        self.tier = tier
+        self.breaker = breaker or CircuitBreaker(name)
+        self._clock = clock
+        self.latency_ewma: float | None = None
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+        # Quota as last reported: resource -> (remaining, limit, resets_at).
+        self._quota: dict[str, tuple[int, int, float]] = {}
+        self.saturated_until = 0.0
+
+    @classmethod
+    def connect(
+        cls, config: LLMBackendConfig, breaker: CircuitBreaker | None = None
+    ) -> "Backend":
+        """Create a backend with its own HTTP client reporting quota headers."""
+        backend = cls(config.name, config.model, None, config.tier, breaker)
+
+        async def on_response(response) -> None:
+            backend.observe_headers(response.headers)
+
+        # Retries are the caller's (app._call_groq_with_retry); the SDK's own
+        # would multiply them and ignore the breaker and the request deadline.
+        backend.client = AsyncOpenAI(
+            api_key=config.api_key,
+            base_url=config.base_url,
+            max_retries=0,
+            http_client=DefaultAsyncHttpxClient(
+                event_hooks={"response": [on_response]}
+            ),
+        )
+        return backend
+
+    # ── Quota ──────────────────────────────────────────────────────────────
+    def observe_headers(self, headers: Mapping[str, str]) -> None:
+        now = self._clock()
+        for resource in ("requests", "tokens"):
+            remaining = headers.get(f"x-ratelimit-remaining-{resource}")
+            limit = headers.get(f"x-ratelimit-limit-{resource}")
+            if remaining is None or limit is None:
+                continue
+            try:
+                remaining, limit = int(remaining), int(limit)
+            except ValueError:
+                continue
+            reset = parse_reset(headers.get(f"x-ratelimit-reset-{resource}"))
+            self._quota[resource] = (remaining, limit, now + (reset or 60.0))
+
+    def headroom(self) -> float:
+        """Smallest remaining share of any quota; 1.0 when unknown or reset."""
+        now = self._clock()
+        shares = [
+            remaining / limit
+            for remaining, limit, resets_at in self._quota.values()
+            if limit > 0 and now < resets_at
+        ]
+        return min(shares, default=1.0)
+
+    def available_in(self) -> float:
+        """Seconds until this backend has quota again (0 if it has now)."""
+        now = self._clock()
+        waits = [self.saturated_until - now]
+        for remaining, limit, resets_at in self._quota.values():
+            if limit > 0 and remaining / limit < MIN_HEADROOM:
+                waits.append(resets_at - now)
+        return max(0.0, *waits)
+
+    def available(self) -> bool:
+        return self.breaker.available() and self.available_in() == 0
+
+    def score(self) -> float:
+        """Lower is better: expected latency, inflated by load and low quota."""
+        latency = self.latency_ewma or 0.0
+        return latency * (1 + self.in_flight) / max(self.headroom(), MIN_HEADROOM)
+
+    # ── Calls ──────────────────────────────────────────────────────────────
+    async def create(self, model: str | None = None, **kwargs):
+        """``chat.completions.create`` with this backend's (or ``model``'s) model.
+
+        Raises :class:`UpstreamRateLimitError` on 429 and
+        :class:`UpstreamUnavailableError` on 5xx/connection errors; other
+        API errors propagate unchanged.
+        """
+        self.breaker.before_call()
+        self.requests += 1
+        self.in_flight += 1
+        started = self._clock()
+        outcome = "error"
+        try:
+            response = await self.client.chat.completions.create(
+                model=model or self.model, **kwargs
+            )
+            outcome = "ok"
+        except RateLimitError as e:
+            # The upstream answered; quota exhaustion says nothing about health.
+            self.breaker.record_success()
+            self.rate_limited += 1
+            outcome = "rate_limited"
+            self.observe_headers(e.response.headers)
+            retry_after = retry_after_seconds(e.response.headers)
+            if retry_after is not None:
+                self.saturated_until = self._clock() + retry_after
+            raise UpstreamRateLimitError(
+                f"{self.name}: {e}", retry_after=retry_after
+            ) from e
+        except (InternalServerError, APIConnectionError) as e:
+            self.breaker.record_failure()
+            self.errors += 1
+            outcome = "unavailable"
+            raise UpstreamUnavailableError(f"{self.name}: {e}") from e
+        except APIStatusError:
+            self.breaker.record_success()
+            raise
+        except BaseException:
+            self.breaker.release()
+            outcome = "cancelled"
+            raise
+        finally:
+            self.in_flight -= 1
+            # Time to response headers; for streams that is time to first byte.
+            latency = self._clock() - started
+            metrics.LLM_SECONDS.labels(self.name, outcome).observe(latency)
+        self.breaker.record_success()
+        self.latency_ewma = (
+            latency
+            if self.latency_ewma is None
+            else LATENCY_EWMA_ALPHA * latency
+            + (1 - LATENCY_EWMA_ALPHA) * self.latency_ewma
+        )
+        return response
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "model": self.model,
+            "tier": self.tier,
+            "available": self.available(),
+            "latency_ms_ewma": round(self.latency_ewma * 1000, 1)
+            if self.latency_ewma is not None
+            else None,
+            "headroom": round(self.headroom(), 4),
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "errors": self.errors,
+            "rate_limited": self.rate_limited,
+            "circuit": self.breaker.stats(),
+        }
+
+
+class LLMRouter:
+    def __init__(self, backends: Iterable[Backend]):
+        self.backends = list(backends)
+        if not self.backends:
+            raise ValueError("LLMRouter needs at least one backend")
+        # Turns served away from their preferred tier because it had nothing
+        # usable, or by another backend after one failed.
+        self.fallbacks = 0
+
+    def _tiers(self, simple: bool) -> tuple[str, str]:
+        return (FALLBACK, PRIMARY) if simple else (PRIMARY, FALLBACK)
+
+    def candidates(
+        self, simple: bool = False, exclude: Iterable[Backend] = ()
+    ) -> list[Backend]:
+        """Usable backends from the most preferred tier that has any."""
+        excluded = set(map(id, exclude))
+        for tier in self._tiers(simple):
+            usable = [
+                b
+                for b in self.backends
+                if b.tier == tier and id(b) not in excluded and b.available()
+            ]
+            if usable:
+                return usable
+        return []
+
+    def preferred(self, simple: bool = False) -> Backend | None:
+        """The backend a turn would go to now, if any; nothing is counted."""
+        usable = self.candidates(simple)
+        return min(usable, key=Backend.score) if usable else None
+
+    def choose(self, simple: bool = False, exclude: Iterable[Backend] = ()) -> Backend:
+        """Best backend for a turn, or a typed error if none can take it.
+
+        Backends in ``exclude`` (already tried for this turn) are used only
+        when nothing else is usable. Raises :class:`CircuitOpenError` when
+        every breaker is open, else :class:`UpstreamRateLimitError` with the
+        soonest quota reset.
+        """
+        exclude = list(exclude)
+        usable = self.candidates(simple, exclude) or self.candidates(simple)
+        if usable:
+            backend = min(usable, key=Backend.score)
+            preferred = self._tiers(simple)[0]
+            if exclude or (
+                backend.tier != preferred
+                and any(b.tier == preferred for b in self.backends)
+            ):
+                self.fallbacks += 1
+            return backend
+
+        if not any(b.breaker.available() for b in self.backends):
+            retry_after = min(b.breaker.retry_after() for b in self.backends)
+            raise CircuitOpenError(
+                "all LLM backends have an open circuit",
+                retry_after=retry_after or self.backends[0].breaker.cooldown_seconds,
+            )
+        retry_after = min(
+            b.available_in() for b in self.backends if b.breaker.available()
+        )
+        raise UpstreamRateLimitError(
+            "all LLM backends are rate limited", retry_after=retry_after or None
+        )
+
+    async def close(self) -> None:
+        for backend in self.backends:
+            await backend.client.close()
+
+    def stats(self) -> dict:
+        return {
+            "fallbacks": self.fallbacks,
+            "backends": [b.stats() for b in self.backends],
+        }
+
+
+def create_router(
+    configs: list[LLMBackendConfig], breaker_factory: Callable[[str], CircuitBreaker]
+) -> LLMRouter:
+    """Build a router with one connected backend per config entry."""
+    return LLMRouter(
+        Backend.connect(config, breaker_factory(config.name)) for config in configs
+    )
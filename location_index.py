@@ -0,0 +1,195 @@
+"""Precomputed location index for outage lookups.
+
+Built once from the outage dataset (and rebuilt whenever it changes), the
+index answers three kinds of query without scanning the data:
+
+* exact names, accent/case/hyphen-insensitive ("santarem", "Montemor o Velho");
+* misspelt names, via a trigram index ranked by Dice similarity;
+* postal codes, CP4 ("2400"), CP7 ("2400-001") or partial prefixes ("240"),
+  through a table of every digit prefix that maps to a single district.
+
+Only input that is a postal code as a whole is looked up as one: digits in
+free text ("sem luz há 24 horas") never resolve to a district.
+"""
+
+import math
+import re
+import unicodedata
+from collections import defaultdict
+from collections.abc import Iterable
+
+FUZZY_THRESHOLD = 0.6
+MIN_POSTAL_PREFIX = 2
+
+_NON_WORD_RE = re.compile(r"[^\w\s]")
+# CP4 or CP7, with or without the hyphen.
+POSTAL_CODE_RE = re.compile(r"^\d{4}(?:-?\d{3})?$")
+# A CP4 prefix of MIN_POSTAL_PREFIX or more digits.
+POSTAL_PREFIX_RE = re.compile(r"^\d{2,3}$")
+
+
+def is_postal_code(text: str) -> bool:
+    """Whether ``text`` is, as a whole, a CP4, a CP7 or a CP4 prefix."""
+    text = text.strip()
+    return bool(POSTAL_CODE_RE.match(text) or POSTAL_PREFIX_RE.match(text))
+
+
+def fold(text: str) -> str:
+    """Normalize text for matching: no accents, case, punctuation or hyphens."""
+    folded = unicodedata.normalize("NFKD", text)
+    folded = "".join(c for c in folded if not unicodedata.combining(c))
+    folded = _NON_WORD_RE.sub(" ", folded.lower().replace("-", " ").replace("_", " "))
+    return " ".join(folded.split())
+
+
+def _trigrams(key: str) -> set[str]:
+    padded = f"  {key} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class LocationIndex:
+    """Name and postal-code lookups resolving to district keys."""
+
+    def __init__(
+        self,
+        names: dict[str, str],
+        postal_map: dict[str, str],
+        fuzzy_threshold: float = FUZZY_THRESHOLD,
+        ambiguous: Iterable[str] = (),
+    ):
+        self.fuzzy_threshold = fuzzy_threshold
+        # Names shared by places in different districts; lookups still
+        # return the first registration, but callers can ask.
+        self._ambiguous = frozenset(fold(name) for name in ambiguous)
+        # Raw lowercase names are indexed too, so the common exact hit
+        # skips Unicode normalization entirely.
+        self._exact: dict[str, str] = {}
+        self._trigram_postings: dict[str, list[str]] = defaultdict(list)
+        self._trigrams: dict[str, frozenset[str]] = {}
+        self._order: dict[str, int] = {}
+        for name, district in names.items():
+            key = fold(name)
+            if key in self._trigrams:
+                continue  # first registration wins, as in the dataset order
+            self._exact.setdefault(name.strip().lower(), district)
+            self._exact[key] = district
+            grams = frozenset(_trigrams(key))
+            self._order[key] = len(self._order)
+            self._trigrams[key] = grams
+            for gram in grams:
+                self._trigram_postings[gram].append(key)
+
+        # Every prefix of every known CP4, resolved to its district when all
+        # CP4s sharing it agree, or None when the prefix is ambiguous.
+        self._postal: dict[str, str | None] = {}
+        for code, district in postal_map.items():
+            for length in range(MIN_POSTAL_PREFIX, len(code) + 1):
+                prefix = code[:length]
+                if self._postal.get(prefix, district) != district:
+                    self._postal[prefix] = None
+                else:
+                    self._postal[prefix] = district
+
+    @classmethod
+    def from_outage_data(
+        cls,
+        outage_data: dict[str, dict],
+        postal_map: dict[str, str],
+        aliases: dict[str, str] | None = None,
+    ) -> "LocationIndex":
+        """Index district names, their concelhos and optional extra aliases.
+
+        ``aliases`` maps further place names (e.g. a parish gazetteer) to
+        district keys. Names listed under more than one district are
+        recorded as ambiguous.
+        """
+        names: dict[str, str] = {}
+        districts_by_name: dict[str, set[str]] = defaultdict(set)
+
+        def add(name: str, key: str) -> None:
+            names.setdefault(name, key)
+            districts_by_name[fold(name)].add(key)
+
+        for key, data in outage_data.items():
+            add(key, key)
+            add(data["distrito"], key)
+        for key, data in outage_data.items():
+            for concelho in data["concelhos_mais_afetados"]:
+                add(concelho, key)
+        for name, key in (aliases or {}).items():
+            add(name, key)
+        ambiguous = [name for name, keys in districts_by_name.items() if len(keys) > 1]
+        return cls(names, postal_map, ambiguous=ambiguous)
+
+    def __len__(self) -> int:
+        return len(self._trigrams)
+
+    def lookup_postal(self, postal_code: str) -> str | None:
+        """District for a CP4/CP7 code or a partial prefix of one.
+
+        A full code must be a known CP4: an unknown one may share its first
+        digits with a neighbouring district's codes, so only a prefix typed
+        as such is widened to its shorter prefixes.
+        """
+        text = postal_code.strip()
+        if POSTAL_CODE_RE.match(text):
+            return self._postal.get(text[:4])
+        if not POSTAL_PREFIX_RE.match(text):
+            return None
+        digits = text
+        district = self._postal.get(digits)
+        if district is not None:
+            return district
+        for length in range(len(digits) - 1, MIN_POSTAL_PREFIX - 1, -1):
+            district = self._postal.get(digits[:length])
+            if district is not None:
+                return district
+        return None
+
+    def is_ambiguous(self, name: str) -> bool:
+        """Whether ``name`` is a place name found in more than one district."""
+        return fold(name) in self._ambiguous
+
+    def lookup_name(self, name: str, fuzzy: bool = True) -> str | None:
+        """District for a district/concelho name, tolerating typos if ``fuzzy``."""
+        district = self._exact.get(name.strip().lower())
+        if district is not None:
+            return district
+        key = fold(name)
+        district = self._exact.get(key)
+        if district is not None or not fuzzy or not key:
+            return district
+        match = self._best_fuzzy_match(key)
+        return self._exact[match] if match else None
+
+    def _best_fuzzy_match(self, key: str) -> str | None:
+        grams = _trigrams(key)
+        # Prefix filtering: Dice >= t needs at least t*|q|/(2-t) shared
+        # trigrams, so any match must contain one of the |q|-min+1 rarest
+        # query trigrams. Only those postings are scanned.
+        t = self.fuzzy_threshold
+        min_shared = max(1, math.ceil(t * len(grams) / (2 - t)))
+        rarest = sorted(grams, key=lambda g: len(self._trigram_postings.get(g, ())))
+        candidates = set()
+        for gram in rarest[: len(grams) - min_shared + 1]:
+            candidates.update(self._trigram_postings.get(gram, ()))
+
+        # Dice >= t also bounds the candidate's size relative to the query.
+        min_len, max_len = t * len(grams) / (2 - t), (2 - t) * len(grams) / t
+        best, best_rank = None, (t, float("-inf"))
+        for candidate in candidates:
+            candidate_grams = self._trigrams[candidate]
+            if not min_len <= len(candidate_grams) <= max_len:
+                continue
+            score = 2 * len(grams & candidate_grams) / (len(grams) + len(candidate_grams))
+            # Ties go to the name registered first, independent of set order.
+            rank = (score, -self._order[candidate])
+            if rank >= best_rank:
+                best, best_rank = candidate, rank
+        return best
+
+    def lookup(self, location: str, fuzzy: bool = True) -> str | None:
+        """District key for a postal code or place name."""
+        if is_postal_code(location):
+            return self.lookup_postal(location)
+        return self.lookup_name(location, fuzzy=fuzzy)
@@ -1,24 +1,146 @@
-"""Structured JSON logging configuration."""
+"""Structured JSON logging configuration.
 
+Records are put on a queue by the logging call and serialized and written
+by a ``QueueListener`` thread, so the event loop never blocks on stderr.
+Every record carries the id of the request being handled (from
+``request_id_var``). High-volume INFO events can be sampled per event name.
+"""
+
+import atexit
+import copy
+import json
 import logging
+import logging.handlers
+import queue
+import random
+import sys
 import uuid
+from collections.abc import Callable, Mapping
+from contextvars import ContextVar
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speed-up
+    orjson = None
+
+# Id of the HTTP request being handled, set by the request-id middleware.
+request_id_var: ContextVar[str | None] = ContextVar("request_id", default=None)
+
+# Attributes every LogRecord has; anything else came in through ``extra``.
+_RESERVED = frozenset(
+    vars(logging.LogRecord("", 0, "", 0, "", None, None)).keys()
+    | {"message", "asctime", "taskName"}
+)
 
-from pythonjsonlogger.json import JsonFormatter
+_listener: logging.handlers.QueueListener | None = None
 
 
 def generate_request_id() -> str:
     return uuid.uuid4().hex[:12]
 
 
-def setup_logging(level: str = "INFO") -> None:
-    handler = logging.StreamHandler()
-    formatter = JsonFormatter(
-        fmt="%(asctime)s %(levelname)s %(name)s %(message)s",
-        rename_fields={"asctime": "timestamp", "levelname": "level"},
-    )
-    handler.setFormatter(formatter)
+def _dumps(payload: dict) -> str:
+    if orjson is not None:
+        return orjson.dumps(payload, default=str).decode()
+    return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: timestamp, level, name, message, extras."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "timestamp": self.formatTime(record),
+            "level": record.levelname,
+            "name": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and value is not None:
+                payload[key] = value
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            payload["stack_info"] = self.formatStack(record.stack_info)
+        return _dumps(payload)
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamps records with the current request id (read on the caller's task)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "request_id", None) is None:
+            record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps only a share of the INFO-or-lower records of the named events."""
+
+    def __init__(
+        self,
+        rates: Mapping[str, float],
+        rng: Callable[[], float] = random.random,
+    ):
+        super().__init__()
+        self.rates = dict(rates)
+        self._rng = rng
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO:
+            return True
+        rate = self.rates.get(record.msg)
+        return rate is None or self._rng() < rate
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Queues records as they are; formatting happens on the listener thread.
+
+    The stdlib handler formats in ``prepare`` (for process queues); here
+    the record only needs its message resolved, since ``args`` may be
+    mutated by the caller after logging returns.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def setup_logging(
+    level: str = "INFO",
+    sample_rates: Mapping[str, float] | None = None,
+    stream=None,
+) -> None:
+    """Route the root logger through a queue to a JSON stream handler."""
+    global _listener
+    shutdown_logging()
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter())
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    handler = _QueueHandler(log_queue)
+    handler.addFilter(RequestIdFilter())
+    if sample_rates:
+        handler.addFilter(SamplingFilter(sample_rates))
 
     root = logging.getLogger()
     root.handlers.clear()
     root.addHandler(handler)
     root.setLevel(getattr(logging, level.upper(), logging.INFO))
+
+    _listener = logging.handlers.QueueListener(log_queue, output)
+    _listener.start()
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
@@ -0,0 +1,276 @@
+"""In-process metrics in the Prometheus text exposition format.
+
+Counters, gauges and fixed-bucket histograms with labels. Each labelled
+series is created once and cached, so recording a sample is a dict lookup
+plus an integer increment. ``render()`` serializes everything for
+``GET /metrics``.
+"""
+
+import bisect
+import math
+from collections.abc import Sequence
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+ITERATION_BUCKETS = (0, 1, 2, 3, 4, 5, 6, 8, 10)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _label_str(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._series: dict[tuple[str, ...], object] = {}
+
+    def labels(self, *values: str):
+        """The series for ``values`` (created on first use, then cached)."""
+        series = self._series.get(values)
+        if series is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            series = self._series[values] = self._new_series()
+        return series
+
+    def _new_series(self):
+        raise NotImplementedError
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_series(self) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1) -> None:
+        self.labels().inc(amount)
+
+    def _samples(self) -> list[str]:
+        return [
+            f"{self.name}{_label_str(self.labelnames, values)} "
+            f"{_format_value(series.value)}"
+            for values, series in self._series.items()
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+
+class _HistogramSeries:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_series(self) -> _HistogramSeries:
+        return _HistogramSeries(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def _samples(self) -> list[str]:
+        lines = []
+        for values, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), series.counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_label_str(self.labelnames, values, le)} "
+                    f"{cumulative}"
+                )
+            labels = _label_str(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series.sum)}")
+            lines.append(f"{self.name}_count{labels} {series.count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"metric {metric.name!r} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(m.render() for m in self._metrics.values()) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, help, labelnames))
+
+
+def gauge(name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, help, labelnames))
+
+
+def histogram(
+    name: str,
+    help: str,
+    labelnames: Sequence[str] = (),
+    buckets: Sequence[float] = LATENCY_BUCKETS,
+) -> Histogram:
+    return REGISTRY.register(Histogram(name, help, labelnames, buckets))
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+# ── Application metrics ────────────────────────────────────────────────────
+CHAT_SECONDS = histogram(
+    "chat_request_duration_seconds",
+    "End-to-end chat latency, including streaming, by endpoint and outcome.",
+    ("endpoint", "outcome"),
+)
+CHAT_LLM_CALLS = histogram(
+    "chat_tool_loop_iterations",
+    "LLM calls (tool-loop iterations) per answered chat request.",
+    buckets=ITERATION_BUCKETS,
+)
+CHAT_PROMPT_TOKENS = histogram(
+    "chat_prompt_tokens",
+    "Prompt tokens reported by the LLM per answered chat request.",
+    buckets=TOKEN_BUCKETS,
+)
+CHAT_COMPLETION_TOKENS = histogram(
+    "chat_completion_tokens",
+    "Completion tokens reported by the LLM per answered chat request.",
+    buckets=TOKEN_BUCKETS,
+)
+LLM_SECONDS = histogram(
+    "llm_call_duration_seconds",
+    "Time to response headers of each LLM call, by backend and outcome.",
+    ("backend", "outcome"),
+)
+LLM_PROMPT_TOKENS = counter(
+    "llm_prompt_tokens_total", "Prompt tokens reported in response.usage."
+)
+LLM_COMPLETION_TOKENS = counter(
+    "llm_completion_tokens_total", "Completion tokens reported in response.usage."
+)
+TOOL_SECONDS = histogram(
+    "tool_call_duration_seconds",
+    "Tool execution time by tool name and outcome.",
+    ("tool", "outcome"),
+)
+RATE_LIMITED = counter(
+    "rate_limit_rejections_total",
+    "Requests answered 429: 'client' by our limiter, 'upstream' by LLM quota.",
+    ("source",),
+)
+SESSIONS_ACTIVE = gauge("sessions_active", "Live chat sessions.")
+SESSION_STORE_BYTES = gauge(
+    "session_store_memory_bytes",
+    "Running estimate of memory held by stored histories (in-memory backend).",
+)
+ADMISSION_IN_FLIGHT = gauge(
+    "chat_admission_in_flight", "Chat turns holding an admission slot."
+)
+ADMISSION_QUEUE = gauge(
+    "chat_admission_queue_depth",
+    "Chat turns waiting for an admission slot, by priority lane.",
+    ("priority",),
+)
+ADMISSION_WAIT = histogram(
+    "chat_admission_wait_seconds",
+    "Time admitted chat turns spent queued, by priority lane.",
+    ("priority",),
+)
+ADMISSION_SHED = counter(
+    "chat_admission_shed_total",
+    "Chat turns refused with 503: queue_full, deadline, timeout or displaced.",
+    ("priority", "reason"),
+)
+RESPONSE_CACHE_LOOKUPS = counter(
+    "response_cache_lookups_total",
+    "First-turn response cache lookups: hit, coalesced (waited for an "
+    "identical question in flight) or miss.",
+    ("result",),
+)
+PROMPT_SECTIONS = counter(
+    "chat_prompt_sections_total",
+    "System-prompt sections sent with a turn (none: the core prompt alone).",
+    ("section",),
+)
+SUMMARIES = counter(
+    "chat_summaries_total",
+    "Background conversation summaries: ok, error (history left to plain "
+    "trimming), conflict (history changed meanwhile) or deferred (overload).",
+    ("outcome",),
+)
@@ -1,9 +1,10 @@
 """OpenAI tool definitions and handler for the E-REDES chatbot."""
 
 import json
+from dataclasses import dataclass
 
 from eredes_api import query_scheduled_interruptions
-from outage_data import get_national_summary, get_outage_by_location
+from outage_data import OutageSnapshot, current_snapshot, on_snapshot_change
 
 # ── Tool definitions for the OpenAI API ─────────────────────────────────────
 
@@ -76,18 +77,67 @@ TOOLS = [
 ]
 
 
+# ── Pre-serialized storm payloads ──────────────────────────────────────────
+@dataclass(frozen=True)
+class _StormPayloads:
+    """Ready-to-send tool results for one outage snapshot."""
+
+    version: str
+    districts: dict[str, str]
+    summary: str
+
+
+def _build_payloads(snapshot: OutageSnapshot) -> _StormPayloads:
+    version = snapshot.version
+    return _StormPayloads(
+        version=version,
+        districts={
+            key: json.dumps({**data, "versao_dados": version}, ensure_ascii=False)
+            for key, data in snapshot.districts.items()
+        },
+        summary=json.dumps(
+            {**snapshot.national_summary, "versao_dados": version},
+            ensure_ascii=False,
+        ),
+    )
+
+
+_payloads = _build_payloads(current_snapshot())
+
+
+def _rebuild_payloads(snapshot: OutageSnapshot) -> None:
+    global _payloads
+    _payloads = _build_payloads(snapshot)
+
+
+on_snapshot_change(_rebuild_payloads)
+
+
+def _payloads_for(snapshot: OutageSnapshot) -> _StormPayloads:
+    # The listener rebuilds on every publish; the version check only matters
+    # if a snapshot was swapped in without one.
+    if _payloads.version != snapshot.version:
+        _rebuild_payloads(snapshot)
+    return _payloads
+
+
 async def handle_tool_call(name: str, arguments: dict) -> str:
-    """Execute a tool call and return the JSON result as a string."""
+    """Execute a tool call and return the JSON result as a string.
+
+    Storm results are serialized once per dataset version and served as
+    shared strings.
+    """
     if name == "consultar_interrupcoes_programadas":
         result = await query_scheduled_interruptions(
             municipality=arguments.get("concelho"),
             postal_code=arguments.get("codigo_postal"),
         )
     elif name == "consultar_estado_tempestade_kristin":
+        snapshot = current_snapshot()
         location = arguments.get("localizacao", "")
-        data = get_outage_by_location(location)
-        if data:
-            result = data
+        district_key = snapshot.location_index.lookup(location)
+        if district_key in snapshot.districts:
+            return _payloads_for(snapshot).districts[district_key]
         else:
             result = {
                 "info": (
@@ -96,10 +146,11 @@ async def handle_tool_call(name: str, arguments: dict) -> str:
                     f"não ter sido afetada ou não está na nossa base de dados. "
                     f"Para informações atualizadas, contacte a Linha de "
                     f"Avarias: 800 506 506."
-                )
+                ),
+                "versao_dados": snapshot.version,
             }
     elif name == "resumo_nacional_tempestade":
-        result = get_national_summary()
+        return _payloads_for(current_snapshot()).summary
     else:
         result = {"erro": f"Ferramenta desconhecida: {name}"}
 
@@ -1,4 +1,30 @@
-"""Mock Storm Kristin outage database by district."""
+"""Storm Kristin outage database by district.
+
+The built-in dataset below is served by default. With ``OUTAGE_DATA_FILE``
+set, the data is loaded from a JSON or CSV file instead and reloaded
+whenever the file changes. Each load is validated and published as an
+immutable, versioned :class:`OutageSnapshot` carrying its derived
+structures; readers grab the current snapshot once and never see a
+half-updated dataset.
+"""
+
+import asyncio
+import csv
+import datetime
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from types import MappingProxyType
+from typing import Callable, Mapping
+
+from location_index import LocationIndex
+
+logger = logging.getLogger(__name__)
 
 STORM_DATE = "2026-01-28"
 
@@ -181,49 +207,90 @@ POSTAL_CODE_DISTRICT_MAP = {
 }
 
 
-def get_district_from_postal(postal_code: str) -> str | None:
-    """Map a postal code to a district. Returns district key or None."""
-    prefix = postal_code.strip().split("-")[0]
-    return POSTAL_CODE_DISTRICT_MAP.get(prefix)
+# ── Snapshots ──────────────────────────────────────────────────────────────
+_ISO_DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
 
+DISTRICT_FIELDS: dict[str, type] = {
+    "distrito": str,
+    "clientes_afetados": int,
+    "clientes_sem_luz": int,
+    "equipas_no_terreno": int,
+    "geradores_instalados": int,
+    "postos_transformacao_afetados": int,
+    "linhas_media_tensao_afetadas": int,
+    "data_estimada_reposicao": str,
+    "percentagem_reposta": int,
+    "concelhos_mais_afetados": list,
+    "estado": str,
+}
 
-def get_outage_by_district(district_name: str) -> dict | None:
-    """Look up outage data by district name (case-insensitive)."""
-    key = district_name.strip().lower()
-    return OUTAGE_DATA.get(key)
 
+def _is_iso_date(text: str) -> bool:
+    if not _ISO_DATE_RE.match(text):
+        return False
+    try:
+        datetime.date.fromisoformat(text)
+    except ValueError:
+        return False
+    return True
 
-def get_outage_by_location(location: str) -> dict | None:
-    """Try to find outage data by postal code or district/municipality name."""
-    # Try postal code first
-    if any(c.isdigit() for c in location):
-        district_key = get_district_from_postal(location)
-        if district_key:
-            return OUTAGE_DATA.get(district_key)
 
-    # Try direct district match
-    key = location.strip().lower()
-    if key in OUTAGE_DATA:
-        return OUTAGE_DATA[key]
+def _normalize_keys(districts, postal_map) -> tuple:
+    """Lowercase the district keys and the district each postal code names.
 
-    # Try matching against concelhos_mais_afetados
-    for data in OUTAGE_DATA.values():
-        for concelho in data["concelhos_mais_afetados"]:
-            if key == concelho.lower():
-                return data
+    Anything of the wrong type is passed through for ``_validate`` to reject.
+    """
 
-    return None
+    def key(value):
+        return value.strip().lower() if isinstance(value, str) else value
 
+    if isinstance(districts, dict):
+        districts = {key(k): v for k, v in districts.items()}
+    if isinstance(postal_map, dict):
+        postal_map = {code: key(k) for code, k in postal_map.items()}
+    return districts, postal_map
 
-def get_national_summary() -> dict:
-    """Return aggregated national summary of storm impact."""
-    total_afetados = sum(d["clientes_afetados"] for d in OUTAGE_DATA.values())
-    total_sem_luz = sum(d["clientes_sem_luz"] for d in OUTAGE_DATA.values())
-    total_equipas = sum(d["equipas_no_terreno"] for d in OUTAGE_DATA.values())
-    total_geradores = sum(d["geradores_instalados"] for d in OUTAGE_DATA.values())
-    total_pt = sum(
-        d["postos_transformacao_afetados"] for d in OUTAGE_DATA.values()
-    )
+
+def _validate(districts: dict, postal_map: dict) -> None:
+    """Raise ValueError if the dataset is malformed."""
+    if not isinstance(districts, dict):
+        raise ValueError("districts must be an object keyed by district")
+    if not isinstance(postal_map, dict):
+        raise ValueError("postal codes must be an object mapping CP4 to district")
+    if not districts:
+        raise ValueError("dataset has no districts")
+    for key, data in districts.items():
+        if not isinstance(key, str) or not isinstance(data, dict):
+            raise ValueError(f"district {key!r} must be an object")
+        for name, kind in DISTRICT_FIELDS.items():
+            value = data.get(name)
+            if not isinstance(value, kind) or isinstance(value, bool):
+                raise ValueError(
+                    f"district {key!r}: field {name!r} must be {kind.__name__}"
+                )
+        if not all(isinstance(c, str) for c in data["concelhos_mais_afetados"]):
+            raise ValueError(f"district {key!r}: concelhos must be strings")
+        if not _is_iso_date(data["data_estimada_reposicao"]):
+            raise ValueError(
+                f"district {key!r}: data_estimada_reposicao must be YYYY-MM-DD"
+            )
+        if not 0 <= data["percentagem_reposta"] <= 100:
+            raise ValueError(f"district {key!r}: percentagem_reposta out of range")
+        if data["clientes_sem_luz"] > data["clientes_afetados"]:
+            raise ValueError(f"district {key!r}: clientes_sem_luz > clientes_afetados")
+    for code, key in postal_map.items():
+        if not (isinstance(code, str) and len(code) == 4 and code.isdigit()):
+            raise ValueError(f"postal code {code!r} must be 4 digits")
+        if key not in districts:
+            raise ValueError(f"postal code {code!r} maps to unknown district {key!r}")
+
+
+def _national_summary(districts: Mapping[str, dict], storm_date: str) -> dict:
+    total_afetados = sum(d["clientes_afetados"] for d in districts.values())
+    total_sem_luz = sum(d["clientes_sem_luz"] for d in districts.values())
+    total_equipas = sum(d["equipas_no_terreno"] for d in districts.values())
+    total_geradores = sum(d["geradores_instalados"] for d in districts.values())
+    total_pt = sum(d["postos_transformacao_afetados"] for d in districts.values())
 
     percentagem_global = (
         round((1 - total_sem_luz / total_afetados) * 100, 1)
@@ -233,8 +300,8 @@ def get_national_summary() -> dict:
 
     return {
         "evento": "Tempestade Kristin",
-        "data_evento": STORM_DATE,
-        "distritos_afetados": [d["distrito"] for d in OUTAGE_DATA.values()],
+        "data_evento": storm_date,
+        "distritos_afetados": [d["distrito"] for d in districts.values()],
         "total_clientes_afetados": total_afetados,
         "total_clientes_sem_luz": total_sem_luz,
         "percentagem_global_reposta": percentagem_global,
@@ -243,3 +310,219 @@ def get_national_summary() -> dict:
         "total_postos_transformacao_afetados": total_pt,
         "estado_geral": "Operação de recuperação em curso",
     }
+
+
+@dataclass(frozen=True)
+class OutageSnapshot:
+    """One validated version of the dataset plus everything derived from it.
+
+    Treat the contained dicts as read-only: they are shared by every request
+    served from this snapshot.
+    """
+
+    version: str
+    storm_date: str
+    districts: Mapping[str, dict]
+    postal_map: Mapping[str, str]
+    location_index: LocationIndex
+    national_summary: dict
+    source: str = "builtin"
+    loaded_at: float = field(default_factory=time.time)
+    # Hash of the file the snapshot was loaded from ("" for the builtin data).
+    content_hash: str = ""
+
+    @classmethod
+    def build(
+        cls,
+        districts: dict,
+        postal_map: dict,
+        storm_date: str,
+        version: str,
+        source: str = "builtin",
+        content_hash: str = "",
+    ) -> "OutageSnapshot":
+        districts, postal_map = _normalize_keys(districts, postal_map)
+        _validate(districts, postal_map)
+        districts = MappingProxyType(districts)
+        postal_map = MappingProxyType(postal_map)
+        return cls(
+            version=version,
+            storm_date=storm_date,
+            districts=districts,
+            postal_map=postal_map,
+            location_index=LocationIndex.from_outage_data(districts, postal_map),
+            national_summary=_national_summary(districts, storm_date),
+            source=source,
+            content_hash=content_hash,
+        )
+
+    def lookup(self, location: str, fuzzy: bool = True) -> dict | None:
+        district_key = self.location_index.lookup(location, fuzzy=fuzzy)
+        return self.districts.get(district_key) if district_key else None
+
+
+def _split_list(value: str) -> list[str]:
+    return [item.strip() for item in value.split(";") if item.strip()]
+
+
+def _parse_csv(text: str) -> tuple[dict, dict, str, str | None]:
+    """One row per district; list columns are ``;``-separated.
+
+    Columns: ``chave`` plus every district field, and ``codigos_postais``.
+    """
+    districts, postal_map = {}, {}
+    for line, row in enumerate(csv.DictReader(text.splitlines()), start=2):
+        if not row.get("chave"):
+            raise ValueError(f"row {line}: missing 'chave'")
+        key = row.pop("chave").strip().lower()
+        for code in _split_list(row.pop("codigos_postais", None) or ""):
+            postal_map[code] = key
+        data = {}
+        for name, kind in DISTRICT_FIELDS.items():
+            if row.get(name) is None:
+                raise ValueError(f"district {key!r}: missing column {name!r}")
+            raw = row[name].strip()
+            if kind is int:
+                try:
+                    data[name] = int(raw)
+                except ValueError:
+                    raise ValueError(f"district {key!r}: {name!r} is not an integer")
+            elif kind is list:
+                data[name] = _split_list(raw)
+            else:
+                data[name] = raw
+        districts[key] = data
+    return districts, postal_map, STORM_DATE, None
+
+
+def _parse_json(text: str) -> tuple[dict, dict, str, str | None]:
+    """``{"versao", "data_evento", "distritos": {...}, "codigos_postais": {...}}``
+
+    ``versao`` is optional; without it the version is a content hash.
+    """
+    try:
+        payload = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"invalid JSON: {e}") from e
+    if not isinstance(payload, dict):
+        raise ValueError("JSON dataset must be an object")
+    storm_date = payload.get("data_evento", STORM_DATE)
+    if not isinstance(storm_date, str):
+        raise ValueError("data_evento must be a string")
+    return (
+        payload.get("distritos") or {},
+        payload.get("codigos_postais") or {},
+        storm_date,
+        payload.get("versao"),
+    )
+
+
+def load_outage_file(path: str | Path) -> OutageSnapshot:
+    """Parse and validate a dataset file. Blocking; run it off the event loop."""
+    path = Path(path)
+    raw = path.read_bytes()
+    parse = _parse_csv if path.suffix.lower() == ".csv" else _parse_json
+    districts, postal_map, storm_date, version = parse(raw.decode("utf-8-sig"))
+    content_hash = hashlib.sha256(raw).hexdigest()[:12]
+    return OutageSnapshot.build(
+        districts,
+        postal_map,
+        storm_date,
+        version=str(version or content_hash),
+        source=str(path),
+        content_hash=content_hash,
+    )
+
+
+_snapshot = OutageSnapshot.build(
+    OUTAGE_DATA, POSTAL_CODE_DISTRICT_MAP, STORM_DATE, version="builtin"
+)
+_listeners: list[Callable[[OutageSnapshot], None]] = []
+
+
+def current_snapshot() -> OutageSnapshot:
+    return _snapshot
+
+
+def on_snapshot_change(listener) -> None:
+    """Register ``listener(snapshot)`` to run after each swap."""
+    _listeners.append(listener)
+
+
+def publish_snapshot(snapshot: OutageSnapshot) -> None:
+    """Atomically make ``snapshot`` the one new requests read."""
+    global _snapshot
+    previous, _snapshot = _snapshot, snapshot
+    logger.info(
+        "outage_data_loaded",
+        extra={
+            "version": snapshot.version,
+            "previous_version": previous.version,
+            "source": snapshot.source,
+        },
+    )
+    for listener in _listeners:
+        listener(snapshot)
+
+
+async def watch_outage_file(path: str, interval: float) -> None:
+    """Poll ``path`` and publish a new snapshot whenever its content changes.
+
+    Parsing and validation run in a worker thread. An invalid file is
+    logged and skipped; the last good snapshot keeps being served. So is a
+    changed file that keeps its explicit ``versao``: caches are keyed on the
+    version, so the edit is logged as ignored until ``versao`` is bumped.
+    """
+    last_seen = None
+    while True:
+        try:
+            stat = await asyncio.to_thread(os.stat, path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+            if signature != last_seen:
+                last_seen = signature
+                snapshot = await asyncio.to_thread(load_outage_file, path)
+                if snapshot.version != _snapshot.version:
+                    publish_snapshot(snapshot)
+                elif snapshot.content_hash != _snapshot.content_hash:
+                    logger.warning(
+                        "outage_data_change_ignored",
+                        extra={
+                            "path": path,
+                            "version": snapshot.version,
+                            "reason": "content changed but versao was not bumped",
+                        },
+                    )
+        except (OSError, ValueError) as e:
+            logger.error(
+                "outage_data_reload_failed", extra={"path": path, "error": str(e)}
+            )
+        await asyncio.sleep(interval)
+
+
+# ── Lookups (always against the current snapshot) ──────────────────────────
+def get_district_from_postal(postal_code: str) -> str | None:
+    """Map a postal code (CP4, CP7 or prefix) to a district key, or None."""
+    return _snapshot.location_index.lookup_postal(postal_code)
+
+
+def get_outage_by_district(district_name: str) -> dict | None:
+    """Look up outage data by district name (case-insensitive)."""
+    key = district_name.strip().lower()
+    return _snapshot.districts.get(key)
+
+
+def get_outage_by_location(location: str, fuzzy: bool = True) -> dict | None:
+    """Find outage data by postal code or district/concelho name.
+
+    Names match regardless of accents, case and hyphens; with ``fuzzy`` a
+    close misspelling also matches.
+    """
+    return _snapshot.lookup(location, fuzzy=fuzzy)
+
+
+def get_national_summary() -> dict:
+    """Return aggregated national summary of storm impact.
+
+    Computed once per snapshot; the returned dict is shared and read-only.
+    """
+    return _snapshot.national_summary
@@ -0,0 +1,109 @@
+"""Selection of the system-prompt sections relevant to a user message.
+
+Sections are ranked with BM25 over folded, lightly stemmed Portuguese
+tokens of their text and keywords. A section is injected when its score
+reaches ``min_score``; an unrelated question ("quando volta a luz em
+Leiria?") gets the core prompt alone, roughly half the tokens of the full
+prompt, on every LLM call of the turn.
+"""
+
+import math
+from collections import Counter
+from functools import lru_cache
+
+import metrics
+from location_index import fold
+from system_prompt import PROMPT_SECTIONS, SECTION_KEYWORDS, SYSTEM_PROMPT_CORE
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+MIN_SCORE = 0.7
+STEM_CHARS = 6
+
+# Folded; too common in questions, or in this domain, to tell sections apart.
+STOPWORDS = frozenset(
+    "a ao aos as com como da das de do dos e ela ele em esta estao estou eu "
+    "foi ha isso isto ja me meu minha na nao nas no nos o os ou para pela "
+    "pelo por porque qual quando que se sem ser sim sou sua seu ta tem tenho "
+    "um uma vai vou redes eredes energia eletricidade luz interrupcao "
+    "interrupcoes cliente clientes nacional".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    """Folded tokens without stop words, plurals and word endings."""
+    tokens = []
+    for word in fold(text).split():
+        if word in STOPWORDS or len(word) < 2:
+            continue
+        if len(word) > 3 and word.endswith("s"):
+            word = word[:-1]
+        tokens.append(word[:STEM_CHARS])
+    return tokens
+
+
+class SectionIndex:
+    """BM25 index over named text sections."""
+
+    def __init__(
+        self,
+        sections: dict[str, str],
+        k1: float = BM25_K1,
+        b: float = BM25_B,
+    ):
+        self.k1 = k1
+        self.b = b
+        self._terms = {
+            name: Counter(tokenize(text)) for name, text in sections.items()
+        }
+        self._lengths = {name: sum(tf.values()) for name, tf in self._terms.items()}
+        self._avg_length = sum(self._lengths.values()) / max(1, len(sections))
+        df = Counter(term for tf in self._terms.values() for term in tf)
+        n = len(sections)
+        self._idf = {
+            term: math.log(1 + (n - count + 0.5) / (count + 0.5))
+            for term, count in df.items()
+        }
+
+    def scores(self, query: str) -> dict[str, float]:
+        """BM25 score of every section for ``query``."""
+        terms = set(tokenize(query)) & self._idf.keys()
+        scores = {}
+        for name, tf in self._terms.items():
+            length = self._lengths[name] / self._avg_length
+            norm = self.k1 * (1 - self.b + self.b * length)
+            scores[name] = sum(
+                self._idf[t] * tf[t] * (self.k1 + 1) / (tf[t] + norm)
+                for t in terms
+                if t in tf
+            )
+        return scores
+
+    def select(self, query: str, min_score: float = MIN_SCORE) -> list[str]:
+        """Names of the sections scoring at least ``min_score``, in index order."""
+        scores = self.scores(query)
+        return [name for name, score in scores.items() if score >= min_score]
+
+
+INDEX = SectionIndex(
+    {
+        name: f"{text}\n{SECTION_KEYWORDS.get(name, '')}"
+        for name, text in PROMPT_SECTIONS.items()
+    }
+)
+
+
+@lru_cache(maxsize=None)
+def assemble(sections: tuple[str, ...]) -> str:
+    """The core prompt followed by ``sections``, built once per combination."""
+    parts = [SYSTEM_PROMPT_CORE.rstrip("\n")]
+    parts.extend(PROMPT_SECTIONS[name] for name in sections)
+    return "\n\n".join(parts) + "\n"
+
+
+def system_prompt_for(message: str, min_score: float = MIN_SCORE) -> str:
+    """The system prompt for a turn whose user message is ``message``."""
+    sections = tuple(INDEX.select(message, min_score))
+    for name in sections or ("none",):
+        metrics.PROMPT_SECTIONS.labels(name).inc()
+    return assemble(sections)
@@ -0,0 +1,282 @@
+"""Token-bucket rate limiting, shared by every worker.
+
+Each chat request takes one token from two buckets at once: one per client
+IP and one per ``session_id``. Fast-path answers and LLM turns have
+separate budgets, so cheap lookups do not use up the allowance for
+expensive turns. Check-and-consume over both buckets is atomic and all or
+nothing: the in-memory store does it without awaiting, the Redis store in
+one Lua script (a single round trip), so several workers share one limit.
+
+The client IP is the peer address, unless the peer is a trusted proxy; then
+it is the rightmost ``X-Forwarded-For`` entry that is not a trusted proxy.
+"""
+
+import ipaddress
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import Counter, OrderedDict
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass
+
+import redis.asyncio as redis
+
+logger = logging.getLogger(__name__)
+
+FAST_PATH = "fast_path"
+LLM = "llm"
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+@dataclass(frozen=True, slots=True)
+class Rate:
+    """``burst`` tokens refilled at ``per_second``."""
+
+    per_second: float
+    burst: int
+
+    @classmethod
+    def parse(cls, text: str) -> "Rate":
+        """Parse ``"<count>/<second|minute|hour|day>"``, e.g. ``"10/minute"``."""
+        count, _, period = text.strip().partition("/")
+        period = period.strip().lower().removesuffix("s")
+        if period not in _PERIODS or not count.strip().isdigit() or int(count) < 1:
+            raise ValueError(f"invalid rate {text!r}; expected e.g. '10/minute'")
+        return cls(per_second=int(count) / _PERIODS[period], burst=int(count))
+
+
+@dataclass(frozen=True, slots=True)
+class Decision:
+    allowed: bool
+    # Seconds until every bucket could pay for the request; 0 when allowed.
+    retry_after: float = 0.0
+
+
+def take(
+    states: list[tuple[float, float] | None],
+    rates: list[Rate],
+    now: float,
+    cost: float = 1.0,
+) -> tuple[Decision, list[tuple[float, float]]]:
+    """Refill the buckets to ``now`` and take ``cost`` from each, or from none.
+
+    ``states`` holds ``(tokens, updated_at)`` per bucket (None: never used,
+    i.e. full). Returns the decision and the states to store, which are only
+    meaningful when allowed. ``TOKEN_BUCKET_LUA`` is the same algorithm.
+    """
+    levels = []
+    wait = 0.0
+    for state, rate in zip(states, rates):
+        tokens, updated = state if state is not None else (rate.burst, now)
+        tokens = min(rate.burst, tokens + max(0.0, now - updated) * rate.per_second)
+        levels.append(tokens)
+        if tokens < cost:
+            wait = max(wait, (cost - tokens) / rate.per_second)
+    if wait > 0:
+        return Decision(False, wait), []
+    return Decision(True), [(tokens - cost, now) for tokens in levels]
+
+
+# KEYS: the buckets. ARGV: now, cost, then rate and burst for each key.
+TOKEN_BUCKET_LUA = """
+local now = tonumber(ARGV[1])
+local cost = tonumber(ARGV[2])
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+  local rate = tonumber(ARGV[1 + 2 * i])
+  local burst = tonumber(ARGV[2 + 2 * i])
+  local state = redis.call('HMGET', key, 'tokens', 'ts')
+  local tokens = tonumber(state[1]) or burst
+  local updated = tonumber(state[2]) or now
+  tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+  levels[i] = tokens
+  if tokens < cost then
+    wait = math.max(wait, (cost - tokens) / rate)
+  end
+end
+if wait > 0 then
+  return {0, tostring(wait)}
+end
+for i, key in ipairs(KEYS) do
+  local rate = tonumber(ARGV[1 + 2 * i])
+  local burst = tonumber(ARGV[2 + 2 * i])
+  redis.call('HSET', key, 'tokens', tostring(levels[i] - cost), 'ts', tostring(now))
+  redis.call('PEXPIRE', key, math.ceil(burst / rate * 1000))
+end
+return {1, '0'}
+"""
+
+
+class RateLimitStore(ABC):
+    @abstractmethod
+    async def consume(
+        self, buckets: list[tuple[str, Rate]], cost: float = 1.0
+    ) -> Decision:
+        """Atomically take ``cost`` tokens from every bucket, or from none."""
+
+    async def close(self) -> None:
+        pass
+
+
+class MemoryRateLimitStore(RateLimitStore):
+    """Per-process buckets; the limit multiplies with the worker count.
+
+    Buckets are kept in last-use order and at most ``max_keys`` of them;
+    the least recently used goes first (forgetting a bucket refills it).
+    """
+
+    def __init__(
+        self, max_keys: int = 100_000, clock: Callable[[], float] = time.time
+    ):
+        self.max_keys = max_keys
+        self._clock = clock
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    async def consume(
+        self, buckets: list[tuple[str, Rate]], cost: float = 1.0
+    ) -> Decision:
+        keys = [key for key, _ in buckets]
+        decision, states = take(
+            [self._buckets.get(key) for key in keys],
+            [rate for _, rate in buckets],
+            self._clock(),
+            cost,
+        )
+        for key, state in zip(keys, states):
+            self._buckets[key] = state
+            self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return decision
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class RedisRateLimitStore(RateLimitStore):
+    """Buckets in Redis hashes, shared by all workers.
+
+    Each bucket expires once it would be full again, so idle clients cost
+    nothing. The script is sent once and then run by its SHA.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        key_prefix: str = "eredes:",
+        clock: Callable[[], float] = time.time,
+    ):
+        self._redis = redis.from_url(url, protocol=2)
+        self._prefix = f"{key_prefix}ratelimit:"
+        self._clock = clock
+        self._script = self._redis.register_script(TOKEN_BUCKET_LUA)
+
+    async def consume(
+        self, buckets: list[tuple[str, Rate]], cost: float = 1.0
+    ) -> Decision:
+        args: list[float] = [self._clock(), cost]
+        for _, rate in buckets:
+            args.extend((rate.per_second, rate.burst))
+        allowed, wait = await self._script(
+            keys=[self._prefix + key for key, _ in buckets], args=args
+        )
+        return Decision(bool(int(allowed)), float(wait))
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+
+def create_rate_limit_store(backend: str, *, redis_url: str) -> RateLimitStore:
+    """Build the store selected by ``RATE_LIMIT_BACKEND``."""
+    if backend == "memory":
+        return MemoryRateLimitStore()
+    if backend == "redis":
+        return RedisRateLimitStore(redis_url)
+    raise ValueError(f"Unknown rate limit backend: {backend!r}")
+
+
+def parse_networks(text: str) -> list[ipaddress.IPv4Network | ipaddress.IPv6Network]:
+    """Comma-separated addresses or CIDR blocks, as for ``TRUSTED_PROXIES``."""
+    return [
+        ipaddress.ip_network(item.strip(), strict=False)
+        for item in text.split(",")
+        if item.strip()
+    ]
+
+
+def _trusted(address: str, networks: Iterable) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in networks)
+
+
+def client_ip(peer: str | None, forwarded_for: str | None, trusted: list) -> str:
+    """The client's address, looking through trusted proxies only.
+
+    ``X-Forwarded-For`` is read right to left, since only the entries
+    appended by our own proxies can be believed; the first one that is not
+    a trusted proxy is the client.
+    """
+    address = peer or "unknown"
+    if not forwarded_for or not _trusted(address, trusted):
+        return address
+    for hop in reversed(forwarded_for.split(",")):
+        hop = hop.strip()
+        try:
+            ipaddress.ip_address(hop)
+        except ValueError:
+            break  # garbage: keep the last address we could verify
+        address = hop
+        if not _trusted(hop, trusted):
+            break
+    return address
+
+
+class RateLimiter:
+    """Per-IP and per-session budgets for fast-path answers and LLM turns."""
+
+    def __init__(
+        self,
+        store: RateLimitStore,
+        budgets: dict[str, tuple[Rate, Rate]],
+        enabled: bool = True,
+    ):
+        """``budgets`` maps ``FAST_PATH``/``LLM`` to ``(per_ip, per_session)``."""
+        self.store = store
+        self.budgets = budgets
+        self.enabled = enabled
+        self.allowed: Counter[str] = Counter()
+        self.limited: Counter[str] = Counter()
+
+    async def check(self, kind: str, ip: str, session_id: str) -> Decision:
+        """Take one request of ``kind`` from the IP's and the session's budget.
+
+        If the store cannot be reached the request is let through: losing
+        the limit for a moment is better than refusing everyone.
+        """
+        if not self.enabled:
+            return Decision(True)
+        per_ip, per_session = self.budgets[kind]
+        try:
+            decision = await self.store.consume(
+                [
+                    (f"{kind}:ip:{ip}", per_ip),
+                    (f"{kind}:session:{session_id}", per_session),
+                ]
+            )
+        except Exception as e:
+            logger.error("rate_limit_store_error", extra={"error": str(e)})
+            return Decision(True)
+        (self.allowed if decision.allowed else self.limited)[kind] += 1
+        return decision
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "allowed": dict(self.allowed),
+            "limited": dict(self.limited),
+        }
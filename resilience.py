@@ -0,0 +1,211 @@
+"""Failure handling for calls to the LLM upstream.
+
+A circuit breaker that fails fast while the upstream error rate is high,
+decorrelated-jitter backoff, ``Retry-After`` parsing and the typed errors
+the chat endpoints map to HTTP responses.
+"""
+
+import email.utils
+import logging
+import random
+import time
+from collections import deque
+from collections.abc import Callable, Mapping
+
+logger = logging.getLogger(__name__)
+
+
+# ── Errors ─────────────────────────────────────────────────────────────────
+class UpstreamError(Exception):
+    """The LLM upstream could not produce a response.
+
+    ``retry_after`` is the suggested client wait in seconds, if known.
+    """
+
+    def __init__(self, message: str, retry_after: float | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class UpstreamRateLimitError(UpstreamError):
+    """The upstream rejected the call with 429 and retrying would not fit."""
+
+
+class UpstreamUnavailableError(UpstreamError):
+    """5xx or connection failures persisted past the retry budget."""
+
+
+class CircuitOpenError(UpstreamUnavailableError):
+    """The breaker is open; the call was not attempted."""
+
+
+# ── Backoff ────────────────────────────────────────────────────────────────
+def decorrelated_jitter(
+    previous: float,
+    base: float,
+    cap: float,
+    rng: Callable[[float, float], float] = random.uniform,
+) -> float:
+    """Next backoff delay: ``min(cap, uniform(base, previous * 3))``.
+
+    Spreads retries from concurrent requests apart instead of letting them
+    hit the upstream in synchronized waves.
+    """
+    return min(cap, rng(base, max(base, previous * 3)))
+
+
+def retry_after_seconds(
+    headers: Mapping[str, str] | None, now: Callable[[], float] = time.time
+) -> float | None:
+    """Parse ``retry-after-ms`` or ``Retry-After`` (seconds or HTTP date)."""
+    if not headers:
+        return None
+    raw_ms = headers.get("retry-after-ms")
+    if raw_ms:
+        try:
+            return max(0.0, float(raw_ms) / 1000)
+        except ValueError:
+            pass
+    raw = headers.get("retry-after")
+    if not raw:
+        return None
+    try:
+        return max(0.0, float(raw))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(raw)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - now())
+
+
+# ── Circuit breaker ────────────────────────────────────────────────────────
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Failure-rate circuit breaker over the last ``window`` calls.
+
+    Closed: calls flow and outcomes are recorded. Once at least
+    ``min_calls`` outcomes are in the window and the failure ratio reaches
+    ``failure_ratio``, the breaker opens and rejects calls for
+    ``cooldown_seconds``. It then goes half-open and lets a single probe
+    through: success closes it, failure re-opens it.
+
+    Listeners registered with ``on_state_change`` are called with
+    ``(old_state, new_state)`` on every transition.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_ratio: float = 0.5,
+        window: int = 20,
+        min_calls: int = 5,
+        cooldown_seconds: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.failure_ratio = failure_ratio
+        self.min_calls = min_calls
+        self.cooldown_seconds = cooldown_seconds
+        self._clock = clock
+        self._outcomes: deque[bool] = deque(maxlen=window)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._listeners: list[Callable[[str, str], None]] = []
+        self.rejected = 0
+        self.opened = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and self.retry_after() == 0:
+            self._transition(HALF_OPEN)
+        return self._state
+
+    def on_state_change(self, listener: Callable[[str, str], None]) -> None:
+        self._listeners.append(listener)
+
+    def retry_after(self) -> float:
+        """Seconds until an open breaker lets a probe through (0 otherwise)."""
+        if self._state != OPEN:
+            return 0.0
+        return max(0.0, self._opened_at + self.cooldown_seconds - self._clock())
+
+    def available(self) -> bool:
+        """Whether ``before_call`` would admit a call right now."""
+        state = self.state
+        return state == CLOSED or (state == HALF_OPEN and not self._probe_in_flight)
+
+    def before_call(self) -> None:
+        """Admit a call or raise :class:`CircuitOpenError`."""
+        state = self.state
+        if state == CLOSED:
+            return
+        if state == HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return
+        self.rejected += 1
+        raise CircuitOpenError(
+            f"circuit {self.name!r} is {state}",
+            retry_after=self.retry_after() or self.cooldown_seconds,
+        )
+
+    def record_success(self) -> None:
+        if self._state == HALF_OPEN:
+            self._outcomes.clear()
+            self._transition(CLOSED)
+        self._probe_in_flight = False
+        self._outcomes.append(True)
+
+    def record_failure(self) -> None:
+        self._probe_in_flight = False
+        if self._state == HALF_OPEN:
+            self._open()
+            return
+        self._outcomes.append(False)
+        failures = self._outcomes.count(False)
+        if (
+            self._state == CLOSED
+            and len(self._outcomes) >= self.min_calls
+            and failures / len(self._outcomes) >= self.failure_ratio
+        ):
+            self._open()
+
+    def release(self) -> None:
+        """End an admitted call whose outcome says nothing about health."""
+        self._probe_in_flight = False
+
+    def _open(self) -> None:
+        self._opened_at = self._clock()
+        self._outcomes.clear()
+        self.opened += 1
+        self._transition(OPEN)
+
+    def _transition(self, new_state: str) -> None:
+        old_state, self._state = self._state, new_state
+        if old_state == new_state:
+            return
+        logger.warning(
+            "circuit_state_changed",
+            extra={"circuit": self.name, "from": old_state, "to": new_state},
+        )
+        for listener in self._listeners:
+            listener(old_state, new_state)
+
+    def stats(self) -> dict:
+        failures = self._outcomes.count(False)
+        return {
+            "state": self.state,
+            "failure_ratio": round(failures / len(self._outcomes), 4)
+            if self._outcomes
+            else 0.0,
+            "window_calls": len(self._outcomes),
+            "opened": self.opened,
+            "rejected": self.rejected,
+            "retry_after": round(self.retry_after(), 3),
+        }
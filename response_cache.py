@@ -0,0 +1,141 @@
+"""Cache of complete first turns for frequently asked opening questions.
+
+A conversation's first turn depends only on the system prompt, the
+question, the outage data and the model, so its messages (tool calls,
+tool results and reply) can be replayed into another session that opens
+with the same question. Keys use the folded question (no accents, case or
+punctuation) plus the data version and models. A miss registers the turn
+as in flight, and identical questions arriving meanwhile wait for it
+instead of starting their own tool loop.
+"""
+
+import asyncio
+from collections.abc import Hashable
+from contextlib import asynccontextmanager
+
+import metrics
+from cache import TTLCache
+from location_index import fold
+from session_store import estimate_size
+
+
+def question_key(message: str) -> str:
+    """Accent-, case- and punctuation-insensitive form of a question."""
+    return fold(message)
+
+
+class _Abandoned(Exception):
+    """The leading turn ended without storing a reply."""
+
+
+class CachedTurn:
+    """Outcome of a lookup: replay ``messages`` if set, else answer live."""
+
+    __slots__ = ("messages", "_cache", "_key")
+
+    def __init__(self, messages, cache=None, key=None):
+        self.messages: list[dict] | None = messages
+        self._cache = cache
+        self._key = key
+
+    def store(self, messages: list[dict], cacheable: bool = True) -> None:
+        """Hand a live turn's messages to waiters; cache them if ``cacheable``."""
+        if self._cache is not None:
+            self._cache._store(self._key, messages, cacheable)
+
+
+class ResponseCache:
+    """TTL/LRU cache of first turns with single-flight answering.
+
+    Memory is bounded by ``max_entries`` times ``max_entry_bytes``: larger
+    turns are answered but not cached.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, max_entry_bytes: int):
+        self._entries = TTLCache(max_entries=max_entries, ttl=ttl)
+        self.max_entry_bytes = max_entry_bytes
+        self._inflight: dict[Hashable, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.too_large = 0
+
+    @asynccontextmanager
+    async def turn(self, key: Hashable | None):
+        """Look up ``key``; on a miss, lead the turn for everyone asking.
+
+        Yields a :class:`CachedTurn`. When it has no messages the caller
+        answers live and calls ``store``; waiters get the stored messages,
+        or the exception the block raised. ``key=None`` bypasses the cache.
+        """
+        if key is None:
+            yield CachedTurn(None)
+            return
+
+        while True:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self.hits += 1
+                metrics.RESPONSE_CACHE_LOOKUPS.labels("hit").inc()
+                yield CachedTurn(cached)
+                return
+            future = self._inflight.get(key)
+            if future is None:
+                break
+            try:
+                cached = await asyncio.shield(future)
+            except _Abandoned:
+                continue  # the leader went away; take over
+            self.coalesced += 1
+            metrics.RESPONSE_CACHE_LOOKUPS.labels("coalesced").inc()
+            yield CachedTurn(cached)
+            return
+
+        self.misses += 1
+        metrics.RESPONSE_CACHE_LOOKUPS.labels("miss").inc()
+        future = self._inflight[key] = asyncio.get_running_loop().create_future()
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        try:
+            yield CachedTurn(None, self, key)
+        except BaseException as e:
+            if not future.done():
+                future.set_exception(e if isinstance(e, Exception) else _Abandoned())
+            raise
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+            if not future.done():
+                future.set_exception(_Abandoned())
+
+    def answers(self, key: Hashable | None) -> bool:
+        """Whether a turn for ``key`` would be served without the LLM now."""
+        return key is not None and (
+            key in self._inflight or self._entries.get(key) is not None
+        )
+
+    def _store(self, key: Hashable, messages: list[dict], cacheable: bool) -> None:
+        messages = [dict(m) for m in messages]
+        future = self._inflight.get(key)
+        if future is not None and not future.done():
+            future.set_result(messages)
+        if not cacheable:
+            return
+        if estimate_size(messages) > self.max_entry_bytes:
+            self.too_large += 1
+            return
+        self._entries.set(key, messages)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "size": len(self._entries),
+            "max_entries": self._entries.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "too_large": self.too_large,
+            "inflight": len(self._inflight),
+            "hit_ratio": round((self.hits + self.coalesced) / lookups, 4)
+            if lookups
+            else 0.0,
+        }
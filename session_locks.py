@@ -0,0 +1,144 @@
+"""Serialization of chat turns within one session.
+
+A turn loads the history, runs the tool loop and appends the result, so
+two turns of the same session running at once (a double submit, two
+tabs) would each answer from a stale history. ``SessionLocks`` gives each
+session an ``asyncio.Lock`` with a bounded queue and wait, and lets an
+identical message sent while the first copy is still pending share its
+result instead of calling the LLM again.
+
+Locks are per process: with several workers, requests of one session
+only serialize when they reach the same worker.
+"""
+
+import asyncio
+import weakref
+from contextlib import asynccontextmanager
+
+
+class SessionBusyError(Exception):
+    """A turn could not get its session's lock.
+
+    ``queue_full`` is true when too many turns were already waiting (the
+    request was not queued), false when the wait timed out.
+    """
+
+    def __init__(self, message: str, queue_full: bool):
+        super().__init__(message)
+        self.queue_full = queue_full
+
+
+def message_key(message: str) -> str:
+    """Whitespace- and case-insensitive identity of a user message."""
+    return " ".join(message.split()).casefold()
+
+
+class _Session:
+    __slots__ = ("lock", "turns", "pending", "__weakref__")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        # Turns holding or waiting for the lock.
+        self.turns = 0
+        # message_key -> result of the turn answering that message.
+        self.pending: dict[str, asyncio.Future] = {}
+
+
+class SessionLocks:
+    """Per-session locks, dropped as soon as no turn references them."""
+
+    def __init__(self, max_queued: int = 1, wait_seconds: float = 30.0):
+        self.max_queued = max_queued
+        self.wait_seconds = wait_seconds
+        self._sessions: weakref.WeakValueDictionary[str, _Session] = (
+            weakref.WeakValueDictionary()
+        )
+        self.coalesced = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def pending(self, session_id: str, key: str) -> asyncio.Future | None:
+        """The result of an in-flight turn for the same message, if any.
+
+        Await it through ``asyncio.shield`` so a disconnecting duplicate
+        does not cancel the turn it joined.
+        """
+        session = self._sessions.get(session_id)
+        future = session.pending.get(key) if session is not None else None
+        if future is not None:
+            self.coalesced += 1
+        return future
+
+    def busy(self, session_id: str) -> bool:
+        """Whether a turn of the session holds or is waiting for the lock."""
+        session = self._sessions.get(session_id)
+        return session is not None and session.turns > 0
+
+    def check(self, session_id: str) -> None:
+        """Raise :class:`SessionBusyError` if a new turn would be refused."""
+        session = self._sessions.get(session_id)
+        if session is not None and session.turns > self.max_queued:
+            self.rejected += 1
+            raise SessionBusyError(
+                f"session {session_id} already has {session.turns} turns pending",
+                queue_full=True,
+            )
+
+    @asynccontextmanager
+    async def turn(self, session_id: str, key: str | None):
+        """Hold the session's lock for one turn.
+
+        Yields a future that the caller resolves with the turn's result;
+        duplicates found through :meth:`pending` receive it. If the block
+        exits without resolving it, duplicates get the exception raised (or
+        a :class:`SessionBusyError` when there was none). With no ``key``
+        the turn is not offered to duplicates.
+        """
+        self.check(session_id)
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._sessions[session_id] = _Session()
+
+        result = asyncio.get_running_loop().create_future()
+        # Mark the exception retrieved; usually nobody else awaits it.
+        result.add_done_callback(lambda f: f.cancelled() or f.exception())
+        if key is not None:
+            session.pending.setdefault(key, result)
+        session.turns += 1
+        try:
+            try:
+                async with asyncio.timeout(self.wait_seconds):
+                    await session.lock.acquire()
+            except TimeoutError:
+                self.timed_out += 1
+                raise SessionBusyError(
+                    f"timed out waiting for session {session_id}", queue_full=False
+                ) from None
+            try:
+                yield result
+            finally:
+                session.lock.release()
+        except BaseException as e:
+            if not result.done():
+                result.set_exception(
+                    e
+                    if isinstance(e, Exception)
+                    else SessionBusyError("the original request was abandoned", False)
+                )
+            raise
+        finally:
+            session.turns -= 1
+            if key is not None and session.pending.get(key) is result:
+                del session.pending[key]
+            if not result.done():
+                result.set_exception(
+                    SessionBusyError("the original request ended unanswered", False)
+                )
+
+    def stats(self) -> dict:
+        return {
+            "sessions_locked": len(self._sessions),
+            "coalesced": self.coalesced,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
@@ -0,0 +1,448 @@
+"""Conversation history storage: in-process memory or a shared Redis server.
+
+Stored histories never include the system prompt; ``app.get_session``
+prepends it on load. Only completed turns are appended, so a failed or
+timed-out request leaves the stored history untouched.
+
+The in-memory backend keeps messages as compact ``StoredMessage`` objects
+and shares equal strings (tool results, tool-call arguments, templated
+replies) between sessions; OpenAI-style dicts are rebuilt on ``load``.
+"""
+
+import json
+import logging
+import sys
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from collections.abc import Callable
+from dataclasses import dataclass, field
+
+import redis.asyncio as redis
+from redis.exceptions import WatchError
+
+logger = logging.getLogger(__name__)
+
+
+class SessionStore(ABC):
+    @abstractmethod
+    async def load(self, session_id: str) -> list[dict]:
+        """Return the stored messages for a session and refresh its TTL."""
+
+    @abstractmethod
+    async def append(
+        self, session_id: str, messages: list[dict], max_messages: int
+    ) -> None:
+        """Atomically append messages and keep only the last ``max_messages``."""
+
+    @abstractmethod
+    async def replace_prefix(
+        self, session_id: str, old: list[dict], new: list[dict]
+    ) -> bool:
+        """Replace the first messages with ``new`` if they are still ``old``.
+
+        Returns False, changing nothing, when the history no longer starts
+        with ``old`` (it was trimmed or expired meanwhile).
+        """
+
+    @abstractmethod
+    async def count(self) -> int:
+        """Number of live sessions."""
+
+    @abstractmethod
+    async def cleanup(self) -> int:
+        """Evict expired sessions, returning how many were removed."""
+
+    def memory_bytes(self) -> int | None:
+        """Estimated bytes held in this process, if the backend keeps any.
+
+        Read on every ``/metrics`` scrape, so it must not walk the store.
+        """
+        return None
+
+    def session_bytes(self, session_id: str) -> int | None:
+        """Estimated bytes one session holds in this process, if any."""
+        return None
+
+    async def close(self) -> None:
+        pass
+
+
+def estimate_size(obj) -> int:
+    """Rough deep size of a JSON-like message (dicts, lists, strings)."""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(estimate_size(v) for v in obj.values())
+    elif isinstance(obj, list):
+        size += sum(estimate_size(v) for v in obj)
+    return size
+
+
+# ── In-memory backend ──────────────────────────────────────────────────────
+# Strings longer than this are never shared: they are rarely repeated.
+INTERN_MAX_LENGTH = 8192
+# Characters held by the sharing table before it starts over.
+INTERN_MAX_CHARS = 4 * 1024 * 1024
+
+
+class StringPool:
+    """Maps equal strings to one shared copy.
+
+    The table keeps the strings it holds alive, so it is bounded: once it
+    holds ``max_chars`` characters it is cleared and starts over, and
+    strings already shared stay shared.
+    """
+
+    def __init__(
+        self, max_length: int = INTERN_MAX_LENGTH, max_chars: int = INTERN_MAX_CHARS
+    ):
+        self.max_length = max_length
+        self.max_chars = max_chars
+        self._strings: dict[str, str] = {}
+        self._chars = 0
+
+    def __call__(self, value: str | None) -> str | None:
+        if value is None or len(value) > self.max_length:
+            return value
+        shared = self._strings.get(value)
+        if shared is not None:
+            return shared
+        if self._chars + len(value) > self.max_chars:
+            self._strings.clear()
+            self._chars = 0
+        self._strings[value] = value
+        self._chars += len(value)
+        return value
+
+    def __len__(self) -> int:
+        return len(self._strings)
+
+
+_ROLES = {role: sys.intern(role) for role in ("system", "user", "assistant", "tool")}
+
+
+class StoredMessage:
+    """One chat message in the in-memory store.
+
+    ``tool_calls`` is a tuple of ``(id, name, arguments)`` tuples; keys
+    other than the ones the app writes are kept in ``extra``.
+    """
+
+    __slots__ = ("role", "content", "tool_calls", "tool_call_id", "extra")
+
+    def __init__(self, role, content, tool_calls=None, tool_call_id=None, extra=None):
+        self.role: str = role
+        self.content: str | None = content
+        self.tool_calls: tuple[tuple[str, str, str], ...] | None = tool_calls
+        self.tool_call_id: str | None = tool_call_id
+        self.extra: dict | None = extra
+
+    @classmethod
+    def from_dict(cls, message: dict, pool: StringPool) -> "StoredMessage":
+        extra = {
+            k: v
+            for k, v in message.items()
+            if k not in ("role", "content", "tool_calls", "tool_call_id")
+        }
+        tool_calls = message.get("tool_calls")
+        if tool_calls is not None:
+            tool_calls = tuple(
+                (
+                    call["id"],
+                    pool(call["function"]["name"]),
+                    pool(call["function"]["arguments"]),
+                )
+                for call in tool_calls
+            )
+        role = message["role"]
+        return cls(
+            _ROLES.get(role, role),
+            pool(message.get("content")),
+            tool_calls,
+            message.get("tool_call_id"),
+            extra or None,
+        )
+
+    def to_dict(self) -> dict:
+        """The message as the OpenAI API takes it."""
+        message = {"role": self.role, "content": self.content}
+        if self.tool_calls is not None:
+            message["tool_calls"] = [
+                {
+                    "id": call_id,
+                    "type": "function",
+                    "function": {"name": name, "arguments": arguments},
+                }
+                for call_id, name, arguments in self.tool_calls
+            ]
+        if self.tool_call_id is not None:
+            message["tool_call_id"] = self.tool_call_id
+        if self.extra:
+            message.update(self.extra)
+        return message
+
+    def size(self, seen: set[int]) -> int:
+        """Estimated bytes, counting objects whose id is in ``seen`` as free.
+
+        Strings and tuples counted here are added to ``seen``.
+        """
+        size = sys.getsizeof(self)
+        for value in (self.content, self.tool_call_id, self.tool_calls):
+            size += _shared_size(value, seen)
+        if self.extra:
+            size += estimate_size(self.extra)
+        return size
+
+
+def _shared_size(value, seen: set[int]) -> int:
+    if value is None or id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, tuple):
+        size += sum(_shared_size(item, seen) for item in value)
+    return size
+
+
+@dataclass(slots=True)
+class Session:
+    messages: list[StoredMessage] = field(default_factory=list)
+    last_accessed: float = field(default_factory=time.time)
+    # Running estimate of the history's size, shared strings included.
+    bytes: int = 0
+
+    def memory_bytes(self, seen: set[int] | None = None) -> int:
+        """Estimated bytes of the history; shared strings count once per
+        ``seen`` set (a fresh one charges them all to this session)."""
+        seen = set() if seen is None else seen
+        return sys.getsizeof(self.messages) + sum(
+            message.size(seen) for message in self.messages
+        )
+
+
+class MemorySessionStore(SessionStore):
+    """Per-process store; only valid with a single worker.
+
+    Sessions are kept in last-access order, so the least recently used
+    session is both the LRU victim and the next one to expire. The count cap
+    is enforced on insert and expiry pops from the front until it reaches a
+    live session: each removal is O(1) and no pass ever scans or sorts the
+    whole store. ``max_bytes`` (0 = none) also caps the sum of the sessions'
+    size estimates; since shared strings are charged to every session
+    holding them, the cap errs on the safe side.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: int,
+        max_count: int,
+        clock: Callable[[], float] = time.time,
+        max_bytes: int = 0,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self.sessions: OrderedDict[str, Session] = OrderedDict()
+        self.evicted_capped = 0
+        self.total_bytes = 0
+        self.strings = StringPool()
+
+    async def load(self, session_id: str) -> list[dict]:
+        session = self.sessions.get(session_id)
+        if session is None:
+            return []
+        now = self._clock()
+        if now - session.last_accessed > self.ttl_seconds:
+            self._remove(session_id)
+            return []
+        session.last_accessed = now
+        self.sessions.move_to_end(session_id)
+        return [message.to_dict() for message in session.messages]
+
+    async def append(
+        self, session_id: str, messages: list[dict], max_messages: int
+    ) -> None:
+        now = self._clock()
+        session = self.sessions.get(session_id)
+        if session is not None and now - session.last_accessed > self.ttl_seconds:
+            # Expired as load() would see it: the turn starts a new history.
+            self._remove(session_id)
+            session = None
+        if session is None:
+            self._expire(now)
+            session = self.sessions[session_id] = Session(last_accessed=now)
+            while len(self.sessions) > self.max_count:
+                self._remove(next(iter(self.sessions)))
+                self.evicted_capped += 1
+        else:
+            session.last_accessed = now
+            self.sessions.move_to_end(session_id)
+
+        added = [StoredMessage.from_dict(m, self.strings) for m in messages]
+        session.messages.extend(added)
+        grown = sum(message.size(set()) for message in added)
+        if len(session.messages) > max_messages:
+            dropped = session.messages[: len(session.messages) - max_messages]
+            del session.messages[: len(dropped)]
+            grown -= sum(message.size(set()) for message in dropped)
+        session.bytes += grown
+        self.total_bytes += grown
+
+        # The session just appended to is last, so it is never the victim.
+        while self.max_bytes and self.total_bytes > self.max_bytes:
+            victim = next(iter(self.sessions))
+            if victim == session_id:
+                break
+            self._remove(victim)
+            self.evicted_capped += 1
+
+    async def replace_prefix(
+        self, session_id: str, old: list[dict], new: list[dict]
+    ) -> bool:
+        session = self.sessions.get(session_id)
+        if session is None or len(session.messages) < len(old):
+            return False
+        prefix = session.messages[: len(old)]
+        if [message.to_dict() for message in prefix] != old:
+            return False
+        added = [StoredMessage.from_dict(m, self.strings) for m in new]
+        session.messages[: len(old)] = added
+        grown = sum(m.size(set()) for m in added) - sum(m.size(set()) for m in prefix)
+        session.bytes += grown
+        self.total_bytes += grown
+        return True
+
+    async def count(self) -> int:
+        return len(self.sessions)
+
+    async def cleanup(self) -> int:
+        return self._expire(self._clock())
+
+    def memory_bytes(self) -> int:
+        """Running size estimate, kept up to date on every write.
+
+        Shared strings are charged to each session holding them, so this
+        errs high; ``Session.memory_bytes`` with one ``seen`` set across
+        all sessions counts them once, but has to walk every message.
+        """
+        return self.total_bytes
+
+    def session_bytes(self, session_id: str) -> int | None:
+        """Estimated bytes one session's history holds, shared strings included."""
+        session = self.sessions.get(session_id)
+        return session.bytes if session is not None else None
+
+    def _remove(self, session_id: str) -> None:
+        self.total_bytes -= self.sessions.pop(session_id).bytes
+
+    def _expire(self, now: float) -> int:
+        cutoff = now - self.ttl_seconds
+        expired = 0
+        while self.sessions:
+            session_id, session = next(iter(self.sessions.items()))
+            if session.last_accessed >= cutoff:
+                break
+            self._remove(session_id)
+            expired += 1
+        return expired
+
+
+# ── Redis backend ──────────────────────────────────────────────────────────
+class RedisSessionStore(SessionStore):
+    """Store shared by all workers, backed by any Redis-protocol server.
+
+    Each session is a list of compact JSON messages with a native key TTL.
+    A sorted set indexed by last-access time keeps ``count`` cheap.
+    """
+
+    def __init__(self, url: str, ttl_seconds: int, key_prefix: str = "eredes:"):
+        self.ttl_seconds = ttl_seconds
+        # RESP2 keeps us compatible with every Redis-protocol server.
+        self._redis = redis.from_url(url, protocol=2)
+        self._prefix = f"{key_prefix}session:"
+        self._index = f"{key_prefix}sessions"
+
+    def _key(self, session_id: str) -> str:
+        return self._prefix + session_id
+
+    @staticmethod
+    def _encode(message: dict) -> str:
+        return json.dumps(message, ensure_ascii=False, separators=(",", ":"))
+
+    async def load(self, session_id: str) -> list[dict]:
+        key = self._key(session_id)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.lrange(key, 0, -1)
+            pipe.expire(key, self.ttl_seconds)
+            pipe.zadd(self._index, {session_id: time.time()}, xx=True)
+            raw, *_ = await pipe.execute()
+        return [json.loads(item) for item in raw]
+
+    async def append(
+        self, session_id: str, messages: list[dict], max_messages: int
+    ) -> None:
+        if not messages:
+            return
+        key = self._key(session_id)
+        encoded = [self._encode(m) for m in messages]
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.rpush(key, *encoded)
+            pipe.ltrim(key, -max_messages, -1)
+            pipe.expire(key, self.ttl_seconds)
+            pipe.zadd(self._index, {session_id: time.time()})
+            await pipe.execute()
+
+    async def replace_prefix(
+        self, session_id: str, old: list[dict], new: list[dict]
+    ) -> bool:
+        key = self._key(session_id)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            # Optimistic: EXEC fails if another worker touched the list.
+            await pipe.watch(key)
+            raw = await pipe.lrange(key, 0, len(old) - 1) if old else []
+            if [json.loads(item) for item in raw] != old:
+                await pipe.unwatch()
+                return False
+            pipe.multi()
+            pipe.ltrim(key, len(old), -1)
+            if new:
+                pipe.lpush(key, *reversed([self._encode(m) for m in new]))
+            pipe.expire(key, self.ttl_seconds)
+            try:
+                await pipe.execute()
+            except WatchError:
+                return False
+        return True
+
+    async def count(self) -> int:
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.zremrangebyscore(self._index, "-inf", time.time() - self.ttl_seconds)
+            pipe.zcard(self._index)
+            _, live = await pipe.execute()
+        return live
+
+    async def cleanup(self) -> int:
+        # Session keys expire on their own; only the index needs pruning.
+        return await self._redis.zremrangebyscore(
+            self._index, "-inf", time.time() - self.ttl_seconds
+        )
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+
+def create_session_store(
+    backend: str,
+    *,
+    ttl_seconds: int,
+    max_count: int,
+    redis_url: str,
+    max_bytes: int = 0,
+) -> SessionStore:
+    """Build the session store selected by ``SESSION_BACKEND``."""
+    if backend == "memory":
+        return MemorySessionStore(ttl_seconds, max_count, max_bytes=max_bytes)
+    if backend == "redis":
+        return RedisSessionStore(redis_url, ttl_seconds)
+    raise ValueError(f"Unknown session backend: {backend!r}")
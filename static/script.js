@@ -22,9 +22,10 @@ chatForm.addEventListener("submit", async (e) => {
   chatInput.disabled = true;
 
   const typingEl = showTyping();
+  let botContent = null;
 
   try {
-    const resp = await fetch("/api/chat", {
+    const resp = await fetch("/api/chat/stream", {
       method: "POST",
       headers: { "Content-Type": "application/json" },
       body: JSON.stringify({ session_id: sessionId, message }),
@@ -38,9 +39,34 @@ chatForm.addEventListener("submit", async (e) => {
       return;
     }
 
-    const data = await resp.json();
+    let reply = "";
+    await readEventStream(resp, (event, data) => {
+      if (event === "token") {
+        reply += data.text;
+        if (!botContent) {
+          removeTyping(typingEl);
+          botContent = appendMessage("", "bot");
+        }
+        botContent.innerHTML = formatMarkdown(escapeHtml(reply));
+        chatMessages.scrollTop = chatMessages.scrollHeight;
+      } else if (event === "tool") {
+        setTypingStatus(typingEl, "A consultar dados…");
+      } else if (event === "done") {
+        // The final reply is authoritative: tokens streamed before a tool
+        // round are not part of it.
+        reply = data.reply;
+        if (!botContent) {
+          removeTyping(typingEl);
+          botContent = appendMessage("", "bot");
+        }
+        botContent.innerHTML = formatMarkdown(escapeHtml(reply));
+        chatMessages.scrollTop = chatMessages.scrollHeight;
+      } else if (event === "error") {
+        removeTyping(typingEl);
+        appendMessage(data.detail, "bot");
+      }
+    });
     removeTyping(typingEl);
-    appendMessage(data.reply, "bot");
   } catch (err) {
     removeTyping(typingEl);
     appendMessage(
@@ -55,6 +81,33 @@ chatForm.addEventListener("submit", async (e) => {
   }
 });
 
+async function readEventStream(resp, onEvent) {
+  // Minimal SSE parser over fetch(): frames are separated by a blank line
+  const reader = resp.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let sep;
+    while ((sep = buffer.indexOf("\n\n")) !== -1) {
+      const frame = buffer.slice(0, sep);
+      buffer = buffer.slice(sep + 2);
+
+      let event = "message";
+      let data = "";
+      for (const line of frame.split("\n")) {
+        if (line.startsWith("event:")) event = line.slice(6).trim();
+        else if (line.startsWith("data:")) data += line.slice(5).trim();
+      }
+      if (data) onEvent(event, JSON.parse(data));
+    }
+  }
+}
+
 function appendMessage(text, sender) {
   const msgDiv = document.createElement("div");
   msgDiv.className = `message ${sender === "user" ? "user-message" : "bot-message"}`;
@@ -71,6 +124,7 @@ function appendMessage(text, sender) {
   msgDiv.appendChild(contentDiv);
   chatMessages.appendChild(msgDiv);
   chatMessages.scrollTop = chatMessages.scrollHeight;
+  return contentDiv;
 }
 
 function showTyping() {
@@ -83,6 +137,16 @@ function showTyping() {
   return typing;
 }
 
+function setTypingStatus(el, text) {
+  let status = el.querySelector(".typing-status");
+  if (!status) {
+    status = document.createElement("span");
+    status.className = "typing-status";
+    el.querySelector(".typing-indicator").appendChild(status);
+  }
+  status.textContent = text;
+}
+
 function removeTyping(el) {
   if (el && el.parentNode) {
     el.parentNode.removeChild(el);
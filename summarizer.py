@@ -0,0 +1,163 @@
+"""Background compaction of long conversations into a running summary.
+
+After a turn is saved, ``Summarizer.schedule`` checks the session in a
+background task: once the stored history passes a token or message
+threshold, every turn but the last ``keep_turns`` (including any earlier
+summary) is condensed by the LLM into one ``system`` message that takes
+their place. The request that triggered it has already been answered.
+The swap is optimistic: if the history changed underneath (a count trim,
+expiry) nothing is written and the next turn tries again. If the LLM call
+fails, the history stays as it was and the usual token-budget trimming
+applies.
+"""
+
+import asyncio
+import logging
+from collections import Counter
+from collections.abc import Awaitable, Callable
+
+import metrics
+from session_store import SessionStore
+from token_budget import estimate_prompt_tokens, split_turns
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PREFIX = "Resumo da conversa anterior com este cliente:\n"
+SUMMARY_INSTRUCTIONS = (
+    "Resume a conversa seguinte entre um cliente e a assistente da E-REDES, "
+    "em português de Portugal e em no máximo 150 palavras. Mantém as "
+    "localizações e códigos postais referidos, os dados concretos obtidos "
+    "(datas de reposição, percentagens, interrupções programadas), os pedidos "
+    "ainda sem resposta e a situação do cliente (por exemplo, equipamentos "
+    "médicos ou pessoas vulneráveis). Não acrescentes nada que não esteja na "
+    "conversa. Responde apenas com o resumo."
+)
+# Tool results are cut to this many characters in the transcript.
+TRANSCRIPT_TOOL_CHARS = 300
+
+
+def is_summary(message: dict) -> bool:
+    content = message.get("content") or ""
+    return message["role"] == "system" and content.startswith(SUMMARY_PREFIX)
+
+
+def render_transcript(messages: list[dict]) -> str:
+    """The messages as plain text for the summarization prompt."""
+    lines = []
+    for message in messages:
+        role, content = message["role"], message.get("content") or ""
+        if is_summary(message):
+            lines.append(f"Resumo anterior: {content[len(SUMMARY_PREFIX):]}")
+        elif role == "user":
+            lines.append(f"Cliente: {content}")
+        elif role == "tool":
+            lines.append(f"Dados: {content[:TRANSCRIPT_TOOL_CHARS]}")
+        elif role == "assistant":
+            for call in message.get("tool_calls") or ():
+                function = call["function"]
+                lines.append(f"Consulta: {function['name']}({function['arguments']})")
+            if content:
+                lines.append(f"Assistente: {content}")
+    return "\n".join(lines)
+
+
+class Summarizer:
+    """Schedules and runs one summarization at a time per session."""
+
+    def __init__(
+        self,
+        store: SessionStore,
+        complete: Callable[[list[dict]], Awaitable[str]],
+        trigger_tokens: int,
+        trigger_messages: int,
+        keep_turns: int = 2,
+        timeout: float = 20.0,
+        should_defer: Callable[[], bool] = lambda: False,
+    ):
+        self.store = store
+        self._complete = complete
+        self.trigger_tokens = trigger_tokens
+        self.trigger_messages = trigger_messages
+        self.keep_turns = keep_turns
+        self.timeout = timeout
+        self._should_defer = should_defer
+        self._tasks: dict[str, asyncio.Task] = {}
+        self.outcomes: Counter[str] = Counter()
+
+    def needs_summary(self, history: list[dict]) -> bool:
+        return (
+            len(history) >= self.trigger_messages
+            or estimate_prompt_tokens(history) >= self.trigger_tokens
+        )
+
+    def schedule(self, session_id: str) -> None:
+        """Check ``session_id`` in the background unless a check is running."""
+        if session_id in self._tasks:
+            return
+        task = asyncio.create_task(self._run(session_id))
+        self._tasks[session_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(session_id, None))
+
+    async def _run(self, session_id: str) -> None:
+        try:
+            history = await self.store.load(session_id)
+            if not self.needs_summary(history):
+                return
+            if self._should_defer():
+                self._record("deferred")
+                return
+            turns = split_turns(history)
+            if len(turns) <= self.keep_turns:
+                return
+            recent = sum(len(t) for t in turns[-self.keep_turns :])
+            older = history[: len(history) - recent]
+            async with asyncio.timeout(self.timeout):
+                summary = await self._summarize(older)
+        except Exception as e:
+            logger.warning(
+                "summary_failed",
+                extra={"session_id": session_id, "error": f"{type(e).__name__}: {e}"},
+            )
+            self._record("error")
+            return
+
+        message = {"role": "system", "content": SUMMARY_PREFIX + summary}
+        if await self.store.replace_prefix(session_id, older, [message]):
+            logger.info(
+                "summary_stored",
+                extra={
+                    "session_id": session_id,
+                    "replaced_messages": len(older),
+                    "summary_length": len(summary),
+                },
+            )
+            self._record("ok")
+        else:
+            self._record("conflict")
+
+    async def _summarize(self, messages: list[dict]) -> str:
+        summary = (
+            await self._complete(
+                [
+                    {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+                    {"role": "user", "content": render_transcript(messages)},
+                ]
+            )
+        ).strip()
+        if not summary:
+            raise ValueError("empty summary")
+        return summary
+
+    def _record(self, outcome: str) -> None:
+        self.outcomes[outcome] += 1
+        metrics.SUMMARIES.labels(outcome).inc()
+
+    async def close(self) -> None:
+        """Cancel the summaries still running."""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {"running": len(self._tasks), **self.outcomes}
@@ -0,0 +1,152 @@
+"""Minimal OpenAI-compatible chat completions server for tests.
+
+Serves ``POST /v1/chat/completions`` (plain and streamed) over keep-alive
+HTTP/1.1 on top of ``asyncio.start_server``, with configurable latency,
+``x-ratelimit-*`` headers and scripted error responses.
+"""
+
+import asyncio
+import json
+
+
+class FakeHTTPServer:
+    """Keep-alive HTTP/1.1 loop; subclasses implement ``_route``."""
+
+    path = ""
+
+    def __init__(self):
+        self._server = None
+
+    async def __aenter__(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{self.port}{self.path}"
+        return self
+
+    async def __aexit__(self, *exc):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _route(
+        self, method: str, target: str, body: bytes
+    ) -> tuple[int, dict[str, str], bytes]:
+        raise NotImplementedError
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode().split(" ", 2)
+                length = 0
+                while (line := await reader.readline()) not in (b"\r\n", b""):
+                    name, _, value = line.decode().partition(":")
+                    if name.strip().lower() == "content-length":
+                        length = int(value)
+                body = await reader.readexactly(length)
+
+                status, headers, body = await self._route(method, target, body)
+                head = [f"HTTP/1.1 {status} Fake", f"content-length: {len(body)}"]
+                head += [f"{k}: {v}" for k, v in headers.items()]
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + body)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+class FakeOpenAIServer(FakeHTTPServer):
+    path = "/v1"
+
+    def __init__(self, reply: str = "Olá", latency: float = 0.0, headers=None):
+        super().__init__()
+        self.reply = reply
+        self.latency = latency
+        self.headers: dict[str, str] = dict(headers or {})
+        self.requests: list[dict] = []
+        self._scripted: list[tuple[int, dict[str, str]]] = []
+
+    def fail_next(self, status: int, headers=None, times: int = 1) -> None:
+        """Answer the next ``times`` requests with an error ``status``."""
+        self._scripted.extend([(status, dict(headers or {}))] * times)
+
+    # ── Responses ──────────────────────────────────────────────────────────
+    def _latency(self) -> float:
+        return self.latency
+
+    def _error(self, payload: dict) -> tuple[int, dict[str, str]] | None:
+        """The error to answer ``payload`` with, if any."""
+        return self._scripted.pop(0) if self._scripted else None
+
+    def _message(self, payload: dict) -> dict:
+        """The assistant message answering ``payload``."""
+        return {"role": "assistant", "content": self.reply}
+
+    def _completion(self, model: str, message: dict) -> dict:
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": 0,
+            "model": model,
+            "choices": [
+                {
+                    "index": 0,
+                    "message": message,
+                    "finish_reason": (
+                        "tool_calls" if "tool_calls" in message else "stop"
+                    ),
+                }
+            ],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12},
+        }
+
+    def _stream(self, model: str, message: dict) -> bytes:
+        chunk = {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion.chunk",
+            "created": 0,
+            "model": model,
+        }
+        if "tool_calls" in message:
+            delta = {
+                "tool_calls": [
+                    {"index": i, **call} for i, call in enumerate(message["tool_calls"])
+                ]
+            }
+            finish_reason = "tool_calls"
+        else:
+            delta = {"content": message["content"]}
+            finish_reason = "stop"
+        frames = [
+            {**chunk, "choices": [{"index": 0, "delta": delta}]},
+            {
+                **chunk,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}],
+            },
+        ]
+        body = "".join(f"data: {json.dumps(f)}\n\n" for f in frames)
+        return (body + "data: [DONE]\n\n").encode()
+
+    def _respond(self, payload: dict) -> tuple[int, dict[str, str], bytes]:
+        headers = dict(self.headers)
+        error = self._error(payload)
+        if error is not None:
+            status, extra = error
+            body = {"error": {"message": f"fake error {status}", "type": "fake"}}
+            return status, {**headers, **extra}, json.dumps(body).encode()
+        message = self._message(payload)
+        if payload.get("stream"):
+            headers["content-type"] = "text/event-stream"
+            return 200, headers, self._stream(payload["model"], message)
+        headers["content-type"] = "application/json"
+        body = self._completion(payload["model"], message)
+        return 200, headers, json.dumps(body).encode()
+
+    async def _route(self, method, target, body):
+        payload = json.loads(body or b"{}")
+        self.requests.append(payload)
+        if latency := self._latency():
+            await asyncio.sleep(latency)
+        return self._respond(payload)
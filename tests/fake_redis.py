@@ -0,0 +1,332 @@
+"""Minimal in-process Redis (RESP2) stand-in for tests.
+
+Implements just the commands the session store uses, including
+MULTI/EXEC with WATCH and key expiry, on top of ``asyncio.start_server``.
+A test registers a handler for each script it runs in ``scripts`` (source
+-> handler), and EVAL/EVALSHA call it: a Python port of the script, or
+``lua_handler(source)``, which runs the script itself when ``lupa`` is
+installed.
+"""
+
+import asyncio
+import fnmatch
+import hashlib
+import time
+from collections.abc import Callable
+
+
+class _NoScript(Exception):
+    code = "NOSCRIPT"
+
+
+def lua_handler(source: str) -> Callable:
+    """A ``scripts`` handler running ``source`` in Lua through ``lupa``.
+
+    ``redis.call`` dispatches to the fake server, with Redis's conversions:
+    numbers become strings, nil bulk replies become ``false``, and returned
+    Lua numbers are truncated to integers.
+    """
+    import lupa
+
+    lua = lupa.LuaRuntime(encoding=None)
+    script = lua.eval(f"function(KEYS, ARGV, redis) {source} end")
+
+    def to_redis(value) -> bytes:
+        if isinstance(value, bytes):
+            return value
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        return str(value).encode()
+
+    def to_lua(value):
+        if isinstance(value, Exception):
+            raise value
+        if value is None:
+            return False
+        if isinstance(value, list):
+            return lua.table_from([to_lua(v) for v in value])
+        return value
+
+    def to_python(value):
+        if lupa.lua_type(value) == "table":
+            return [to_python(value[i]) for i in range(1, len(value) + 1)]
+        if isinstance(value, float):
+            return int(value)
+        return value
+
+    def run(server, keys, args):
+        def call(command, *arguments):
+            return to_lua(
+                server._dispatch([command.upper(), *(to_redis(a) for a in arguments)])
+            )
+
+        redis = lua.table_from({b"call": call})
+        return to_python(script(lua.table_from(keys), lua.table_from(args), redis))
+
+    return run
+
+
+class FakeRedisServer:
+    def __init__(self):
+        self.data: dict[bytes, object] = {}
+        self.expires: dict[bytes, float] = {}
+        self.commands: list[bytes] = []
+        self.connections = 0
+        # Script source -> handler(server, keys, args), run atomically.
+        self.scripts: dict[str, Callable] = {}
+        self._loaded: dict[bytes, str] = {}
+        self._server = None
+
+    async def __aenter__(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self.url = f"redis://127.0.0.1:{self.port}/0"
+        return self
+
+    async def __aexit__(self, *exc):
+        self._server.close()
+        await self._server.wait_closed()
+
+    # ── Protocol ───────────────────────────────────────────────────────────
+    async def _read_command(self, reader) -> list[bytes]:
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError
+        assert line.startswith(b"*"), line
+        args = []
+        for _ in range(int(line[1:])):
+            size = int((await reader.readline())[1:])
+            args.append((await reader.readexactly(size + 2))[:-2])
+        return args
+
+    @staticmethod
+    def _encode(value) -> bytes:
+        if value is None:
+            return b"$-1\r\n"
+        if isinstance(value, Exception):
+            code = getattr(value, "code", "ERR")
+            return f"-{code} {value}\r\n".encode()
+        if isinstance(value, str):
+            return b"+" + value.encode() + b"\r\n"
+        if isinstance(value, int):
+            return b":" + str(value).encode() + b"\r\n"
+        if isinstance(value, bytes):
+            return b"$" + str(len(value)).encode() + b"\r\n" + value + b"\r\n"
+        if isinstance(value, list):
+            return b"*" + str(len(value)).encode() + b"\r\n" + b"".join(
+                FakeRedisServer._encode(v) for v in value
+            )
+        raise TypeError(value)
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        queued: list[list[bytes]] | None = None
+        # Watched key -> its value when WATCH was sent.
+        watched: dict[bytes, object] = {}
+        try:
+            while True:
+                args = await self._read_command(reader)
+                name = args[0].upper()
+                self.commands.append(name)
+                if name == b"WATCH":
+                    for key in args[1:]:
+                        watched[key] = self._snapshot(key)
+                    reply = "OK"
+                elif name == b"UNWATCH":
+                    watched.clear()
+                    reply = "OK"
+                elif name == b"MULTI":
+                    queued = []
+                    reply = "OK"
+                elif name == b"EXEC":
+                    if any(self._snapshot(k) != v for k, v in watched.items()):
+                        reply = None  # aborted: a watched key changed
+                    else:
+                        reply = [self._dispatch(cmd) for cmd in queued or []]
+                    queued = None
+                    watched.clear()
+                elif name == b"DISCARD":
+                    queued = None
+                    watched.clear()
+                    reply = "OK"
+                elif queued is not None:
+                    queued.append(args)
+                    reply = "QUEUED"
+                else:
+                    reply = self._dispatch(args)
+                writer.write(self._encode(reply))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    # ── Commands ───────────────────────────────────────────────────────────
+    def _alive(self, key: bytes) -> bool:
+        deadline = self.expires.get(key)
+        if deadline is not None and deadline <= time.time():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+    def _snapshot(self, key: bytes):
+        if not self._alive(key):
+            return None
+        value = self.data[key]
+        return list(value) if isinstance(value, list) else dict(value)
+
+    def _dispatch(self, args: list[bytes]):
+        name, *rest = args
+        handler = getattr(self, "cmd_" + name.decode().lower(), None)
+        if handler is None:
+            return Exception(f"unknown command '{name.decode()}'")
+        try:
+            return handler(*rest)
+        except Exception as e:  # surfaced to the client as -ERR
+            return e
+
+    def cmd_ping(self, *args):
+        return "PONG"
+
+    def cmd_client(self, *args):
+        return "OK"
+
+    def cmd_select(self, db):
+        return "OK"
+
+    def cmd_del(self, *keys):
+        removed = 0
+        for key in keys:
+            if self._alive(key):
+                del self.data[key]
+                self.expires.pop(key, None)
+                removed += 1
+        return removed
+
+    def cmd_exists(self, *keys):
+        return sum(1 for key in keys if self._alive(key))
+
+    def cmd_expire(self, key, seconds):
+        if not self._alive(key):
+            return 0
+        self.expires[key] = time.time() + int(seconds)
+        return 1
+
+    def cmd_ttl(self, key):
+        if not self._alive(key):
+            return -2
+        deadline = self.expires.get(key)
+        return -1 if deadline is None else int(deadline - time.time())
+
+    def cmd_keys(self, pattern):
+        return [
+            key
+            for key in list(self.data)
+            if self._alive(key) and fnmatch.fnmatchcase(key, pattern)
+        ]
+
+    def cmd_rpush(self, key, *values):
+        self._alive(key)
+        items = self.data.setdefault(key, [])
+        items.extend(values)
+        return len(items)
+
+    def cmd_script(self, subcommand, *args):
+        if subcommand.upper() == b"LOAD":
+            sha = hashlib.sha1(args[0]).hexdigest().encode()
+            self._loaded[sha] = args[0].decode()
+            return sha
+        if subcommand.upper() == b"EXISTS":
+            return [int(sha in self._loaded) for sha in args]
+        raise ValueError(f"unsupported SCRIPT {subcommand.decode()}")
+
+    def cmd_eval(self, script, numkeys, *rest):
+        sha = self.cmd_script(b"LOAD", script)
+        return self.cmd_evalsha(sha, numkeys, *rest)
+
+    def cmd_evalsha(self, sha, numkeys, *rest):
+        source = self._loaded.get(sha)
+        if source is None:
+            raise _NoScript("No matching script. Please use EVAL.")
+        handler = self.scripts.get(source)
+        if handler is None:
+            raise ValueError("no Python port registered for this script")
+        numkeys = int(numkeys)
+        return handler(self, list(rest[:numkeys]), list(rest[numkeys:]))
+
+    def cmd_hset(self, key, *pairs):
+        self._alive(key)
+        fields = self.data.setdefault(key, {})
+        added = sum(1 for field in pairs[::2] if field not in fields)
+        fields.update(zip(pairs[::2], pairs[1::2]))
+        return added
+
+    def cmd_hmget(self, key, *fields):
+        values = self.data[key] if self._alive(key) else {}
+        return [values.get(field) for field in fields]
+
+    def cmd_pexpire(self, key, milliseconds):
+        if not self._alive(key):
+            return 0
+        self.expires[key] = time.time() + int(milliseconds) / 1000
+        return 1
+
+    def cmd_lpush(self, key, *values):
+        self._alive(key)
+        items = self.data.setdefault(key, [])
+        items[:0] = reversed(values)
+        return len(items)
+
+    def cmd_lrange(self, key, start, stop):
+        if not self._alive(key):
+            return []
+        items = self.data[key]
+        start, stop = int(start), int(stop)
+        n = len(items)
+        start = max(start + n if start < 0 else start, 0)
+        stop = stop + n if stop < 0 else stop
+        return items[start : stop + 1]
+
+    def cmd_ltrim(self, key, start, stop):
+        if self._alive(key):
+            kept = self.cmd_lrange(key, start, stop)
+            if kept:
+                self.data[key] = kept
+            else:
+                del self.data[key]
+        return "OK"
+
+    def cmd_llen(self, key):
+        return len(self.data[key]) if self._alive(key) else 0
+
+    def cmd_zadd(self, key, *args):
+        flags = set()
+        while args and args[0].upper() in (b"XX", b"NX", b"CH", b"GT", b"LT"):
+            flags.add(args[0].upper())
+            args = args[1:]
+        self._alive(key)
+        zset = self.data.setdefault(key, {})
+        added = 0
+        for score, member in zip(args[::2], args[1::2]):
+            exists = member in zset
+            if (b"XX" in flags and not exists) or (b"NX" in flags and exists):
+                continue
+            added += not exists
+            zset[member] = float(score)
+        if not zset:
+            del self.data[key]
+        return added
+
+    def cmd_zcard(self, key):
+        return len(self.data[key]) if self._alive(key) else 0
+
+    def cmd_zremrangebyscore(self, key, low, high):
+        if not self._alive(key):
+            return 0
+        low = float("-inf") if low == b"-inf" else float(low)
+        high = float("inf") if high == b"+inf" else float(high)
+        zset = self.data[key]
+        doomed = [m for m, s in zset.items() if low <= s <= high]
+        for member in doomed:
+            del zset[member]
+        return len(doomed)
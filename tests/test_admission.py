@@ -0,0 +1,110 @@
+"""Tests for global admission control and the urgent lane."""
+
+import asyncio
+
+import pytest
+
+from admission import NORMAL, URGENT, AdmissionController, OverloadedError, priority_for
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        "Há cabos caídos na minha rua!",
+        "um poste elétrico partido em frente a casa",
+        "O meu pai depende de equipamento médico, o que faço?",
+        "já liguei para o 112",
+        "sinto cheiro a queimado no quadro",
+    ],
+)
+def test_danger_messages_are_urgent(message):
+    assert priority_for(message) == URGENT
+
+
+def test_ordinary_messages_are_normal():
+    assert priority_for("Quando volta a luz em Leiria?") == NORMAL
+    assert priority_for("O código postal 1120-001 tem avarias?") == NORMAL
+
+
+async def _hold(controller, release, priority=NORMAL, order=None, name=None):
+    async with controller.slot(priority):
+        if order is not None:
+            order.append(name)
+        await release.wait()
+
+
+@pytest.mark.anyio
+async def test_urgent_turns_jump_the_queue():
+    controller = AdmissionController(max_concurrent=1, max_queue=10)
+    release = asyncio.Event()
+    release.set()
+    gate = asyncio.Event()
+    order = []
+
+    holder = asyncio.create_task(_hold(controller, gate))
+    await asyncio.sleep(0)
+    waiters = [
+        asyncio.create_task(_hold(controller, release, p, order, name))
+        for name, p in [("a", NORMAL), ("b", NORMAL), ("u", URGENT)]
+    ]
+    await asyncio.sleep(0)
+    assert controller.stats()["queued"] == {"urgent": 1, "normal": 2}
+
+    gate.set()
+    await asyncio.gather(holder, *waiters)
+    assert order == ["u", "a", "b"]
+    assert controller.in_flight == 0
+
+
+@pytest.mark.anyio
+async def test_full_queue_sheds_and_urgent_displaces_newest_normal():
+    controller = AdmissionController(max_concurrent=1, max_queue=2)
+    gate = asyncio.Event()
+    holder = asyncio.create_task(_hold(controller, gate))
+    await asyncio.sleep(0)
+    first = asyncio.create_task(_hold(controller, gate))
+    newest = asyncio.create_task(_hold(controller, gate))
+    await asyncio.sleep(0)
+
+    with pytest.raises(OverloadedError) as exc:
+        await _hold(controller, gate)
+    assert exc.value.retry_after >= 1
+
+    urgent = asyncio.create_task(_hold(controller, gate, URGENT))
+    with pytest.raises(OverloadedError):
+        await newest
+    gate.set()
+    await asyncio.gather(holder, first, urgent)
+    assert controller.stats()["shed"] == {"queue_full": 1, "displaced": 1}
+
+
+@pytest.mark.anyio
+async def test_turns_that_cannot_finish_by_the_deadline_are_shed():
+    controller = AdmissionController(max_concurrent=1, max_queue=10)
+    controller.service_ewma = 2.0
+    gate = asyncio.Event()
+    holder = asyncio.create_task(_hold(controller, gate))
+    await asyncio.sleep(0)
+    loop = asyncio.get_running_loop()
+
+    # Expected wait 2 s + 2 s of work does not fit in 3 s: shed up front.
+    with pytest.raises(OverloadedError) as exc:
+        async with controller.slot(NORMAL, deadline=loop.time() + 3):
+            pass
+    assert exc.value.retry_after == pytest.approx(2.0)
+
+    # Fits on paper, but the slot does not free up in time.
+    controller.service_ewma = 0.01
+    with pytest.raises(OverloadedError):
+        async with controller.slot(NORMAL, deadline=loop.time() + 0.05):
+            pass
+    assert controller.stats()["shed"] == {"deadline": 1, "timeout": 1}
+    assert controller.queued == 0
+
+    gate.set()
+    await holder
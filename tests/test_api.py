@@ -1,9 +1,32 @@
 """Integration tests for FastAPI endpoints."""
 
+import asyncio
+import json
+from types import SimpleNamespace
+
+import httpx
+import openai
 import pytest
 from httpx import ASGITransport, AsyncClient
 
+import app as app_module
+import fast_path
+import session_store
+import tracing
+from admission import AdmissionController
 from app import app
+from llm_router import Backend, LLMRouter
+from rate_limit import (
+    FAST_PATH,
+    LLM,
+    MemoryRateLimitStore,
+    Rate,
+    RateLimiter,
+    parse_networks,
+)
+from resilience import CircuitBreaker
+from response_cache import ResponseCache
+from system_prompt import SYSTEM_PROMPT
 
 
 @pytest.fixture
@@ -11,6 +34,20 @@ def anyio_backend():
     return "asyncio"
 
 
+@pytest.fixture(autouse=True)
+def _reset_rate_limit():
+    # Every test client shares one address; keep tests from starving each other.
+    app_module.limiter.store = MemoryRateLimitStore()
+
+
+@pytest.fixture(autouse=True)
+def response_cache(monkeypatch):
+    # Tests reuse opening questions; each starts with an empty cache.
+    fresh = ResponseCache(max_entries=100, ttl=300, max_entry_bytes=64 * 1024)
+    monkeypatch.setattr(app_module, "response_cache", fresh)
+    return fresh
+
+
 @pytest.fixture
 async def client():
     transport = ASGITransport(app=app)
@@ -26,6 +63,7 @@ async def test_health_endpoint(client):
     assert data["status"] == "healthy"
     assert "groq_configured" in data
     assert "active_sessions" in data
+    assert "eredes_pool" in data
 
 
 @pytest.mark.anyio
@@ -60,3 +98,746 @@ async def test_message_too_long_rejected(client):
         json={"session_id": "test-session", "message": "x" * 2001},
     )
     assert resp.status_code == 422
+
+
+# ── Streaming endpoint ─────────────────────────────────────────────────────
+def _chunk(content=None, tool_calls=None):
+    delta = SimpleNamespace(content=content, tool_calls=tool_calls)
+    return SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+
+def _tool_delta(index, id=None, name=None, arguments=None):
+    return SimpleNamespace(
+        index=index,
+        id=id,
+        function=SimpleNamespace(name=name, arguments=arguments),
+    )
+
+
+class _FakeStreamingClient:
+    """Replays scripted chunk lists, one per completions.create call."""
+
+    def __init__(self, turns):
+        self._turns = list(turns)
+        self.calls = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, **kwargs):
+        self.calls.append(kwargs)
+        chunks = self._turns.pop(0)
+
+        async def gen():
+            for c in chunks:
+                yield c
+
+        return gen()
+
+
+def _use_llm(monkeypatch, fake, breaker=None):
+    """Route LLM calls to ``fake`` (anything with ``chat.completions.create``)."""
+    backend = Backend("test", "test-model", fake, breaker=breaker)
+    monkeypatch.setattr(app_module, "router", LLMRouter([backend]))
+
+
+def _parse_sse(body: str) -> list[tuple[str, dict]]:
+    events = []
+    for frame in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in frame.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+@pytest.mark.anyio
+async def test_chat_stream_tokens_and_tools(client, monkeypatch):
+    fake = _FakeStreamingClient(
+        [
+            [
+                _chunk(tool_calls=[_tool_delta(0, id="call_1", name="resumo_")]),
+                _chunk(tool_calls=[_tool_delta(0, name="nacional_tempestade")]),
+                _chunk(tool_calls=[_tool_delta(0, arguments="{}")]),
+            ],
+            [_chunk("Olá"), _chunk(", "), _chunk("mundo")],
+        ]
+    )
+    _use_llm(monkeypatch, fake)
+
+    resp = await client.post(
+        "/api/chat/stream",
+        json={"session_id": "stream-ok", "message": "Pode dar-me o resumo nacional?"},
+    )
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/event-stream")
+
+    events = _parse_sse(resp.text)
+    assert events[0] == ("tool", {"name": "resumo_nacional_tempestade"})
+    assert [d["text"] for e, d in events if e == "token"] == ["Olá", ", ", "mundo"]
+    assert events[-1] == ("done", {"reply": "Olá, mundo", "session_id": "stream-ok"})
+    assert all(call["stream"] for call in fake.calls)
+
+    history = await app_module.get_session("stream-ok")
+    assert [m["role"] for m in history] == [
+        "system",
+        "user",
+        "assistant",
+        "tool",
+        "assistant",
+    ]
+    assert history[2]["tool_calls"][0]["id"] == "call_1"
+    assert history[-1]["content"] == "Olá, mundo"
+
+
+@pytest.mark.anyio
+async def test_chat_stream_error_rolls_back_session(client, monkeypatch):
+    async def failing_create(**kwargs):
+        raise RuntimeError("boom")
+
+    fake = SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=failing_create))
+    )
+    _use_llm(monkeypatch, fake)
+
+    resp = await client.post(
+        "/api/chat/stream",
+        json={"session_id": "stream-err", "message": "Olá"},
+    )
+    events = _parse_sse(resp.text)
+    assert events[-1][0] == "error"
+    assert [m["role"] for m in await app_module.get_session("stream-err")] == [
+        "system"
+    ]
+
+
+# ── Concurrent tool calls ──────────────────────────────────────────────────
+def _tool_call(call_id, name, arguments="{}"):
+    return {
+        "id": call_id,
+        "type": "function",
+        "function": {"name": name, "arguments": arguments},
+    }
+
+
+@pytest.mark.anyio
+async def test_tool_calls_run_concurrently_in_order(monkeypatch):
+    running = 0
+    peak = 0
+
+    async def fake_handle(name, arguments):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.05 if name == "slow" else 0.01)
+        running -= 1
+        return json.dumps({"tool": name})
+
+    monkeypatch.setattr(app_module, "handle_tool_call", fake_handle)
+    monkeypatch.setattr(app_module.settings, "tool_concurrency", 2)
+
+    replies = await app_module._run_tool_calls(
+        [
+            _tool_call("a", "slow"),
+            _tool_call("b", "fast"),
+            _tool_call("c", "fast"),
+        ]
+    )
+
+    assert [r["tool_call_id"] for r in replies] == ["a", "b", "c"]
+    assert json.loads(replies[0]["content"]) == {"tool": "slow"}
+    assert peak == 2
+
+
+@pytest.mark.anyio
+async def test_tool_call_errors_become_tool_messages(monkeypatch):
+    async def fake_handle(name, arguments):
+        if name == "hang":
+            await asyncio.sleep(1)
+        return "{}"
+
+    monkeypatch.setattr(app_module, "handle_tool_call", fake_handle)
+    monkeypatch.setattr(app_module.settings, "tool_timeout_seconds", 0.01)
+
+    replies = await app_module._run_tool_calls(
+        [
+            _tool_call("a", "resumo_nacional_tempestade", "{not json"),
+            _tool_call("b", "hang"),
+            _tool_call("c", "ok"),
+        ]
+    )
+
+    assert [r["role"] for r in replies] == ["tool"] * 3
+    assert "Argumentos inválidos" in json.loads(replies[0]["content"])["erro"]
+    assert "tempo limite" in json.loads(replies[1]["content"])["erro"]
+    assert replies[2]["content"] == "{}"
+
+
+# ── Fast path ──────────────────────────────────────────────────────────────
+@pytest.mark.anyio
+async def test_fast_path_answers_without_llm(client, monkeypatch):
+    monkeypatch.setattr(app_module, "router", None)
+
+    resp = await client.post(
+        "/api/chat",
+        json={"session_id": "fast-1", "message": "2400-001"},
+    )
+    assert resp.status_code == 200
+    assert "Leiria" in resp.json()["reply"]
+
+    history = await app_module.get_session("fast-1")
+    assert [m["role"] for m in history] == [
+        "system",
+        "user",
+        "assistant",
+        "tool",
+        "assistant",
+    ]
+    assert history[3]["tool_call_id"] == history[2]["tool_calls"][0]["id"]
+
+
+@pytest.mark.anyio
+async def test_unrenderable_fast_path_answer_falls_back_to_llm(client, monkeypatch):
+    def bad_date(text):
+        raise ValueError(f"invalid date {text!r}")
+
+    monkeypatch.setattr(fast_path, "_date", bad_date)
+    fake = _ScriptedClient([_completion("Leiria ainda tem cortes.")])
+    _use_llm(monkeypatch, fake)
+
+    resp = await client.post(
+        "/api/chat", json={"session_id": "fast-3", "message": "Leiria"}
+    )
+    assert resp.status_code == 200
+    assert resp.json()["reply"] == "Leiria ainda tem cortes."
+    assert fake.calls == 1
+
+
+@pytest.mark.anyio
+async def test_non_location_message_skips_fast_path(client, monkeypatch):
+    monkeypatch.setattr(app_module, "router", None)
+
+    resp = await client.post(
+        "/api/chat",
+        json={"session_id": "fast-2", "message": "Tenho cabos caídos na rua"},
+    )
+    assert resp.status_code == 503
+
+
+# ── Groq resilience ────────────────────────────────────────────────────────
+def _groq_error(cls, status, headers=None):
+    request = httpx.Request("POST", "https://groq.test/v1/chat/completions")
+    response = httpx.Response(status, headers=headers, request=request)
+    return cls(f"Error code: {status}", response=response, body=None)
+
+
+class _ScriptedClient:
+    """completions.create raises or returns the scripted outcomes in order."""
+
+    def __init__(self, outcomes):
+        self._outcomes = list(outcomes)
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, **kwargs):
+        self.calls += 1
+        outcome = self._outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def _completion(text):
+    message = SimpleNamespace(content=text, tool_calls=None)
+    return SimpleNamespace(
+        choices=[SimpleNamespace(finish_reason="stop", message=message)],
+        usage=None,
+    )
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    fresh = CircuitBreaker("groq", min_calls=2, window=2, cooldown_seconds=30)
+    monkeypatch.setattr(app_module.settings, "groq_retry_base_seconds", 0.001)
+    monkeypatch.setattr(app_module.settings, "groq_retry_max_seconds", 0.002)
+    return fresh
+
+
+@pytest.mark.anyio
+async def test_transient_errors_are_retried(client, monkeypatch, breaker):
+    fake = _ScriptedClient(
+        [_groq_error(openai.InternalServerError, 503), _completion("Olá")]
+    )
+    _use_llm(monkeypatch, fake, breaker)
+
+    resp = await client.post(
+        "/api/chat", json={"session_id": "retry-1", "message": "Olá"}
+    )
+    assert resp.status_code == 200
+    assert resp.json()["reply"] == "Olá"
+    assert fake.calls == 2
+
+
+@pytest.mark.anyio
+async def test_rate_limit_honours_retry_after_within_deadline(
+    client, monkeypatch, breaker
+):
+    fake = _ScriptedClient(
+        [
+            _groq_error(openai.RateLimitError, 429, {"retry-after": "0.01"}),
+            _completion("Olá"),
+        ]
+    )
+    _use_llm(monkeypatch, fake, breaker)
+    resp = await client.post(
+        "/api/chat", json={"session_id": "rl-1", "message": "Olá"}
+    )
+    assert resp.status_code == 200
+    assert fake.calls == 2
+
+    # A Retry-After longer than the remaining deadline is not waited out.
+    fake = _ScriptedClient(
+        [_groq_error(openai.RateLimitError, 429, {"retry-after": "120"})]
+    )
+    _use_llm(monkeypatch, fake, breaker)
+    resp = await client.post(
+        "/api/chat", json={"session_id": "rl-2", "message": "Bom dia"}
+    )
+    assert resp.status_code == 429
+    assert resp.headers["retry-after"] == "120"
+    assert fake.calls == 1
+    assert breaker.state == "closed"
+
+
+@pytest.mark.anyio
+async def test_open_circuit_fails_fast(client, monkeypatch, breaker):
+    fake = _ScriptedClient(
+        [_groq_error(openai.InternalServerError, 500) for _ in range(3)]
+    )
+    _use_llm(monkeypatch, fake, breaker)
+
+    resp = await client.post(
+        "/api/chat", json={"session_id": "cb-1", "message": "Olá"}
+    )
+    assert resp.status_code == 503
+    assert fake.calls == 2  # the breaker opened before the last retry
+    assert int(resp.headers["retry-after"]) == 30
+
+    resp = await client.post(
+        "/api/chat/stream", json={"session_id": "cb-1", "message": "Olá"}
+    )
+    event, data = _parse_sse(resp.text)[-1]
+    assert event == "error" and data["status"] == 503
+    assert fake.calls == 2
+    health = (await client.get("/health")).json()
+    assert health["llm"]["backends"][0]["circuit"]["state"] == "open"
+
+
+# ── Per-session serialization ──────────────────────────────────────────────
+class _SlowClient:
+    """Answers after ``delay``, echoing how many messages the prompt had."""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.prompts = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, **kwargs):
+        self.prompts.append(list(kwargs["messages"]))
+        await asyncio.sleep(self.delay)
+        return _completion(f"resposta {len(self.prompts)}")
+
+
+@pytest.mark.anyio
+async def test_duplicate_messages_share_one_llm_call(client, monkeypatch):
+    fake = _SlowClient()
+    _use_llm(monkeypatch, fake)
+    body = {"session_id": "dup-1", "message": "Quando volta a luz na minha rua?"}
+
+    first, second, streamed = await asyncio.gather(
+        client.post("/api/chat", json=body),
+        client.post("/api/chat", json={**body, "message": body["message"].upper()}),
+        client.post("/api/chat/stream", json=body),
+    )
+    assert first.json()["reply"] == second.json()["reply"] == "resposta 1"
+    assert _parse_sse(streamed.text)[-1] == (
+        "done",
+        {"reply": "resposta 1", "session_id": "dup-1"},
+    )
+    assert len(fake.prompts) == 1
+    # The turn is stored once.
+    assert len(await app_module.session_store.load("dup-1")) == 2
+
+
+@pytest.mark.anyio
+async def test_concurrent_turns_of_a_session_are_serialized(client, monkeypatch):
+    fake = _SlowClient()
+    _use_llm(monkeypatch, fake)
+
+    await asyncio.gather(
+        *(
+            client.post("/api/chat", json={"session_id": "ser-1", "message": text})
+            for text in ("Primeira pergunta?", "Segunda pergunta?")
+        )
+    )
+    # The second turn saw the first one's question and answer.
+    assert len(fake.prompts[1]) == len(fake.prompts[0]) + 2
+    history = await app_module.session_store.load("ser-1")
+    assert [m["role"] for m in history] == ["user", "assistant"] * 2
+
+
+@pytest.mark.anyio
+async def test_fast_path_message_waits_for_the_turn_in_flight(client, monkeypatch):
+    fake = _SlowClient()
+    _use_llm(monkeypatch, fake)
+
+    async def fast_path_message():
+        await asyncio.sleep(0.01)  # sent while the LLM turn is running
+        return await client.post(
+            "/api/chat", json={"session_id": "ser-2", "message": "Leiria"}
+        )
+
+    await asyncio.gather(
+        client.post(
+            "/api/chat", json={"session_id": "ser-2", "message": "Primeira pergunta?"}
+        ),
+        fast_path_message(),
+    )
+    history = await app_module.session_store.load("ser-2")
+    assert [m["content"] for m in history if m["role"] == "user"] == [
+        "Primeira pergunta?",
+        "Leiria",
+    ]
+    assert history[1] == {"role": "assistant", "content": "resposta 1"}
+
+
+@pytest.mark.anyio
+async def test_too_many_pending_turns_are_rejected(client, monkeypatch):
+    _use_llm(monkeypatch, _SlowClient())
+    monkeypatch.setattr(app_module.session_locks, "max_queued", 1)
+
+    responses = await asyncio.gather(
+        *(
+            client.post(
+                "/api/chat", json={"session_id": "busy-1", "message": f"Pergunta {i}?"}
+            )
+            for i in range(3)
+        )
+    )
+    assert sorted(r.status_code for r in responses) == [200, 200, 429]
+
+
+# ── First-turn response cache ──────────────────────────────────────────────
+@pytest.mark.anyio
+async def test_first_turn_is_answered_once_per_question(client, monkeypatch):
+    fake = _SlowClient()
+    _use_llm(monkeypatch, fake)
+    question = "Como contacto a E-REDES?"
+
+    first, second, streamed = await asyncio.gather(
+        client.post("/api/chat", json={"session_id": "faq-1", "message": question}),
+        client.post(
+            "/api/chat",
+            json={"session_id": "faq-2", "message": "como contacto a e redes"},
+        ),
+        client.post(
+            "/api/chat/stream", json={"session_id": "faq-3", "message": question}
+        ),
+    )
+    assert first.json()["reply"] == second.json()["reply"] == "resposta 1"
+    assert _parse_sse(streamed.text)[-1][1]["reply"] == "resposta 1"
+    assert len(fake.prompts) == 1
+    # Each session stores its own question followed by the shared answer.
+    history = await app_module.session_store.load("faq-2")
+    assert history == [
+        {"role": "user", "content": "como contacto a e redes"},
+        {"role": "assistant", "content": "resposta 1"},
+    ]
+
+    # Follow-up turns depend on the history and are never cached.
+    await client.post("/api/chat", json={"session_id": "faq-1", "message": question})
+    assert len(fake.prompts) == 2
+    health = (await client.get("/health")).json()
+    assert health["response_cache"]["size"] == 1
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("endpoint", ["/api/chat", "/api/chat/stream"])
+async def test_trimmed_follow_up_is_not_treated_as_a_first_turn(
+    client, monkeypatch, endpoint
+):
+    fake = _SlowClient(delay=0)
+    _use_llm(monkeypatch, fake)
+    question = "Como contacto a E-REDES?"
+    suffix = endpoint.rsplit("/", 1)[-1]
+    first, follow_up = f"trim-1-{suffix}", f"trim-2-{suffix}"
+    await client.post("/api/chat", json={"session_id": first, "message": question})
+    earlier = [
+        {"role": "user", "content": "Olá"},
+        {"role": "assistant", "content": "Olá!"},
+    ]
+    await app_module.session_store.append(follow_up, earlier, 20)
+    # A budget so tight that only the system prompt and the question remain.
+    monkeypatch.setattr(app_module, "_trim_for_turn", lambda m: [m[0], m[-1]])
+
+    await client.post(endpoint, json={"session_id": follow_up, "message": question})
+    assert len(fake.prompts) == 2
+
+
+@pytest.mark.anyio
+async def test_streamed_cache_hit_is_not_traced_as_an_error(client, monkeypatch):
+    exporter = tracing.InMemoryExporter()
+    monkeypatch.setattr(tracing, "tracer", tracing.Tracer(exporter))
+    _use_llm(monkeypatch, _SlowClient(delay=0))
+    question = "Como contacto a E-REDES?"
+
+    await client.post("/api/chat", json={"session_id": "faq-4", "message": question})
+    resp = await client.post(
+        "/api/chat/stream", json={"session_id": "faq-5", "message": question}
+    )
+    assert _parse_sse(resp.text)[-1][0] == "done"
+
+    spans = exporter.traces[-1]["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    (stream,) = [s for s in spans if s["name"] == "chat_stream"]
+    assert stream["status"] == {}
+    assert app_module.response_cache.stats()["hits"] == 1
+
+
+# ── System prompt sections ─────────────────────────────────────────────────
+@pytest.mark.anyio
+async def test_system_prompt_carries_only_relevant_sections(client, monkeypatch):
+    fake = _SlowClient(delay=0)
+    _use_llm(monkeypatch, fake)
+
+    for message in ("Olá, bom dia", "E tenho direito a compensação?"):
+        await client.post("/api/chat", json={"session_id": "sec-1", "message": message})
+    plain, compensation = (prompt[0]["content"] for prompt in fake.prompts)
+    assert "Direitos de Compensação" not in plain
+    assert "Direitos de Compensação" in compensation
+    assert "Conselhos de Segurança" not in compensation
+
+    monkeypatch.setattr(app_module.settings, "prompt_retrieval", False)
+    await client.post("/api/chat", json={"session_id": "sec-2", "message": "Olá"})
+    assert fake.prompts[-1][0]["content"] == SYSTEM_PROMPT
+
+
+# ── Conversation summaries ─────────────────────────────────────────────────
+@pytest.mark.anyio
+async def test_long_conversations_are_summarized_off_the_request_path(
+    client, monkeypatch
+):
+    fake = _SlowClient(delay=0)
+    _use_llm(monkeypatch, fake)
+    monkeypatch.setattr(app_module.summarizer, "trigger_messages", 6)
+    monkeypatch.setattr(app_module.summarizer, "keep_turns", 1)
+
+    sizes = []
+    for i in range(8):
+        calls = len(fake.prompts)
+        await client.post(
+            "/api/chat", json={"session_id": "long-1", "message": f"Pergunta {i}?"}
+        )
+        sizes.append(len(fake.prompts[calls]))
+        while app_module.summarizer._tasks:
+            await asyncio.sleep(0)
+
+    # Without summaries the prompt would reach 16 messages; it stays at
+    # system + summary + one or two turns + the question.
+    assert max(sizes[3:]) <= 7
+    history = await app_module.session_store.load("long-1")
+    assert history[0]["role"] == "system"
+    assert history[0]["content"].startswith("Resumo da conversa anterior")
+    assert "Pergunta 0?" not in str(history)
+    assert app_module.summarizer.stats()["ok"] >= 1
+
+
+# ── Rate limiting ──────────────────────────────────────────────────────────
+def _use_limiter(monkeypatch, llm, fast_path):
+    limiter = RateLimiter(MemoryRateLimitStore(), {LLM: llm, FAST_PATH: fast_path})
+    monkeypatch.setattr(app_module, "limiter", limiter)
+    return limiter
+
+
+@pytest.mark.anyio
+async def test_session_llm_budget_leaves_fast_path_answers(client, monkeypatch):
+    minute = Rate.parse("30/minute")
+    _use_limiter(monkeypatch, (minute, Rate.parse("2/minute")), (minute, minute))
+    fake = _ScriptedClient([_completion("Olá"), _completion("Sim")])
+    _use_llm(monkeypatch, fake)
+
+    for message in ("Olá", "Quando volta a luz?"):
+        resp = await client.post(
+            "/api/chat", json={"session_id": "rl-1", "message": message}
+        )
+        assert resp.status_code == 200
+    resp = await client.post(
+        "/api/chat/stream", json={"session_id": "rl-1", "message": "E agora?"}
+    )
+    assert resp.status_code == 429
+    assert resp.headers["retry-after"] == "30"
+    assert fake.calls == 2
+
+    # Cheap answers have their own budget.
+    resp = await client.post(
+        "/api/chat", json={"session_id": "rl-1", "message": "2400-001"}
+    )
+    assert resp.status_code == 200
+    assert app_module.limiter.stats()["limited"] == {LLM: 1}
+
+
+@pytest.mark.anyio
+async def test_llm_budget_skips_duplicates_and_cached_answers(client, monkeypatch):
+    minute = Rate.parse("30/minute")
+    _use_limiter(monkeypatch, (Rate.parse("2/minute"), minute), (minute, minute))
+    fake = _SlowClient()
+    _use_llm(monkeypatch, fake)
+
+    async def ask(session_id, message, endpoint="/api/chat"):
+        return await client.post(
+            endpoint, json={"session_id": session_id, "message": message}
+        )
+
+    # A duplicate sharing the pending reply costs nothing.
+    first, duplicate = await asyncio.gather(
+        ask("rl-4", "Quando volta a luz?"), ask("rl-4", "Quando volta a luz?")
+    )
+    assert first.status_code == duplicate.status_code == 200
+    # Nor does a first turn replayed from the response cache.
+    assert (await ask("rl-5", "Como contacto a E-REDES?")).status_code == 200
+    cached = await ask("rl-6", "Como contacto a E-REDES?", "/api/chat/stream")
+    assert _parse_sse(cached.text)[-1][0] == "done"
+    assert len(fake.prompts) == 2
+
+    resp = await ask("rl-7", "Tenho direito a compensação?", "/api/chat/stream")
+    assert resp.status_code == 429
+    assert app_module.limiter.stats()["limited"] == {LLM: 1}
+
+
+@pytest.mark.anyio
+async def test_forwarded_client_ip_is_used_behind_a_trusted_proxy(
+    client, monkeypatch
+):
+    monkeypatch.setattr(app_module, "router", None)
+    monkeypatch.setattr(app_module, "TRUSTED_PROXIES", parse_networks("127.0.0.1"))
+    minute = Rate.parse("30/minute")
+    _use_limiter(monkeypatch, (minute, minute), (Rate.parse("1/minute"), minute))
+
+    async def ask(session_id, forwarded_for):
+        return await client.post(
+            "/api/chat",
+            json={"session_id": session_id, "message": "Leiria"},
+            headers={"X-Forwarded-For": forwarded_for},
+        )
+
+    assert (await ask("rl-2", "198.51.100.7")).status_code == 200
+    assert (await ask("rl-3", "198.51.100.7")).status_code == 429
+    # A spoofed entry in front of the proxy's own does not help.
+    assert (await ask("rl-4", "203.0.113.1, 198.51.100.7")).status_code == 429
+    assert (await ask("rl-5", "198.51.100.8")).status_code == 200
+
+
+# ── Admission control ──────────────────────────────────────────────────────
+@pytest.mark.anyio
+async def test_overload_sheds_with_retry_after(client, monkeypatch):
+    controller = AdmissionController(max_concurrent=1, max_queue=0)
+    controller.service_ewma = 4.2
+    monkeypatch.setattr(app_module, "admission", controller)
+    fake = _SlowClient()
+    _use_llm(monkeypatch, fake)
+
+    async with controller.slot():
+        resp = await client.post(
+            "/api/chat", json={"session_id": "adm-1", "message": "Quando volta a luz?"}
+        )
+        assert resp.status_code == 503
+        assert resp.headers["retry-after"] == "5"
+
+        resp = await client.post(
+            "/api/chat/stream",
+            json={"session_id": "adm-2", "message": "Quando volta a luz?"},
+        )
+        event, data = _parse_sse(resp.text)[-1]
+        assert event == "error" and data["status"] == 503
+    assert fake.prompts == []
+
+    metrics_text = (await client.get("/metrics")).text
+    assert (
+        'chat_admission_shed_total{priority="normal",reason="queue_full"}'
+        in metrics_text
+    )
+    assert 'chat_admission_wait_seconds_count{priority="normal"}' in metrics_text
+
+
+# ── Metrics ────────────────────────────────────────────────────────────────
+@pytest.mark.anyio
+async def test_metrics_endpoint_exports_chat_latency(client, monkeypatch):
+    monkeypatch.setattr(app_module, "router", None)
+    await client.post(
+        "/api/chat", json={"session_id": "metrics-1", "message": "Leiria"}
+    )
+
+    resp = await client.get("/metrics")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert (
+        'chat_request_duration_seconds_count{endpoint="chat",outcome="fast_path"}'
+        in resp.text
+    )
+    assert "\nsessions_active " in resp.text
+    assert "\nsession_store_memory_bytes " in resp.text
+
+
+@pytest.mark.anyio
+async def test_metrics_scrape_does_not_walk_sessions(client, monkeypatch):
+    monkeypatch.setattr(app_module, "router", None)
+    await client.post(
+        "/api/chat", json={"session_id": "metrics-2", "message": "Leiria"}
+    )
+
+    def walk(self, seen=None):
+        raise AssertionError("a scrape walked the stored messages")
+
+    monkeypatch.setattr(session_store.Session, "memory_bytes", walk)
+    monkeypatch.setattr(session_store.StoredMessage, "size", walk)
+    resp = await client.get("/metrics")
+    assert resp.status_code == 200
+    total = app_module.session_store.total_bytes
+    assert f"\nsession_store_memory_bytes {total}" in resp.text
+
+
+# ── Tracing ────────────────────────────────────────────────────────────────
+@pytest.mark.anyio
+async def test_chat_is_traced_end_to_end(client, monkeypatch):
+    exporter = tracing.InMemoryExporter()
+    monkeypatch.setattr(tracing, "tracer", tracing.Tracer(exporter))
+    message = SimpleNamespace(
+        content=None,
+        tool_calls=[
+            SimpleNamespace(
+                id="call_1",
+                function=SimpleNamespace(
+                    name="resumo_nacional_tempestade", arguments="{}"
+                ),
+            )
+        ],
+    )
+    tool_turn = SimpleNamespace(
+        choices=[SimpleNamespace(finish_reason="tool_calls", message=message)],
+        usage=None,
+    )
+    _use_llm(monkeypatch, _ScriptedClient([tool_turn, _completion("Olá")]))
+
+    resp = await client.post(
+        "/api/chat", json={"session_id": "trace-1", "message": "Como está o país?"}
+    )
+    assert resp.status_code == 200
+
+    (trace,) = exporter.traces
+    spans = trace["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    by_id = {s["spanId"]: s for s in spans}
+    parents = {
+        s["name"]: by_id[s["parentSpanId"]]["name"]
+        for s in spans
+        if "parentSpanId" in s
+    }
+    assert parents["process_chat"] == "chat"
+    assert parents["llm"] == "process_chat"
+    assert parents["llm.attempt"] == "llm"
+    assert parents["tool"] == "process_chat"
+    assert spans[0]["traceId"].endswith(resp.headers["x-request-id"])
@@ -0,0 +1,86 @@
+"""Unit tests for the TTL cache."""
+
+import asyncio
+
+import pytest
+
+from cache import TTLCache
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_after_ttl():
+    clock = _Clock()
+    cache = TTLCache(max_entries=10, ttl=5, clock=clock)
+    cache.set("a", 1)
+    clock.now = 4.9
+    assert cache.get("a") == 1
+    clock.now = 5.0
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_lru_eviction_keeps_recently_used():
+    cache = TTLCache(max_entries=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.evictions == 1
+
+
+@pytest.mark.anyio
+async def test_concurrent_misses_share_one_load():
+    cache = TTLCache(max_entries=10, ttl=60)
+    loads = 0
+
+    async def loader():
+        nonlocal loads
+        loads += 1
+        await asyncio.sleep(0.01)
+        return "value"
+
+    results = await asyncio.gather(
+        *(cache.get_or_load("k", loader) for _ in range(20))
+    )
+    assert results == ["value"] * 20
+    assert loads == 1
+    assert await cache.get_or_load("k", loader) == "value"
+
+    stats = cache.stats()
+    assert stats["misses"] == 1
+    assert stats["coalesced"] == 19
+    assert stats["hits"] == 1
+
+
+@pytest.mark.anyio
+async def test_cancelled_caller_does_not_abort_shared_load():
+    cache = TTLCache(max_entries=10, ttl=60)
+    release = asyncio.Event()
+
+    async def loader():
+        await release.wait()
+        return 42
+
+    leader = asyncio.create_task(cache.get_or_load("k", loader))
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(cache.get_or_load("k", loader))
+    await asyncio.sleep(0)
+    leader.cancel()
+    release.set()
+
+    assert await follower == 42
+    assert cache.get("k") == 42
@@ -1,6 +1,19 @@
-"""Unit tests for E-REDES API sanitization."""
+"""Unit tests for the E-REDES API client."""
 
-from eredes_api import _sanitize_search_term
+import asyncio
+import json
+
+import pytest
+
+import eredes_api
+from config import settings
+from eredes_api import _sanitize_search_term, query_scheduled_interruptions
+from eredes_mirror import ScheduledWorkMirror
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
 
 
 def test_sanitize_plain_text():
@@ -28,3 +41,129 @@ def test_sanitize_allows_hyphens():
 
 def test_sanitize_strips_whitespace():
     assert _sanitize_search_term("  Coimbra  ") == "Coimbra"
+
+
+# ── Shared client / connection reuse ───────────────────────────────────────
+class _FakeOpenDataServer:
+    """Minimal keep-alive HTTP/1.1 server that counts TCP connections."""
+
+    def __init__(self):
+        self.connections = 0
+        self.requests = 0
+        self._server = None
+
+    async def __aenter__(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                if not head:
+                    break
+                self.requests += 1
+                body = json.dumps(
+                    {
+                        "total_count": 1,
+                        "records": [
+                            {"record": {"fields": {"municipality": "Leiria"}}}
+                        ],
+                    }
+                ).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+@pytest.mark.anyio
+async def test_shared_client_reuses_connections(monkeypatch):
+    async with _FakeOpenDataServer() as server:
+        monkeypatch.setattr(
+            settings, "eredes_api_base", f"http://127.0.0.1:{server.port}"
+        )
+        await eredes_api.close_client()
+        try:
+            for i in range(25):
+                result = await query_scheduled_interruptions(
+                    municipality=f"Leiria {i}"
+                )
+                assert result["resultados"][0]["concelho"] == "Leiria"
+
+            stats = eredes_api.pool_stats()
+        finally:
+            await eredes_api.close_client()
+
+    assert server.requests == 25
+    assert server.connections == 1
+    assert stats["open"] is True
+    assert stats["requests_total"] == 25
+    assert stats["connections_idle"] == 1
+    assert stats["connections_in_use"] == 0
+    assert stats["requests_waiting"] == 0
+
+
+def test_pool_stats_when_closed():
+    assert eredes_api.pool_stats() == {"open": False}
+
+
+# ── Result cache ───────────────────────────────────────────────────────────
+@pytest.mark.anyio
+async def test_cache_key_normalizes_equivalent_queries(monkeypatch):
+    calls = []
+
+    async def fake_fetch(municipality, postal_code, limit):
+        calls.append((municipality, postal_code, limit))
+        return {"total_encontrados": 0, "resultados": []}
+
+    monkeypatch.setattr(eredes_api, "_fetch_scheduled_interruptions", fake_fetch)
+    eredes_api._cache.clear()
+
+    await query_scheduled_interruptions(municipality="Leiria")
+    await query_scheduled_interruptions(municipality="  LEIRIA! ")
+    await query_scheduled_interruptions(postal_code="2400-001")
+    await query_scheduled_interruptions(postal_code="2400001")
+
+    assert len(calls) == 2
+    eredes_api._cache.clear()
+
+
+@pytest.mark.anyio
+async def test_cache_errors_use_short_ttl(monkeypatch):
+    async def failing_fetch(municipality, postal_code, limit):
+        return {"erro": "Erro na API E-REDES: 503"}
+
+    monkeypatch.setattr(eredes_api, "_fetch_scheduled_interruptions", failing_fetch)
+    monkeypatch.setattr(settings, "eredes_cache_error_ttl_seconds", 0)
+    eredes_api._cache.clear()
+
+    await query_scheduled_interruptions(municipality="Coimbra")
+    assert len(eredes_api._cache) == 0
+
+
+@pytest.mark.anyio
+async def test_fresh_mirror_answers_without_the_network(monkeypatch):
+    mirror = ScheduledWorkMirror(max_age_seconds=60)
+    mirror._table = mirror._merge([{"municipality": "Pombal"}], full=True)
+    mirror.synced_at = mirror._clock()
+
+    async def fail(*args):
+        raise AssertionError("live API called")
+
+    monkeypatch.setattr(eredes_api, "mirror", mirror)
+    monkeypatch.setattr(eredes_api, "_fetch_scheduled_interruptions", fail)
+    result = await query_scheduled_interruptions(municipality="Leiria")
+    assert result == {"total_encontrados": 0, "resultados": []}
+    assert eredes_api.mirror_stats()["fresh"] is True
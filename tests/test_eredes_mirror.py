@@ -0,0 +1,269 @@
+"""Unit tests for the local scheduled-work mirror."""
+
+import json
+import threading
+from pathlib import Path
+
+import httpx
+import pytest
+
+import eredes_mirror
+from eredes_mirror import ScheduledWorkMirror
+
+EXPORT_FIXTURE = (
+    Path(__file__).parent / "fixtures" / "network_scheduling_work_export.json"
+)
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _record(record_id, municipality, zipcode, start, modified="2026-01-01T00:00:00"):
+    return {
+        "recordid": record_id,
+        "record_timestamp": modified,
+        "record": {
+            "fields": {
+                "zipcode": zipcode,
+                "municipality": municipality,
+                "parish": "Freguesia",
+                "startdatetime": start,
+                "enddatetime": start.replace("T09", "T17"),
+                "durationallocation": "8h",
+            }
+        },
+    }
+
+
+RECORDS = [
+    _record("a", "Leiria", "2400-001", "2026-02-01T09:00:00"),
+    _record("b", "Leiria", "2410-120", "2026-02-03T09:00:00"),
+    _record("c", "Marinha Grande", "2430-001", "2026-02-02T09:00:00"),
+    _record("d", "Vila Nova de Gaia", "4400-001", "2026-02-04T09:00:00"),
+    _record("e", "Santarém", "2000-001", "2026-02-05T09:00:00"),
+]
+
+
+def _mirror(records=RECORDS, clock=None):
+    mirror = ScheduledWorkMirror(max_age_seconds=60, clock=clock or _Clock())
+    mirror._table = mirror._merge(records, full=True)
+    return mirror
+
+
+def test_query_by_municipality_ignores_accents_and_case():
+    result = _mirror().query(municipality="santarem")
+    assert result["total_encontrados"] == 1
+    assert result["resultados"][0]["concelho"] == "Santarém"
+
+
+def test_query_matches_municipality_by_whole_words():
+    result = _mirror().query(municipality="Vila Nova")
+    assert [r["concelho"] for r in result["resultados"]] == ["Vila Nova de Gaia"]
+    assert _mirror().query(municipality="Vila Nov")["total_encontrados"] == 0
+
+
+def test_query_orders_most_recent_first_and_limits():
+    result = _mirror().query(municipality="Leiria", limit=1)
+    assert result["total_encontrados"] == 2
+    assert [r["inicio"] for r in result["resultados"]] == ["2026-02-03T09:00:00"]
+
+
+def test_query_by_postal_prefix():
+    result = _mirror().query(postal_code="24")
+    assert {r["codigo_postal"] for r in result["resultados"]} == {
+        "2400-001",
+        "2410-120",
+        "2430-001",
+    }
+    assert _mirror().query(postal_code="2410-120")["total_encontrados"] == 1
+    assert _mirror().query(postal_code="2410-999")["total_encontrados"] == 0
+
+
+def test_query_combines_filters_and_start_after():
+    mirror = _mirror()
+    assert mirror.query(municipality="Leiria", postal_code="2400")[
+        "total_encontrados"
+    ] == 1
+    result = mirror.query(postal_code="2", start_after="2026-02-02T09:00:00")
+    assert [r["inicio"] for r in result["resultados"]] == [
+        "2026-02-05T09:00:00",
+        "2026-02-03T09:00:00",
+    ]
+
+
+def test_result_shape_matches_live_client():
+    result = _mirror().query(municipality="Leiria", limit=1)["resultados"][0]
+    assert set(result) == {
+        "codigo_postal",
+        "concelho",
+        "freguesia",
+        "inicio",
+        "fim",
+        "duracao",
+    }
+
+
+@pytest.mark.anyio
+async def test_sync_is_incremental_after_first_full_export():
+    requests = []
+    pages = [
+        RECORDS[:2],
+        [
+            _record("b", "Leiria", "2410-120", "2026-02-06T09:00:00", "2026-01-02T00:00:00"),
+            _record("f", "Coimbra", "3000-001", "2026-02-07T09:00:00", "2026-01-02T00:00:00"),
+        ],
+    ]
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, json=pages[len(requests) - 1])
+
+    clock = _Clock()
+    mirror = ScheduledWorkMirror(max_age_seconds=60, clock=clock)
+    assert not mirror.is_fresh()
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        assert await mirror.sync(client, "http://test/exports/json") == 2
+        assert "where" not in requests[0].url.params
+        assert mirror.is_fresh()
+
+        clock.now += 30
+        await mirror.sync(client, "http://test/exports/json")
+    assert requests[1].url.params["where"] == (
+        "record_timestamp >= date'2026-01-01T00:00:00'"
+    )
+    assert len(mirror) == 3
+    leiria = mirror.query(municipality="Leiria")["resultados"]
+    assert leiria[0]["inicio"] == "2026-02-06T09:00:00"
+
+    clock.now += 61
+    assert not mirror.is_fresh()
+
+
+@pytest.mark.anyio
+async def test_incremental_sync_replaces_updated_records():
+    no_id = _record("", "Pombal", "3100-001", "2026-02-01T09:00:00")
+    pages = [
+        [RECORDS[0], no_id],
+        [
+            _record("a", "Leiria", "2400-001", "2026-02-09T09:00:00", "2026-01-02"),
+            {**no_id, "record_timestamp": "2026-01-02"},
+        ],
+    ]
+
+    def handler(request):
+        return httpx.Response(200, json=pages.pop(0))
+
+    clock = _Clock()
+    mirror = ScheduledWorkMirror(max_age_seconds=60, clock=clock)
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        await mirror.sync(client, "http://test/exports/json")
+        clock.now += 30
+        await mirror.sync(client, "http://test/exports/json")
+
+    # One row per record; one without an id is keyed by its fields.
+    assert len(mirror) == 2
+    result = mirror.query(municipality="Leiria")["resultados"]
+    assert [r["inicio"] for r in result] == ["2026-02-09T09:00:00"]
+    assert mirror.query(municipality="Pombal")["total_encontrados"] == 1
+
+
+@pytest.mark.anyio
+async def test_flat_export_fixture_is_mirrored_without_duplicates():
+    body = EXPORT_FIXTURE.read_bytes()
+
+    def handler(request):
+        return httpx.Response(200, content=body)
+
+    clock = _Clock()
+    mirror = ScheduledWorkMirror(max_age_seconds=60, clock=clock)
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        assert await mirror.sync(client, "http://test/exports/json") == 5
+        ids = list(mirror._table.ids)
+        clock.now += 30
+        await mirror.sync(client, "http://test/exports/json")
+
+    # No modification date in the flat export: every sync is a full one,
+    # and the field-derived ids are the same each time.
+    assert mirror._table.ids == ids
+    assert len(mirror) == 5
+    leiria = mirror.query(postal_code="2400-441")
+    assert leiria["total_encontrados"] == 2
+    assert leiria["resultados"][0]["inicio"] == "2026-02-11T09:00:00+00:00"
+    gaia = mirror.query(municipality="Vila Nova de Gaia")["resultados"]
+    assert gaia[0]["duracao"] == ""
+
+
+@pytest.mark.anyio
+async def test_empty_mirror_is_never_fresh():
+    def handler(request):
+        return httpx.Response(200, json=[])
+
+    mirror = ScheduledWorkMirror(max_age_seconds=60)
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        assert await mirror.sync(client, "http://test/exports/json") == 0
+    assert mirror.synced_at is not None
+    assert not mirror.is_fresh()
+
+
+@pytest.mark.anyio
+async def test_sync_parses_the_export_off_the_event_loop(monkeypatch):
+    threads = []
+    loads = json.loads
+
+    def recording_loads(*args, **kwargs):
+        threads.append(threading.current_thread())
+        return loads(*args, **kwargs)
+
+    monkeypatch.setattr(eredes_mirror.json, "loads", recording_loads)
+
+    def handler(request):
+        return httpx.Response(200, content=json.dumps(RECORDS).encode())
+
+    mirror = ScheduledWorkMirror(max_age_seconds=60)
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        assert await mirror.sync(client, "http://test/exports/json") == len(RECORDS)
+    assert threads and threading.main_thread() not in threads
+
+
+@pytest.mark.anyio
+async def test_failed_sync_keeps_previous_table():
+    def handler(request):
+        return httpx.Response(503)
+
+    mirror = _mirror()
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        with pytest.raises(httpx.HTTPStatusError):
+            await mirror.sync(client, "http://test/exports/json")
+    assert len(mirror) == len(RECORDS)
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = tmp_path / "mirror.json"
+    _mirror().save_file(path)
+    assert isinstance(json.loads(path.read_text(encoding="utf-8")), dict)
+
+    restored = ScheduledWorkMirror(max_age_seconds=60)
+    restored.load_file(path)
+    assert restored.is_fresh()
+    assert restored.query(postal_code="2") == _mirror().query(postal_code="2")
+
+
+def test_load_accepts_raw_export(tmp_path):
+    path = tmp_path / "export.json"
+    path.write_text(json.dumps(RECORDS), encoding="utf-8")
+    mirror = ScheduledWorkMirror(max_age_seconds=60)
+    mirror.load_file(path)
+    assert len(mirror) == len(RECORDS)
+
+    mirror.load_file(EXPORT_FIXTURE)
+    assert len(mirror) == 5
@@ -0,0 +1,97 @@
+"""Unit tests for the deterministic fast path."""
+
+import pytest
+
+import fast_path
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.mark.parametrize(
+    "message,tool",
+    [
+        ("2400-001", "consultar_estado_tempestade_kristin"),
+        ("2400001", "consultar_estado_tempestade_kristin"),
+        ("3000", "consultar_estado_tempestade_kristin"),
+        ("Leiria", "consultar_estado_tempestade_kristin"),
+        ("pombal?", "consultar_estado_tempestade_kristin"),
+        ("Resumo nacional", "resumo_nacional_tempestade"),
+        ("Qual é o ponto de situação?", "resumo_nacional_tempestade"),
+    ],
+)
+def test_routes_bare_queries(message, tool):
+    assert fast_path._route(message)[0] == tool
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        "Olá",
+        "Quando volta a luz em Leiria?",
+        "Lisboa",
+        "Tenho direito a compensação?",
+        "tenho 24 horas sem luz",
+        "Estou sem luz há 30 horas",
+        "Já passaram 2 dias e 20 horas",
+        "Figueira da Foz",
+    ],
+)
+def test_ambiguous_messages_fall_back(message):
+    assert fast_path._route(message) is None
+
+
+@pytest.mark.anyio
+async def test_postal_code_reply_mentions_district():
+    answer = await fast_path.try_answer("2400001")
+    assert "2400-001" in answer.reply
+    assert "Distrito de Leiria" in answer.reply
+    assert "45 200" in answer.reply
+    assert "5 de fevereiro de 2026" in answer.reply
+
+
+def _history(*messages):
+    async def load():
+        return list(messages)
+
+    return load
+
+
+@pytest.mark.anyio
+async def test_answer_to_an_assistant_question_goes_to_the_llm():
+    asked = _history(
+        {"role": "user", "content": "Sem luz desde ontem"},
+        {"role": "assistant", "content": "Em que concelho se encontra?"},
+    )
+    assert await fast_path.try_answer("Leiria", asked) is None
+    assert await fast_path.try_answer("2400-001", asked) is None
+
+
+@pytest.mark.anyio
+async def test_bare_query_after_a_plain_reply_is_answered():
+    assert await fast_path.try_answer("Leiria", _history()) is not None
+    answered = _history(
+        {"role": "user", "content": "Olá"},
+        {"role": "assistant", "content": "Olá! Indique o seu código postal."},
+    )
+    assert await fast_path.try_answer("Leiria", answered) is not None
+
+
+@pytest.mark.anyio
+async def test_unknown_postal_code_gets_info_reply():
+    answer = await fast_path.try_answer("1000-001")
+    assert "Não foram encontrados dados" in answer.reply
+
+
+@pytest.mark.anyio
+async def test_summary_reply_and_stats():
+    before = fast_path.stats()
+    answer = await fast_path.try_answer("resumo nacional")
+    await fast_path.try_answer("Preciso de ajuda")
+    after = fast_path.stats()
+
+    assert "175 000" in answer.reply
+    assert after["hits"] == before["hits"] + 1
+    assert after["misses"] == before["misses"] + 1
@@ -0,0 +1,222 @@
+"""Tests for LLM backend routing against local OpenAI-compatible servers."""
+
+import asyncio
+import contextlib
+
+import pytest
+
+import app as app_module
+from config import LLMBackendConfig
+from llm_router import FALLBACK, Backend, LLMRouter, parse_reset
+from resilience import UpstreamRateLimitError
+from summarizer import SUMMARY_PREFIX
+from tests.fake_openai import FakeOpenAIServer
+
+MESSAGES = [{"role": "user", "content": "Pode explicar-me o que devo fazer?" * 3}]
+SIMPLE = [{"role": "user", "content": "Olá"}]
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@contextlib.asynccontextmanager
+async def _router(*servers, tiers=None):
+    tiers = tiers or ["primary"] * len(servers)
+    router = LLMRouter(
+        Backend.connect(
+            LLMBackendConfig(
+                name=f"b{i}",
+                api_key="test",
+                model=f"model-{i}",
+                base_url=server.base_url,
+                tier=tier,
+            )
+        )
+        for i, (server, tier) in enumerate(zip(servers, tiers))
+    )
+    try:
+        yield router
+    finally:
+        await router.close()
+
+
+@pytest.fixture
+def routed(monkeypatch):
+    monkeypatch.setattr(app_module.settings, "groq_retry_base_seconds", 0.001)
+    monkeypatch.setattr(app_module.settings, "groq_retry_max_seconds", 0.002)
+
+    def use(router):
+        monkeypatch.setattr(app_module, "router", router)
+
+    return use
+
+
+def test_parse_reset():
+    assert parse_reset("2m59.56s") == pytest.approx(179.56)
+    assert parse_reset("7.66s") == pytest.approx(7.66)
+    assert parse_reset("250ms") == pytest.approx(0.25)
+    assert parse_reset("1h0m0s") == 3600
+    assert parse_reset("12") == 12
+    assert parse_reset("") is None
+
+
+@pytest.mark.anyio
+async def test_router_prefers_lower_latency(routed):
+    async with FakeOpenAIServer(latency=0.05) as slow, FakeOpenAIServer() as fast:
+        async with _router(slow, fast) as router:
+            routed(router)
+            for _ in range(4):
+                await app_module._call_groq_with_retry(MESSAGES)
+            # Each backend is tried once; after that the fast one wins.
+            assert len(slow.requests) == 1
+            assert len(fast.requests) == 3
+            stats = router.stats()["backends"]
+            assert stats[0]["latency_ms_ewma"] > stats[1]["latency_ms_ewma"]
+
+
+@pytest.mark.anyio
+async def test_router_avoids_backend_without_headroom(routed):
+    quota = {
+        "x-ratelimit-limit-requests": "1000",
+        "x-ratelimit-remaining-requests": "10",
+        "x-ratelimit-reset-requests": "1m",
+    }
+    async with FakeOpenAIServer(headers=quota) as low, FakeOpenAIServer(
+        latency=0.02
+    ) as roomy:
+        async with _router(low, roomy) as router:
+            routed(router)
+            for _ in range(4):
+                await app_module._call_groq_with_retry(MESSAGES)
+            assert len(low.requests) == 1
+            assert router.backends[0].headroom() == pytest.approx(0.01)
+            assert not router.backends[0].available()
+
+
+@pytest.mark.anyio
+async def test_rate_limited_backend_fails_over_immediately(routed):
+    async with FakeOpenAIServer(reply="A") as a, FakeOpenAIServer(reply="B") as b:
+        a.fail_next(429, {"retry-after": "30"})
+        async with _router(a, b) as router:
+            routed(router)
+            response = await app_module._call_groq_with_retry(MESSAGES)
+            assert response.choices[0].message.content == "B"
+            assert router.backends[0].stats()["rate_limited"] == 1
+            assert router.backends[0].available_in() > 29
+
+            # Until the Retry-After passes, only B is used.
+            await app_module._call_groq_with_retry(MESSAGES)
+            assert (len(a.requests), len(b.requests)) == (1, 2)
+
+
+@pytest.mark.anyio
+async def test_all_backends_rate_limited_raises_typed_error(routed):
+    async with FakeOpenAIServer() as a, FakeOpenAIServer() as b:
+        a.fail_next(429, {"retry-after": "30"})
+        b.fail_next(429, {"retry-after": "20"})
+        async with _router(a, b) as router:
+            routed(router)
+            deadline = asyncio.get_running_loop().time() + 5
+            with pytest.raises(UpstreamRateLimitError) as exc:
+                await app_module._call_groq_with_retry(MESSAGES, deadline=deadline)
+            assert 19 < exc.value.retry_after <= 30
+
+
+@pytest.mark.anyio
+async def test_simple_turns_and_saturation_use_fallback_tier(routed):
+    async with FakeOpenAIServer() as primary, FakeOpenAIServer() as small:
+        async with _router(primary, small, tiers=["primary", FALLBACK]) as router:
+            routed(router)
+            await app_module._call_groq_with_retry(SIMPLE)
+            assert small.requests[-1]["model"] == "model-1"
+
+            await app_module._call_groq_with_retry(MESSAGES)
+            assert primary.requests[-1]["model"] == "model-0"
+
+            primary.fail_next(429, {"retry-after": "30"})
+            await app_module._call_groq_with_retry(MESSAGES)
+            await app_module._call_groq_with_retry(MESSAGES)
+            assert len(small.requests) == 3
+            assert router.stats()["fallbacks"] == 2
+
+
+@pytest.mark.anyio
+async def test_only_short_first_turns_are_simple(routed):
+    system = {"role": "system", "content": "Prompt"}
+    follow_up = [
+        system,
+        {"role": "user", "content": "Olá"},
+        {"role": "assistant", "content": "Olá! Em que posso ajudar?"},
+        {"role": "user", "content": "e amanhã?"},
+    ]
+    summarized = [
+        system,
+        {"role": "system", "content": SUMMARY_PREFIX + "Sem luz em Leiria."},
+        {"role": "user", "content": "e amanhã?"},
+    ]
+    async with FakeOpenAIServer() as primary, FakeOpenAIServer() as small:
+        async with _router(primary, small, tiers=["primary", FALLBACK]) as router:
+            routed(router)
+            await app_module._call_groq_with_retry([system, *SIMPLE])
+            assert len(small.requests) == 1
+
+            await app_module._call_groq_with_retry(follow_up)
+            await app_module._call_groq_with_retry(summarized)
+            assert len(primary.requests) == 2
+            assert len(small.requests) == 1
+
+
+@pytest.mark.anyio
+async def test_simple_turns_without_fallback_tier_are_not_fallbacks(routed):
+    async with FakeOpenAIServer() as primary:
+        async with _router(primary) as router:
+            routed(router)
+            await app_module._call_groq_with_retry(SIMPLE)
+            await app_module._call_groq_with_retry(MESSAGES)
+            assert len(primary.requests) == 2
+            assert router.stats()["fallbacks"] == 0
+
+
+def _long_history(turns):
+    history = [{"role": "system", "content": "Prompt"}]
+    for i in range(turns):
+        history += [
+            {"role": "user", "content": f"Pergunta {i} " * 20},
+            {"role": "assistant", "content": f"Resposta {i} " * 20},
+        ]
+    return history + [{"role": "user", "content": "E agora, o que faço?"}]
+
+
+@pytest.mark.anyio
+async def test_history_is_trimmed_for_the_serving_model(routed, monkeypatch):
+    monkeypatch.setattr(
+        app_module.settings, "model_prompt_token_budgets", {"model-1": 150}
+    )
+    history = _long_history(6)
+    async with FakeOpenAIServer() as big, FakeOpenAIServer() as small:
+        async with _router(big, small) as router:
+            routed(router)
+            big.fail_next(429, {"retry-after": "30"})
+            await app_module._call_groq_with_retry(history)
+            assert len(big.requests[0]["messages"]) == len(history)
+            # The failover goes to a model with a smaller budget.
+            trimmed = small.requests[0]["messages"]
+            assert len(trimmed) < len(history)
+            assert trimmed[-1]["content"] == "E agora, o que faço?"
+
+            # The turn itself is trimmed for the backend expected to serve it.
+            assert app_module._trim_for_turn(history) == trimmed
+
+
+@pytest.mark.anyio
+async def test_streaming_through_router(routed):
+    async with FakeOpenAIServer(reply="Olá, mundo") as server:
+        async with _router(server) as router:
+            routed(router)
+            events = [
+                event async for event in app_module._stream_chat(list(MESSAGES))
+            ]
+            assert events[-1] == ("done", {"reply": "Olá, mundo"})
+            assert server.requests[0]["stream"] is True
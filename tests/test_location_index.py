@@ -0,0 +1,101 @@
+"""Unit tests for the location index."""
+
+import pytest
+
+from location_index import LocationIndex, fold
+
+POSTAL = {"2400": "leiria", "2410": "leiria", "2000": "santarem", "3000": "coimbra"}
+NAMES = {
+    "Leiria": "leiria",
+    "Santarém": "santarem",
+    "Figueira da Foz": "leiria",
+    "Montemor-o-Velho": "coimbra",
+}
+
+
+def _index():
+    return LocationIndex(NAMES, POSTAL)
+
+
+def test_fold():
+    assert fold("  Montemor-o-Velho ") == "montemor o velho"
+    assert fold("SANTARÉM!") == "santarem"
+
+
+def test_exact_and_folded_names():
+    index = _index()
+    assert index.lookup_name("leiria") == "leiria"
+    assert index.lookup_name("santarem") == "santarem"
+    assert index.lookup_name("montemor o velho") == "coimbra"
+
+
+def test_fuzzy_threshold():
+    index = _index()
+    assert index.lookup_name("Figueira da Fox") == "leiria"
+    assert index.lookup_name("Porto") is None
+    assert index.lookup_name("Figueira da Fox", fuzzy=False) is None
+
+
+def test_postal_prefixes():
+    index = _index()
+    assert index.lookup_postal("2400-001") == "leiria"
+    assert index.lookup_postal("2410") == "leiria"
+    assert index.lookup_postal("24") == "leiria"
+    # "2" is shorter than the minimum prefix; "20" only covers Santarém.
+    assert index.lookup_postal("2") is None
+    assert index.lookup_postal("20") == "santarem"
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "tenho 24 horas sem luz",
+        "Estou sem luz há 30 horas",
+        "Já passaram 2 dias e 20 horas",
+        "2400 horas",
+        "24h",
+    ],
+)
+def test_digits_in_free_text_are_not_postal_codes(text):
+    index = _index()
+    assert index.lookup_postal(text) is None
+    assert index.lookup(text) is None
+
+
+@pytest.mark.parametrize("code", ["2490-001", "2495", "2405", "3005-123"])
+def test_unknown_codes_sharing_a_known_prefix_are_not_resolved(code):
+    index = LocationIndex({}, {"2400": "leiria", "2410": "leiria", "3000": "coimbra"})
+    assert index.lookup_postal(code) is None
+    # Typed as a prefix, the same digits do resolve.
+    assert index.lookup_postal(code[:3]) in {"leiria", "coimbra"}
+
+
+def test_ambiguous_prefix_falls_back_to_none():
+    index = LocationIndex({}, {"2400": "leiria", "2450": "santarem"})
+    assert index.lookup_postal("24") is None
+    assert index.lookup_postal("2450-100") == "santarem"
+    assert index.lookup_postal("2499") is None
+
+
+def test_first_registered_name_wins():
+    index = LocationIndex({"Figueira da Foz": "leiria", "figueira-da-foz": "coimbra"}, {})
+    assert index.lookup_name("Figueira da Foz") == "leiria"
+    assert len(index) == 1
+
+
+def test_names_listed_under_two_districts_are_ambiguous():
+    data = {
+        "leiria": {
+            "distrito": "Leiria",
+            "concelhos_mais_afetados": ["Figueira da Foz"],
+        },
+        "coimbra": {
+            "distrito": "Coimbra",
+            "concelhos_mais_afetados": ["Figueira da Foz", "Montemor-o-Velho"],
+        },
+    }
+    index = LocationIndex.from_outage_data(data, POSTAL)
+    assert index.is_ambiguous("figueira-da-foz")
+    assert not index.is_ambiguous("Montemor-o-Velho")
+    assert not index.is_ambiguous("Leiria")
+    assert index.lookup_name("Figueira da Foz") == "leiria"
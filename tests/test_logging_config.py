@@ -0,0 +1,85 @@
+"""Tests for queued JSON logging and request-id propagation."""
+
+import io
+import json
+import logging
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+import logging_config
+from app import app
+from config import settings
+from logging_config import SamplingFilter, request_id_var, setup_logging
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def captured():
+    stream = io.StringIO()
+    setup_logging("INFO", stream=stream)
+
+    def lines():
+        logging_config.shutdown_logging()
+        return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+    yield lines
+    setup_logging(settings.log_level, settings.log_sample_rates)
+
+
+def test_records_are_json_with_extras_and_request_id(captured):
+    token = request_id_var.set("abc123def456")
+    try:
+        logging.getLogger("test").info("chat_response", extra={"reply_length": 42})
+    finally:
+        request_id_var.reset(token)
+    logging.getLogger("test").warning("plain %s", "args")
+
+    first, second = captured()
+    assert first["message"] == "chat_response"
+    assert first["level"] == "INFO"
+    assert first["name"] == "test"
+    assert first["reply_length"] == 42
+    assert first["request_id"] == "abc123def456"
+    assert "timestamp" in first
+    assert second["message"] == "plain args"
+    assert "request_id" not in second
+
+
+def test_exceptions_are_formatted(captured):
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        logging.getLogger("test").exception("tool_failed")
+    (record,) = captured()
+    assert "ValueError: boom" in record["exc_info"]
+
+
+def test_sampling_applies_to_named_info_events_only():
+    draws = iter([0.05, 0.5])
+    sampler = SamplingFilter({"request_started": 0.1}, rng=lambda: next(draws))
+
+    def record(msg, level=logging.INFO):
+        return logging.LogRecord("app", level, "", 0, msg, None, None)
+
+    assert sampler.filter(record("request_started"))
+    assert not sampler.filter(record("request_started"))
+    assert sampler.filter(record("chat_response"))
+    assert sampler.filter(record("request_started", logging.WARNING))
+
+
+@pytest.mark.anyio
+async def test_request_id_reaches_header_and_logs(captured):
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        resp = await client.get("/health")
+    request_id = resp.headers["x-request-id"]
+
+    started = [r for r in captured() if r["message"] == "request_started"]
+    assert started[-1]["request_id"] == request_id
+    assert started[-1]["path"] == "/health"
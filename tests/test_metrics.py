@@ -0,0 +1,42 @@
+"""Unit tests for the Prometheus-format metrics."""
+
+import pytest
+
+from metrics import Counter, Gauge, Histogram, Registry
+
+
+def test_histogram_renders_cumulative_buckets():
+    h = Histogram("latency_seconds", "Latency.", ("route",), buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        h.labels("chat").observe(value)
+
+    text = h.render()
+    assert "# TYPE latency_seconds histogram" in text
+    assert 'latency_seconds_bucket{route="chat",le="0.1"} 2' in text
+    assert 'latency_seconds_bucket{route="chat",le="1"} 3' in text
+    assert 'latency_seconds_bucket{route="chat",le="+Inf"} 4' in text
+    assert 'latency_seconds_sum{route="chat"} 3.65' in text
+    assert 'latency_seconds_count{route="chat"} 4' in text
+
+
+def test_series_are_cached_per_label_values():
+    c = Counter("calls_total", "Calls.", ("tool",))
+    assert c.labels("a") is c.labels("a")
+    c.labels("a").inc()
+    c.labels("a").inc(2)
+    c.labels('we"ird').inc()
+    assert 'calls_total{tool="a"} 3' in c.render()
+    assert r'calls_total{tool="we\"ird"} 1' in c.render()
+    with pytest.raises(ValueError):
+        c.labels("a", "b")
+
+
+def test_registry_renders_all_and_rejects_duplicates():
+    registry = Registry()
+    gauge = registry.register(Gauge("sessions", "Sessions."))
+    gauge.set(7)
+    assert registry.render() == (
+        "# HELP sessions Sessions.\n# TYPE sessions gauge\nsessions 7\n"
+    )
+    with pytest.raises(ValueError):
+        registry.register(Gauge("sessions", "Again."))
@@ -1,6 +1,29 @@
-"""Unit tests for outage data lookups."""
+"""Unit tests for outage data lookups and dataset reloading."""
 
-from outage_data import get_national_summary, get_outage_by_location
+import asyncio
+import json
+
+import pytest
+
+import outage_data
+from openai_tools import handle_tool_call
+from outage_data import (
+    OUTAGE_DATA,
+    POSTAL_CODE_DISTRICT_MAP,
+    get_national_summary,
+    get_outage_by_location,
+    load_outage_file,
+)
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def restore_snapshot(monkeypatch):
+    monkeypatch.setattr(outage_data, "_snapshot", outage_data.current_snapshot())
 
 
 def test_lookup_by_postal_code():
@@ -33,3 +56,230 @@ def test_national_summary():
     assert summary["total_clientes_sem_luz"] == 41200
     assert len(summary["distritos_afetados"]) == 7
     assert 0 < summary["percentagem_global_reposta"] < 100
+
+
+def test_lookup_ignores_accents_and_case():
+    assert get_outage_by_location("Santarem")["distrito"] == "Santarém"
+    assert get_outage_by_location("covilha")["distrito"] == "Castelo Branco"
+
+
+def test_lookup_ignores_hyphens():
+    assert get_outage_by_location("Montemor o Velho")["distrito"] == "Coimbra"
+
+
+def test_lookup_tolerates_typos():
+    assert get_outage_by_location("Leria")["distrito"] == "Leiria"
+    assert get_outage_by_location("Leria", fuzzy=False) is None
+
+
+def test_lookup_by_postal_prefix():
+    assert get_outage_by_location("2400")["distrito"] == "Leiria"
+    assert get_outage_by_location("300")["distrito"] == "Coimbra"
+    # Ourém/Fátima (Santarém) and Mora (Évora) are not in the dataset; their
+    # codes must not resolve through a neighbour's prefix.
+    for code in ("2490-001", "2495", "7490", "3005-123"):
+        assert outage_data.get_district_from_postal(code) is None
+    assert get_outage_by_location("Estou sem luz há 30 horas") is None
+
+
+# ── Dataset files and hot reload ───────────────────────────────────────────
+def _write_dataset(path, version, sem_luz=8300):
+    districts = {"leiria": {**OUTAGE_DATA["leiria"], "clientes_sem_luz": sem_luz}}
+    path.write_text(
+        json.dumps(
+            {
+                "versao": version,
+                "distritos": districts,
+                "codigos_postais": {"2400": "leiria"},
+            },
+            ensure_ascii=False,
+        ),
+        encoding="utf-8",
+    )
+
+
+def test_load_json_file_builds_derived_structures(tmp_path):
+    path = tmp_path / "dados.json"
+    _write_dataset(path, "v1", sem_luz=100)
+    snapshot = load_outage_file(path)
+
+    assert snapshot.version == "v1"
+    assert snapshot.lookup("2400-001")["clientes_sem_luz"] == 100
+    assert snapshot.lookup("Pombal")["distrito"] == "Leiria"
+    assert snapshot.national_summary["total_clientes_sem_luz"] == 100
+
+
+def test_district_names_in_postal_codes_match_keys_in_any_case(tmp_path):
+    path = tmp_path / "dados.json"
+    payload = {
+        "distritos": {"Leiria": OUTAGE_DATA["leiria"]},
+        "codigos_postais": {"2400": "Leiria "},
+    }
+    path.write_text(json.dumps(payload), encoding="utf-8")
+
+    snapshot = load_outage_file(path)
+    assert snapshot.postal_map == {"2400": "leiria"}
+    assert snapshot.lookup("2400-001")["distrito"] == "Leiria"
+    assert snapshot.lookup("Leiria")["distrito"] == "Leiria"
+
+
+def test_load_csv_file(tmp_path):
+    row = dict(OUTAGE_DATA["coimbra"])
+    header = ["chave", *row, "codigos_postais"]
+    values = ["coimbra"] + [
+        ";".join(v) if isinstance(v, list) else str(v) for v in row.values()
+    ]
+    values.append("3000;3001")
+    path = tmp_path / "dados.csv"
+    path.write_text(
+        ",".join(header) + "\n" + ",".join(f'"{v}"' for v in values) + "\n",
+        encoding="utf-8",
+    )
+
+    snapshot = load_outage_file(path)
+    assert snapshot.lookup("3001")["distrito"] == "Coimbra"
+    assert snapshot.lookup("Cantanhede")["distrito"] == "Coimbra"
+    assert len(snapshot.version) == 12
+
+
+@pytest.mark.parametrize(
+    "mutate,message",
+    [
+        (lambda d: d["distritos"]["leiria"].pop("estado"), "estado"),
+        (lambda d: d["distritos"]["leiria"].update(clientes_sem_luz=10**9), "sem_luz"),
+        (lambda d: d["codigos_postais"].update({"9999": "lisboa"}), "unknown"),
+        (
+            lambda d: d["distritos"]["leiria"].update(
+                data_estimada_reposicao="05/02/2026"
+            ),
+            "YYYY-MM-DD",
+        ),
+        (
+            lambda d: d["distritos"]["leiria"].update(
+                data_estimada_reposicao="2026-02-30"
+            ),
+            "YYYY-MM-DD",
+        ),
+    ],
+)
+def test_invalid_dataset_rejected(tmp_path, mutate, message):
+    payload = {
+        "distritos": {"leiria": dict(OUTAGE_DATA["leiria"])},
+        "codigos_postais": {"2400": "leiria"},
+    }
+    mutate(payload)
+    path = tmp_path / "dados.json"
+    path.write_text(json.dumps(payload), encoding="utf-8")
+    with pytest.raises(ValueError, match=message):
+        load_outage_file(path)
+
+
+LEIRIA = {"leiria": OUTAGE_DATA["leiria"]}
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        {"distritos": {"x": 5}},
+        {"distritos": [LEIRIA["leiria"]]},
+        {"distritos": LEIRIA, "codigos_postais": ["2400"]},
+        {"distritos": LEIRIA, "codigos_postais": {"2400": 1}},
+        {"distritos": LEIRIA, "data_evento": 2026},
+        {"distritos": {"leiria": {**LEIRIA["leiria"], "concelhos_mais_afetados": [1]}}},
+        [],
+    ],
+)
+def test_badly_shaped_json_is_a_value_error(tmp_path, payload):
+    path = tmp_path / "dados.json"
+    path.write_text(json.dumps(payload), encoding="utf-8")
+    with pytest.raises(ValueError):
+        load_outage_file(path)
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "distrito,estado\nLeiria,Em curso\n",  # no chave column
+        "chave,distrito\nleiria\n",  # short row
+        "chave,distrito\nleiria,Leiria\n",  # missing district fields
+    ],
+)
+def test_badly_shaped_csv_is_a_value_error(tmp_path, text):
+    path = tmp_path / "dados.csv"
+    path.write_text(text, encoding="utf-8")
+    with pytest.raises(ValueError):
+        load_outage_file(path)
+
+
+@pytest.mark.anyio
+async def test_watcher_swaps_snapshot_on_change(tmp_path, restore_snapshot, caplog):
+    path = tmp_path / "dados.json"
+    _write_dataset(path, "v1")
+    watcher = asyncio.create_task(outage_data.watch_outage_file(str(path), 0.01))
+    try:
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if outage_data.current_snapshot().version == "v1":
+                break
+        assert outage_data.current_snapshot().version == "v1"
+
+        path.write_text("{ not json", encoding="utf-8")
+        await asyncio.sleep(0.05)
+        assert outage_data.current_snapshot().version == "v1"
+
+        path.write_text('{"distritos": {"x": 5}}', encoding="utf-8")
+        await asyncio.sleep(0.05)
+        assert outage_data.current_snapshot().version == "v1"
+        assert not watcher.done()
+
+        # An edit that keeps the explicit versao is reported, not served.
+        _write_dataset(path, "v1", sem_luz=7)
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if "outage_data_change_ignored" in caplog.messages:
+                break
+        assert "outage_data_change_ignored" in caplog.messages
+        assert get_outage_by_location("Leiria")["clientes_sem_luz"] == 8300
+
+        _write_dataset(path, "v2", sem_luz=42)
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if outage_data.current_snapshot().version == "v2":
+                break
+        assert get_outage_by_location("Leiria")["clientes_sem_luz"] == 42
+    finally:
+        watcher.cancel()
+
+
+@pytest.mark.anyio
+async def test_tool_output_carries_data_version():
+    result = json.loads(await handle_tool_call("resumo_nacional_tempestade", {}))
+    assert result["versao_dados"] == outage_data.current_snapshot().version
+
+
+def test_builtin_postal_map_is_served():
+    assert outage_data.current_snapshot().postal_map == POSTAL_CODE_DISTRICT_MAP
+
+
+@pytest.mark.anyio
+async def test_storm_payloads_are_serialized_once_per_version(
+    tmp_path, restore_snapshot
+):
+    tool = "consultar_estado_tempestade_kristin"
+    first = await handle_tool_call(tool, {"localizacao": "Leiria"})
+    again = await handle_tool_call(tool, {"localizacao": "2400-001"})
+    assert first is again
+    assert first == json.dumps(
+        {**OUTAGE_DATA["leiria"], "versao_dados": "builtin"}, ensure_ascii=False
+    )
+    summary = await handle_tool_call("resumo_nacional_tempestade", {})
+    assert summary is await handle_tool_call("resumo_nacional_tempestade", {})
+
+    path = tmp_path / "dados.json"
+    _write_dataset(path, "v2", sem_luz=42)
+    outage_data.publish_snapshot(load_outage_file(path))
+    updated = json.loads(await handle_tool_call(tool, {"localizacao": "Leiria"}))
+    assert updated["clientes_sem_luz"] == 42
+    assert updated["versao_dados"] == "v2"
+    summary = json.loads(await handle_tool_call("resumo_nacional_tempestade", {}))
+    assert summary["total_clientes_sem_luz"] == 42
@@ -0,0 +1,47 @@
+"""Tests for retrieval of system-prompt sections."""
+
+import pytest
+
+from prompt_sections import INDEX, SectionIndex, assemble, system_prompt_for, tokenize
+from system_prompt import PROMPT_SECTIONS, SYSTEM_PROMPT, SYSTEM_PROMPT_CORE
+
+
+def test_tokenize_folds_and_stems():
+    assert tokenize("Tenho direito a Compensação?") == ["direit", "compen"]
+    assert tokenize("cabos caídos") == tokenize("cabo caido")
+
+
+@pytest.mark.parametrize(
+    "message, expected",
+    [
+        ("Quando volta a luz em Leiria?", []),
+        ("Há interrupções programadas em Coimbra?", []),
+        ("Tenho direito a compensação?", ["compensacao"]),
+        ("Como faço uma reclamação?", ["compensacao"]),
+        ("Caiu um cabo na minha rua, o que faço?", ["seguranca"]),
+        ("Posso usar um gerador dentro de casa?", ["seguranca"]),
+        ("Qual é o número da linha de avarias?", ["contactos"]),
+    ],
+)
+def test_select_picks_relevant_sections(message, expected):
+    assert INDEX.select(message) == expected
+
+
+def test_rare_terms_outscore_common_ones():
+    index = SectionIndex({"a": "gato cão", "b": "gato peixe", "c": "gato ave"})
+    scores = index.scores("gato peixe")
+    assert scores["b"] > scores["a"] == scores["c"] > 0
+
+
+def test_assembled_prompt_keeps_core_and_adds_sections():
+    prompt = assemble(("seguranca",))
+    assert prompt.startswith(SYSTEM_PROMPT_CORE.rstrip("\n"))
+    assert PROMPT_SECTIONS["seguranca"] in prompt
+    assert PROMPT_SECTIONS["compensacao"] not in prompt
+    assert assemble(tuple(PROMPT_SECTIONS)) == SYSTEM_PROMPT
+
+
+def test_unrelated_question_gets_about_half_the_prompt():
+    prompt = system_prompt_for("Quando volta a luz em Leiria?")
+    assert prompt == assemble(())
+    assert len(prompt) < 0.6 * len(SYSTEM_PROMPT)
@@ -0,0 +1,203 @@
+"""Tests for the token-bucket rate limiter and client IP resolution."""
+
+import time
+
+import pytest
+
+from rate_limit import (
+    FAST_PATH,
+    LLM,
+    TOKEN_BUCKET_LUA,
+    Decision,
+    MemoryRateLimitStore,
+    Rate,
+    RateLimitStore,
+    RateLimiter,
+    RedisRateLimitStore,
+    client_ip,
+    parse_networks,
+    take,
+)
+from tests.fake_redis import FakeRedisServer, lua_handler
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_rate_parse():
+    assert Rate.parse("10/minute") == Rate(per_second=10 / 60, burst=10)
+    assert Rate.parse(" 2 / seconds ") == Rate(per_second=2.0, burst=2)
+    for bad in ("10", "0/minute", "ten/minute", "10/week"):
+        with pytest.raises(ValueError):
+            Rate.parse(bad)
+
+
+def test_take_is_all_or_nothing_and_refills():
+    rates = [Rate(per_second=1.0, burst=5), Rate(per_second=0.5, burst=1)]
+
+    decision, states = take([None, None], rates, now=0.0)
+    assert decision.allowed
+    assert states == [(4.0, 0.0), (0.0, 0.0)]
+
+    # The second bucket is empty: nothing is taken from the first either.
+    decision, new_states = take(states, rates, now=1.0)
+    assert not decision.allowed
+    assert decision.retry_after == pytest.approx(1.0)
+    assert new_states == []
+
+    decision, states = take(states, rates, now=2.0)
+    assert decision.allowed
+    assert states == [(4.0, 2.0), (0.0, 2.0)]  # refill is capped at the burst
+
+
+@pytest.mark.anyio
+async def test_memory_store_limits_per_ip_and_per_session():
+    clock = FakeClock()
+    limiter = RateLimiter(
+        MemoryRateLimitStore(clock=clock),
+        {
+            LLM: (Rate.parse("3/minute"), Rate.parse("2/minute")),
+            FAST_PATH: (Rate.parse("10/minute"), Rate.parse("10/minute")),
+        },
+    )
+
+    assert (await limiter.check(LLM, "1.1.1.1", "s1")).allowed
+    assert (await limiter.check(LLM, "1.1.1.1", "s1")).allowed
+    denied = await limiter.check(LLM, "1.1.1.1", "s1")
+    assert not denied.allowed
+    assert denied.retry_after == pytest.approx(30.0)
+
+    # A new session from the same IP has one IP token left.
+    assert (await limiter.check(LLM, "1.1.1.1", "s2")).allowed
+    assert not (await limiter.check(LLM, "1.1.1.1", "s3")).allowed
+    # Other IPs and the fast-path budget are unaffected.
+    assert (await limiter.check(LLM, "2.2.2.2", "s4")).allowed
+    assert (await limiter.check(FAST_PATH, "1.1.1.1", "s1")).allowed
+
+    clock.now += 30
+    assert (await limiter.check(LLM, "1.1.1.1", "s1")).allowed
+    assert limiter.stats()["limited"] == {LLM: 2}
+
+
+@pytest.mark.anyio
+async def test_memory_store_forgets_least_recently_used_buckets():
+    store = MemoryRateLimitStore(max_keys=2)
+    rate = Rate.parse("1/minute")
+    assert (await store.consume([("a", rate)])).allowed
+    assert (await store.consume([("b", rate)])).allowed
+    assert (await store.consume([("c", rate)])).allowed
+    assert len(store) == 2
+    assert (await store.consume([("a", rate)])).allowed  # forgotten, so full
+
+
+class BrokenStore(RateLimitStore):
+    async def consume(self, buckets, cost=1.0) -> Decision:
+        raise ConnectionError("store down")
+
+
+@pytest.mark.anyio
+async def test_limiter_lets_requests_through_when_the_store_fails():
+    rate = Rate.parse("1/minute")
+    limiter = RateLimiter(BrokenStore(), {LLM: (rate, rate)})
+    assert (await limiter.check(LLM, "1.1.1.1", "s1")).allowed
+    assert (await limiter.check(LLM, "1.1.1.1", "s1")).allowed
+
+
+def test_client_ip_only_trusts_configured_proxies():
+    trusted = parse_networks("10.0.0.0/8, 127.0.0.1")
+
+    assert client_ip("203.0.113.9", None, trusted) == "203.0.113.9"
+    # An untrusted peer cannot pick its address with the header.
+    assert client_ip("203.0.113.9", "1.2.3.4", trusted) == "203.0.113.9"
+    assert client_ip("127.0.0.1", "198.51.100.7", trusted) == "198.51.100.7"
+    # A spoofed left-hand entry is ignored: the proxy appended the real one.
+    assert (
+        client_ip("10.0.0.2", "1.2.3.4, 198.51.100.7, 10.0.0.5", trusted)
+        == "198.51.100.7"
+    )
+    assert client_ip("10.0.0.2", "garbage, 10.0.0.5", trusted) == "10.0.0.5"
+    assert client_ip(None, None, trusted) == "unknown"
+
+
+def _run_token_bucket(server, keys, args):
+    """Python port of ``TOKEN_BUCKET_LUA`` over the fake server's hashes."""
+    now, cost = float(args[0]), float(args[1])
+    rates = [
+        Rate(per_second=float(args[2 + 2 * i]), burst=int(args[3 + 2 * i]))
+        for i in range(len(keys))
+    ]
+    states = []
+    for key in keys:
+        bucket = server.data.get(key) if server._alive(key) else None
+        states.append(
+            (float(bucket[b"tokens"]), float(bucket[b"ts"])) if bucket else None
+        )
+    decision, new_states = take(states, rates, now, cost)
+    if not decision.allowed:
+        return [0, str(decision.retry_after).encode()]
+    for key, rate, (tokens, ts) in zip(keys, rates, new_states):
+        server.data[key] = {b"tokens": str(tokens).encode(), b"ts": str(ts).encode()}
+        server.expires[key] = time.time() + rate.burst / rate.per_second
+    return [1, b"0"]
+
+
+@pytest.mark.anyio
+async def test_redis_store_shares_buckets_between_instances():
+    async with FakeRedisServer() as server:
+        server.scripts[TOKEN_BUCKET_LUA] = _run_token_bucket
+        worker_a = RedisRateLimitStore(server.url)
+        worker_b = RedisRateLimitStore(server.url)
+        rate = Rate.parse("2/minute")
+        buckets = [("llm:ip:1.1.1.1", rate), ("llm:session:s1", rate)]
+        try:
+            assert (await worker_a.consume(buckets)).allowed
+            assert (await worker_b.consume(buckets)).allowed
+            denied = await worker_a.consume(buckets)
+            assert not denied.allowed
+            assert denied.retry_after > 0
+
+            assert b"eredes:ratelimit:llm:session:s1" in server.data
+            # The script is sent once (after the first NOSCRIPT), then each
+            # check is a single EVALSHA, from either worker.
+            assert server.commands.count(b"SCRIPT") == 1
+            assert server.commands.count(b"EVALSHA") == 4
+        finally:
+            await worker_a.close()
+            await worker_b.close()
+
+
+@pytest.mark.anyio
+async def test_redis_store_runs_the_real_lua_script():
+    pytest.importorskip("lupa")
+    async with FakeRedisServer() as server:
+        server.scripts[TOKEN_BUCKET_LUA] = lua_handler(TOKEN_BUCKET_LUA)
+        store = RedisRateLimitStore(server.url)
+        ip_rate, session_rate = Rate.parse("2/minute"), Rate.parse("1/minute")
+        buckets = [("llm:ip:1.1.1.1", ip_rate), ("llm:session:s1", session_rate)]
+        try:
+            assert (await store.consume(buckets)).allowed
+            denied = await store.consume(buckets)
+            assert not denied.allowed
+            assert denied.retry_after == pytest.approx(60.0, abs=1.0)
+
+            # All or nothing: the denied check left the IP bucket's token.
+            ip_bucket = server.data[b"eredes:ratelimit:llm:ip:1.1.1.1"]
+            assert float(ip_bucket[b"tokens"]) == pytest.approx(1.0, abs=0.01)
+            ttl = server.expires[b"eredes:ratelimit:llm:ip:1.1.1.1"] - time.time()
+            assert 59 < ttl <= 60
+
+            other = [("llm:ip:1.1.1.1", ip_rate), ("llm:session:s2", session_rate)]
+            assert (await store.consume(other)).allowed
+            assert not (await store.consume(other)).allowed
+        finally:
+            await store.close()
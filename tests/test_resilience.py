@@ -0,0 +1,119 @@
+"""Unit tests for the circuit breaker and backoff helpers."""
+
+import pytest
+
+from resilience import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitOpenError,
+    decorrelated_jitter,
+    retry_after_seconds,
+)
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _breaker(clock):
+    return CircuitBreaker(
+        "test",
+        failure_ratio=0.5,
+        window=4,
+        min_calls=4,
+        cooldown_seconds=10,
+        clock=clock,
+    )
+
+
+def test_breaker_opens_at_failure_ratio_and_fails_fast():
+    clock = _Clock()
+    breaker = _breaker(clock)
+    transitions = []
+    breaker.on_state_change(lambda old, new: transitions.append((old, new)))
+
+    for ok in (True, False, True):
+        breaker.before_call()
+        breaker.record_success() if ok else breaker.record_failure()
+    assert breaker.state == CLOSED  # below min_calls
+
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError) as exc:
+        breaker.before_call()
+    assert exc.value.retry_after == 10
+    assert transitions == [(CLOSED, OPEN)]
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_half_open_admits_one_probe_then_closes_on_success():
+    clock = _Clock()
+    breaker = _breaker(clock)
+    for _ in range(4):
+        breaker.before_call()
+        breaker.record_failure()
+    clock.now = 10
+    assert breaker.state == HALF_OPEN
+
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    breaker.before_call()
+
+
+def test_failed_probe_reopens():
+    clock = _Clock()
+    breaker = _breaker(clock)
+    for _ in range(4):
+        breaker.record_failure()
+    clock.now = 10
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.retry_after() == 10
+    assert breaker.stats()["opened"] == 2
+
+
+def test_released_probe_frees_the_slot():
+    clock = _Clock()
+    breaker = _breaker(clock)
+    for _ in range(4):
+        breaker.record_failure()
+    clock.now = 10
+    breaker.before_call()
+    breaker.release()
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+
+
+def test_decorrelated_jitter_stays_within_bounds():
+    assert decorrelated_jitter(1.0, 0.5, 8.0, rng=lambda lo, hi: hi) == 3.0
+    assert decorrelated_jitter(1.0, 0.5, 8.0, rng=lambda lo, hi: lo) == 0.5
+    assert decorrelated_jitter(5.0, 0.5, 8.0, rng=lambda lo, hi: hi) == 8.0
+    for _ in range(100):
+        assert 0.5 <= decorrelated_jitter(2.0, 0.5, 8.0) <= 6.0
+
+
+@pytest.mark.parametrize(
+    "headers,expected",
+    [
+        ({"retry-after": "7"}, 7.0),
+        ({"retry-after": "1.5"}, 1.5),
+        ({"retry-after-ms": "250", "retry-after": "7"}, 0.25),
+        ({"retry-after": "Thu, 01 Jan 1970 00:00:30 GMT"}, 20.0),
+        ({"retry-after": "soon"}, None),
+        ({}, None),
+        (None, None),
+    ],
+)
+def test_retry_after_seconds(headers, expected):
+    assert retry_after_seconds(headers, now=lambda: 10.0) == expected
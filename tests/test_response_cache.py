@@ -0,0 +1,111 @@
+"""Tests for the first-turn response cache."""
+
+import asyncio
+
+import pytest
+
+from response_cache import ResponseCache, question_key
+
+TURN = [{"role": "assistant", "content": "A luz volta hoje."}]
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def cache():
+    return ResponseCache(max_entries=10, ttl=60, max_entry_bytes=4096)
+
+
+def test_question_key_folds_accents_case_and_punctuation():
+    assert question_key("Quando volta a luz em LEIRIA?!") == question_key(
+        "quando volta a luz em leiria"
+    )
+    assert question_key("Santarém") == question_key("santarem")
+
+
+@pytest.mark.anyio
+async def test_miss_then_hit(cache):
+    async with cache.turn("k") as cached:
+        assert cached.messages is None
+        cached.store(TURN)
+    async with cache.turn("k") as cached:
+        assert cached.messages == TURN
+    assert cache.stats()["hit_ratio"] == 0.5
+
+
+@pytest.mark.anyio
+async def test_burst_of_identical_questions_runs_once(cache):
+    runs = 0
+
+    async def ask():
+        nonlocal runs
+        async with cache.turn("k") as cached:
+            if cached.messages is not None:
+                return cached.messages
+            runs += 1
+            await asyncio.sleep(0.01)
+            cached.store(TURN)
+            return TURN
+
+    results = await asyncio.gather(*(ask() for _ in range(5)))
+    assert runs == 1
+    assert results == [TURN] * 5
+    assert cache.stats()["coalesced"] == 4
+
+
+@pytest.mark.anyio
+async def test_waiters_get_the_leaders_error(cache):
+    async def lead():
+        async with cache.turn("k"):
+            await asyncio.sleep(0.01)
+            raise TimeoutError
+
+    async def wait():
+        async with cache.turn("k"):
+            pass
+
+    leader = asyncio.create_task(lead())
+    await asyncio.sleep(0)
+    with pytest.raises(TimeoutError):
+        await wait()
+    with pytest.raises(TimeoutError):
+        await leader
+    assert cache.stats()["size"] == 0
+
+
+@pytest.mark.anyio
+async def test_waiter_takes_over_from_an_abandoned_leader(cache):
+    async def lead():
+        async with cache.turn("k"):
+            await asyncio.sleep(10)
+
+    leader = asyncio.create_task(lead())
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(cache.turn("k").__aenter__())
+    await asyncio.sleep(0)
+    leader.cancel()
+    cached = await waiter
+    assert cached.messages is None  # now leading itself
+
+
+@pytest.mark.anyio
+async def test_uncacheable_and_oversized_turns_are_shared_but_not_kept(cache):
+    async with cache.turn("bad") as cached:
+        cached.store(TURN, cacheable=False)
+    big = [{"role": "assistant", "content": "x" * 10_000}]
+    async with cache.turn("big") as cached:
+        cached.store(big)
+    stats = cache.stats()
+    assert stats["size"] == 0
+    assert stats["too_large"] == 1
+
+
+@pytest.mark.anyio
+async def test_none_key_bypasses_the_cache(cache):
+    async with cache.turn(None) as cached:
+        assert cached.messages is None
+        cached.store(TURN)
+    assert cache.stats()["misses"] == 0
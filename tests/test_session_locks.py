@@ -0,0 +1,114 @@
+"""Tests for per-session turn serialization and duplicate coalescing."""
+
+import asyncio
+import gc
+
+import pytest
+
+from session_locks import SessionBusyError, SessionLocks, message_key
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+def test_message_key_ignores_case_and_spacing():
+    assert message_key("  Quando  volta a LUZ? ") == message_key("quando volta a luz?")
+
+
+@pytest.mark.anyio
+async def test_turns_of_one_session_run_one_at_a_time():
+    locks = SessionLocks(max_queued=5)
+    running, order = 0, []
+
+    async def turn(session_id, key):
+        nonlocal running
+        async with locks.turn(session_id, key):
+            running += 1
+            order.append((session_id, running))
+            await asyncio.sleep(0.01)
+            running -= 1
+
+    await asyncio.gather(turn("a", "1"), turn("a", "2"), turn("a", "3"))
+    assert [r for _, r in order] == [1, 1, 1]
+
+    # Different sessions do not wait for each other.
+    order.clear()
+    await asyncio.gather(turn("a", "1"), turn("b", "1"))
+    assert sorted(r for _, r in order) == [1, 2]
+
+
+@pytest.mark.anyio
+async def test_queue_limit_and_wait_timeout():
+    locks = SessionLocks(max_queued=1, wait_seconds=0.05)
+    release = asyncio.Event()
+
+    async def hold():
+        async with locks.turn("s", "first"):
+            await release.wait()
+
+    holder = asyncio.create_task(hold())
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(locks.turn("s", "second").__aenter__())
+    await asyncio.sleep(0)
+
+    with pytest.raises(SessionBusyError) as exc:
+        locks.check("s")
+    assert exc.value.queue_full
+
+    with pytest.raises(SessionBusyError) as exc:
+        await waiter
+    assert not exc.value.queue_full
+    assert locks.stats()["timed_out"] == 1
+
+    release.set()
+    await holder
+
+
+@pytest.mark.anyio
+async def test_duplicates_share_the_pending_result():
+    locks = SessionLocks()
+    key = message_key("Olá")
+
+    async def leader():
+        async with locks.turn("s", key) as result:
+            await asyncio.sleep(0.01)
+            result.set_result("resposta")
+
+    task = asyncio.create_task(leader())
+    await asyncio.sleep(0)
+    shared = locks.pending("s", key)
+    assert shared is not None
+    assert await asyncio.shield(shared) == "resposta"
+    await task
+    assert locks.pending("s", key) is None
+    assert locks.stats()["coalesced"] == 1
+
+
+@pytest.mark.anyio
+async def test_duplicates_receive_the_leaders_error():
+    locks = SessionLocks()
+
+    async def leader():
+        async with locks.turn("s", "k"):
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+    task = asyncio.create_task(leader())
+    await asyncio.sleep(0)
+    shared = locks.pending("s", "k")
+    with pytest.raises(ValueError):
+        await task
+    with pytest.raises(ValueError):
+        await shared
+
+
+@pytest.mark.anyio
+async def test_idle_session_locks_are_released():
+    locks = SessionLocks()
+    async with locks.turn("s", "k") as result:
+        result.set_result("ok")
+        assert locks.stats()["sessions_locked"] == 1
+    gc.collect()
+    assert locks.stats()["sessions_locked"] == 0
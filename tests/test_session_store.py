@@ -0,0 +1,255 @@
+"""Tests for the session store backends."""
+
+import pytest
+
+from session_store import MemorySessionStore, RedisSessionStore, StringPool
+from tests.fake_redis import FakeRedisServer
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+def _turn(i):
+    return [
+        {"role": "user", "content": f"pergunta {i}"},
+        {"role": "assistant", "content": f"resposta {i}"},
+    ]
+
+
+@pytest.mark.anyio
+async def test_memory_store_append_and_trim():
+    store = MemorySessionStore(ttl_seconds=60, max_count=10)
+    assert await store.load("s1") == []
+
+    for i in range(5):
+        await store.append("s1", _turn(i), max_messages=4)
+
+    history = await store.load("s1")
+    assert [m["content"] for m in history] == [
+        "pergunta 3",
+        "resposta 3",
+        "pergunta 4",
+        "resposta 4",
+    ]
+    assert await store.count() == 1
+
+
+@pytest.mark.anyio
+async def test_memory_store_estimates_its_size():
+    store = MemorySessionStore(ttl_seconds=60, max_count=10)
+    assert store.memory_bytes() == 0
+    await store.append("s1", _turn(0), max_messages=10)
+    small = store.memory_bytes()
+    await store.append("s1", [{"role": "tool", "content": "x" * 10_000}], 10)
+    assert store.memory_bytes() >= small + 10_000
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.mark.anyio
+async def test_memory_store_caps_on_insert_evicting_lru():
+    store = MemorySessionStore(ttl_seconds=60, max_count=2)
+    await store.append("a", _turn(0), max_messages=10)
+    await store.append("b", _turn(0), max_messages=10)
+    await store.load("a")
+    await store.append("c", _turn(0), max_messages=10)
+
+    assert list(store.sessions) == ["a", "c"]
+    assert store.evicted_capped == 1
+
+
+@pytest.mark.anyio
+async def test_memory_store_expires_idle_sessions_from_the_front():
+    clock = _Clock()
+    store = MemorySessionStore(ttl_seconds=60, max_count=10, clock=clock)
+    await store.append("a", _turn(0), max_messages=10)
+    clock.now += 30
+    await store.append("b", _turn(0), max_messages=10)
+    clock.now += 31
+
+    assert await store.load("a") == []
+    assert await store.cleanup() == 0
+    clock.now += 30
+    assert await store.cleanup() == 1
+    assert await store.count() == 0
+
+
+@pytest.mark.anyio
+async def test_memory_store_append_to_an_expired_session_starts_afresh():
+    clock = _Clock()
+    store = MemorySessionStore(ttl_seconds=60, max_count=10, clock=clock)
+    await store.append("a", _turn(0), max_messages=10)
+    clock.now += 61
+
+    await store.append("a", _turn(1), max_messages=10)
+    assert await store.load("a") == _turn(1)
+    assert store.memory_bytes() == store.sessions["a"].bytes
+
+
+@pytest.mark.anyio
+async def test_load_returns_a_copy():
+    store = MemorySessionStore(ttl_seconds=60, max_count=10)
+    await store.append("s1", _turn(0), max_messages=10)
+    history = await store.load("s1")
+    history.append({"role": "user", "content": "não guardado"})
+    assert len(await store.load("s1")) == 2
+
+
+def _tool_turn(call_id, payload):
+    return [
+        {"role": "user", "content": "Como está Leiria?"},
+        {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [
+                {
+                    "id": call_id,
+                    "type": "function",
+                    "function": {
+                        "name": "consultar_estado_tempestade_kristin",
+                        "arguments": '{"localizacao": "Leiria"}',
+                    },
+                }
+            ],
+        },
+        {"role": "tool", "tool_call_id": call_id, "content": payload},
+        {"role": "assistant", "content": "Em Leiria a reposição está a 70%."},
+    ]
+
+
+@pytest.mark.anyio
+async def test_memory_store_round_trips_tool_turns_sharing_strings():
+    store = MemorySessionStore(ttl_seconds=60, max_count=10)
+    payload = '{"distrito": "Leiria", "percentagem_reposta": 70}'
+    await store.append("a", _tool_turn("call_a", payload), max_messages=10)
+    # Equal but distinct strings, as two requests would deliver them.
+    await store.append("b", _tool_turn("call_b", "".join(payload)), max_messages=10)
+
+    a, b = await store.load("a"), await store.load("b")
+    assert a == _tool_turn("call_a", payload)
+    assert a[2]["content"] is b[2]["content"]
+    assert (
+        a[1]["tool_calls"][0]["function"]["arguments"]
+        is b[1]["tool_calls"][0]["function"]["arguments"]
+    )
+    # The running estimate charges shared strings to each session; a walk
+    # with one ``seen`` set counts them once.
+    assert store.memory_bytes() == store.session_bytes("a") + store.session_bytes("b")
+    seen: set[int] = set()
+    walked = sum(session.memory_bytes(seen) for session in store.sessions.values())
+    assert walked < store.memory_bytes()
+    assert store.session_bytes("missing") is None
+
+
+@pytest.mark.anyio
+async def test_memory_store_tracks_session_size_through_trims():
+    store = MemorySessionStore(ttl_seconds=60, max_count=10)
+    await store.append("s1", _turn(0), max_messages=2)
+    two = store.session_bytes("s1")
+    await store.append("s1", _turn(1), max_messages=2)
+    assert store.session_bytes("s1") == two == store.total_bytes
+
+
+@pytest.mark.anyio
+async def test_memory_store_byte_cap_evicts_lru_sessions():
+    store = MemorySessionStore(ttl_seconds=60, max_count=10)
+    await store.append("probe", _turn(0), max_messages=10)
+    per_session = store.session_bytes("probe")
+
+    store = MemorySessionStore(ttl_seconds=60, max_count=10, max_bytes=per_session * 2)
+    for name in ("a", "b", "c"):
+        await store.append(name, _turn(0), max_messages=10)
+    assert list(store.sessions) == ["b", "c"]
+    assert store.total_bytes == 2 * per_session
+    assert store.evicted_capped == 1
+
+
+def test_string_pool_is_bounded():
+    pool = StringPool(max_length=10, max_chars=12)
+    first = pool("".join(["ab", "cd"]))
+    assert pool("".join(["ab", "cd"])) is first
+    long = "x" * 11
+    assert pool(long) is long and len(pool) == 1
+    pool("y" * 10)  # over max_chars: the table starts over
+    assert len(pool) == 1
+
+
+@pytest.mark.anyio
+async def test_redis_store_shared_between_instances():
+    async with FakeRedisServer() as server:
+        worker_a = RedisSessionStore(server.url, ttl_seconds=60)
+        worker_b = RedisSessionStore(server.url, ttl_seconds=60)
+        try:
+            for i in range(3):
+                await worker_a.append("s1", _turn(i), max_messages=4)
+            await worker_b.append("s2", _turn(9), max_messages=4)
+
+            history = await worker_b.load("s1")
+            assert [m["content"] for m in history] == [
+                "pergunta 1",
+                "resposta 1",
+                "pergunta 2",
+                "resposta 2",
+            ]
+            assert await worker_a.load("missing") == []
+            assert await worker_a.count() == 2
+            assert server.cmd_ttl(b"eredes:session:s1") > 0
+            assert b"MULTI" in server.commands
+        finally:
+            await worker_a.close()
+            await worker_b.close()
+
+
+@pytest.mark.anyio
+async def test_redis_store_cleanup_prunes_index():
+    async with FakeRedisServer() as server:
+        store = RedisSessionStore(server.url, ttl_seconds=60)
+        try:
+            await store.append("s1", _turn(0), max_messages=10)
+            server.data[b"eredes:sessions"][b"s1"] -= 120
+            assert await store.cleanup() == 1
+            assert await store.count() == 0
+        finally:
+            await store.close()
+
+
+SUMMARY = {"role": "system", "content": "Resumo: pergunta 0 e 1."}
+
+
+@pytest.mark.anyio
+async def test_memory_store_replaces_an_unchanged_prefix():
+    store = MemorySessionStore(ttl_seconds=60, max_count=10)
+    for i in range(3):
+        await store.append("s1", _turn(i), max_messages=10)
+    older = _turn(0) + _turn(1)
+
+    assert not await store.replace_prefix("s1", _turn(1), [SUMMARY])
+    assert await store.replace_prefix("s1", older, [SUMMARY])
+    assert await store.load("s1") == [SUMMARY, *_turn(2)]
+    assert store.session_bytes("s1") == store.total_bytes
+    assert not await store.replace_prefix("missing", older, [SUMMARY])
+
+
+@pytest.mark.anyio
+async def test_redis_store_replaces_an_unchanged_prefix():
+    async with FakeRedisServer() as server:
+        store = RedisSessionStore(server.url, ttl_seconds=60)
+        try:
+            for i in range(3):
+                await store.append("s1", _turn(i), max_messages=10)
+            older = _turn(0) + _turn(1)
+
+            assert not await store.replace_prefix("s1", _turn(1), [SUMMARY])
+            assert await store.replace_prefix("s1", older, [SUMMARY])
+            assert await store.load("s1") == [SUMMARY, *_turn(2)]
+            assert b"WATCH" in server.commands
+        finally:
+            await store.close()
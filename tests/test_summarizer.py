@@ -0,0 +1,166 @@
+"""Tests for background conversation summaries."""
+
+import asyncio
+
+import pytest
+
+from session_store import MemorySessionStore
+from summarizer import SUMMARY_PREFIX, Summarizer, is_summary, render_transcript
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+def _turn(i):
+    return [
+        {"role": "user", "content": f"Pergunta {i} sobre Leiria?"},
+        {"role": "assistant", "content": f"Resposta {i}."},
+    ]
+
+
+class _Completer:
+    def __init__(self, reply="O cliente é de Leiria.", error=None):
+        self.reply = reply
+        self.error = error
+        self.prompts = []
+
+    async def __call__(self, messages):
+        self.prompts.append(messages)
+        if self.error is not None:
+            raise self.error
+        return self.reply
+
+
+async def _session(turns):
+    store = MemorySessionStore(ttl_seconds=60, max_count=10)
+    for i in range(turns):
+        await store.append("s1", _turn(i), max_messages=100)
+    return store
+
+
+async def _settle(summarizer):
+    while summarizer._tasks:
+        await asyncio.sleep(0)
+
+
+@pytest.mark.anyio
+async def test_short_history_is_left_alone():
+    store = await _session(2)
+    complete = _Completer()
+    summarizer = Summarizer(store, complete, trigger_tokens=10_000, trigger_messages=6)
+    summarizer.schedule("s1")
+    await _settle(summarizer)
+    assert complete.prompts == []
+    assert len(await store.load("s1")) == 4
+
+
+@pytest.mark.anyio
+async def test_older_turns_are_replaced_by_a_summary():
+    store = await _session(4)
+    complete = _Completer()
+    summarizer = Summarizer(
+        store, complete, trigger_tokens=10_000, trigger_messages=8, keep_turns=2
+    )
+    summarizer.schedule("s1")
+    summarizer.schedule("s1")  # already running: not scheduled twice
+    await _settle(summarizer)
+
+    history = await store.load("s1")
+    assert history == [
+        {"role": "system", "content": SUMMARY_PREFIX + "O cliente é de Leiria."},
+        *_turn(2),
+        *_turn(3),
+    ]
+    assert len(complete.prompts) == 1
+    transcript = complete.prompts[0][-1]["content"]
+    assert "Cliente: Pergunta 0 sobre Leiria?" in transcript
+    assert "Pergunta 2" not in transcript
+    assert summarizer.stats() == {"running": 0, "ok": 1}
+
+    # The next summary folds in the previous one.
+    for i in range(4, 6):
+        await store.append("s1", _turn(i), max_messages=100)
+    summarizer.trigger_messages = 5
+    summarizer.schedule("s1")
+    await _settle(summarizer)
+    assert "Resumo anterior: O cliente é de Leiria." in (
+        complete.prompts[1][-1]["content"]
+    )
+    history = await store.load("s1")
+    assert is_summary(history[0]) and len(history) == 5
+
+
+@pytest.mark.anyio
+async def test_failed_summary_leaves_history_for_trimming():
+    store = await _session(4)
+    summarizer = Summarizer(
+        store,
+        _Completer(error=TimeoutError()),
+        trigger_tokens=10_000,
+        trigger_messages=8,
+    )
+    summarizer.schedule("s1")
+    await _settle(summarizer)
+    assert len(await store.load("s1")) == 8
+    assert summarizer.stats()["error"] == 1
+
+
+@pytest.mark.anyio
+async def test_history_changed_meanwhile_is_not_overwritten():
+    store = await _session(4)
+
+    class _Trimming(_Completer):
+        async def __call__(self, messages):
+            # A turn lands and the count trim drops the oldest messages.
+            await store.append("s1", _turn(4), max_messages=8)
+            return await super().__call__(messages)
+
+    summarizer = Summarizer(
+        store, _Trimming(), trigger_tokens=10_000, trigger_messages=8
+    )
+    summarizer.schedule("s1")
+    await _settle(summarizer)
+    history = await store.load("s1")
+    assert [m["content"] for m in history[::2]] == [
+        f"Pergunta {i} sobre Leiria?" for i in range(1, 5)
+    ]
+    assert summarizer.stats()["conflict"] == 1
+
+
+@pytest.mark.anyio
+async def test_summary_deferred_under_load():
+    store = await _session(4)
+    complete = _Completer()
+    summarizer = Summarizer(
+        store, complete, 10_000, trigger_messages=8, should_defer=lambda: True
+    )
+    summarizer.schedule("s1")
+    await _settle(summarizer)
+    assert complete.prompts == []
+    assert summarizer.stats()["deferred"] == 1
+
+
+def test_transcript_shortens_tool_results():
+    messages = [
+        {"role": "user", "content": "Leiria"},
+        {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [
+                {
+                    "id": "c1",
+                    "type": "function",
+                    "function": {
+                        "name": "resumo_nacional_tempestade",
+                        "arguments": "{}",
+                    },
+                }
+            ],
+        },
+        {"role": "tool", "tool_call_id": "c1", "content": "x" * 1000},
+    ]
+    lines = render_transcript(messages).splitlines()
+    assert lines[:2] == ["Cliente: Leiria", "Consulta: resumo_nacional_tempestade({})"]
+    assert len(lines[2]) < 400
@@ -0,0 +1,110 @@
+"""Unit tests for token-budget history trimming."""
+
+import json
+
+from token_budget import (
+    ELIDED_TOOL_RESULT,
+    estimate_prompt_tokens,
+    fit_to_budget,
+    split_turns,
+)
+
+SYSTEM = {"role": "system", "content": "s" * 350}
+
+
+def _tool_turn(i, payload_chars=2000):
+    return [
+        {"role": "user", "content": f"Pergunta {i}"},
+        {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [
+                {
+                    "id": f"call_{i}",
+                    "type": "function",
+                    "function": {
+                        "name": "resumo_nacional_tempestade",
+                        "arguments": "{}",
+                    },
+                }
+            ],
+        },
+        {
+            "role": "tool",
+            "tool_call_id": f"call_{i}",
+            "content": json.dumps({"dados": "x" * payload_chars}),
+        },
+        {"role": "assistant", "content": f"Resposta {i}"},
+    ]
+
+
+def _history(turns):
+    messages = [SYSTEM]
+    for i in range(turns):
+        messages.extend(_tool_turn(i))
+    messages.append({"role": "user", "content": "Pergunta atual"})
+    return messages
+
+
+def _assert_valid(messages):
+    pending = set()
+    for m in messages:
+        if m["role"] == "tool":
+            assert m["tool_call_id"] in pending
+            pending.discard(m["tool_call_id"])
+        else:
+            assert not pending
+        if m.get("tool_calls"):
+            pending = {c["id"] for c in m["tool_calls"]}
+
+
+def test_history_within_budget_is_untouched():
+    messages = _history(2)
+    assert fit_to_budget(messages, budget=100_000) == messages
+
+
+def test_old_tool_payloads_elided_before_dropping_turns():
+    messages = _history(3)
+    trimmed = fit_to_budget(messages, budget=600)
+
+    assert len(trimmed) == len(messages)
+    tool_contents = [m["content"] for m in trimmed if m["role"] == "tool"]
+    assert tool_contents == [ELIDED_TOOL_RESULT] * 3
+    assert estimate_prompt_tokens(trimmed) <= 600
+    _assert_valid(trimmed)
+
+
+def test_whole_turns_dropped_oldest_first():
+    messages = _history(10)
+    trimmed = fit_to_budget(messages, budget=300)
+
+    assert trimmed[0] is SYSTEM
+    assert trimmed[-1]["content"] == "Pergunta atual"
+    assert trimmed[1]["role"] == "user"
+    assert "Pergunta 9" in [m["content"] for m in trimmed]
+    assert "Pergunta 0" not in [m["content"] for m in trimmed]
+    assert estimate_prompt_tokens(trimmed) <= 300
+    _assert_valid(trimmed)
+
+
+def test_current_turn_kept_even_over_budget():
+    messages = _history(1)
+    trimmed = fit_to_budget(messages, budget=1)
+    assert trimmed == [SYSTEM, messages[-1]]
+
+
+def test_split_turns_drops_orphaned_leading_messages():
+    orphaned = _tool_turn(0)[2:] + _tool_turn(1)
+    turns = split_turns(orphaned)
+    assert len(turns) == 1
+    assert turns[0][0]["content"] == "Pergunta 1"
+
+
+def test_conversation_summary_is_kept_like_the_system_prompt():
+    summary = {"role": "system", "content": "Resumo: o cliente é de Leiria."}
+    messages = _history(10)
+    messages.insert(1, summary)
+    trimmed = fit_to_budget(messages, budget=300)
+    assert trimmed[:2] == [SYSTEM, summary]
+    assert trimmed[2]["role"] == "user"
+    _assert_valid(trimmed)
@@ -0,0 +1,101 @@
+"""Tests for span tracing and its exporters."""
+
+import asyncio
+import json
+import time
+
+import pytest
+
+import tracing
+from logging_config import request_id_var
+from tracing import InMemoryExporter, OTLPFileExporter, Tracer
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+def _spans(trace: dict) -> list[dict]:
+    return trace["resourceSpans"][0]["scopeSpans"][0]["spans"]
+
+
+@pytest.mark.anyio
+async def test_spans_nest_across_gathered_tasks():
+    exporter = InMemoryExporter()
+    tracer = Tracer(exporter)
+
+    async def child(name):
+        with tracer.span(name):
+            await asyncio.sleep(0)
+
+    token = request_id_var.set("abc123def456")
+    try:
+        with tracer.span("root", tracing.SERVER, route="/api/chat"):
+            await asyncio.gather(child("a"), child("b"))
+    finally:
+        request_id_var.reset(token)
+
+    (trace,) = exporter.traces
+    spans = {s["name"]: s for s in _spans(trace)}
+    root = spans["root"]
+    assert root["traceId"] == "0" * 20 + "abc123def456"
+    assert "parentSpanId" not in root
+    assert spans["a"]["parentSpanId"] == spans["b"]["parentSpanId"] == root["spanId"]
+    assert root["attributes"] == [
+        {"key": "route", "value": {"stringValue": "/api/chat"}}
+    ]
+
+
+def test_errors_are_recorded_on_the_span():
+    exporter = InMemoryExporter()
+    tracer = Tracer(exporter)
+    with pytest.raises(RuntimeError):
+        with tracer.span("root"):
+            raise RuntimeError("boom")
+    (span,) = _spans(exporter.traces[0])
+    assert span["status"] == {"code": 2, "message": "RuntimeError: boom"}
+
+
+def test_head_sampling_drops_whole_traces():
+    exporter = InMemoryExporter()
+    tracer = Tracer(exporter, sample_ratio=0.0)
+    with tracer.span("root") as root:
+        with tracer.span("child") as child:
+            assert child is tracing.NOOP_SPAN
+    assert root is tracing.NOOP_SPAN
+    assert exporter.traces == []
+
+
+def test_tail_sampling_keeps_slow_or_failed_traces():
+    exporter = InMemoryExporter()
+    tracer = Tracer(exporter, sample_ratio=0.0, tail_threshold_seconds=0.02)
+    with tracer.span("fast"):
+        pass
+    with tracer.span("slow"):
+        time.sleep(0.03)
+    with tracer.span("failed"):
+        with tracer.span("child") as child:
+            child.set_error("tool timeout")
+    assert [_spans(t)[-1]["name"] for t in exporter.traces] == ["slow", "failed"]
+    assert tracer.stats()["traces_started"] == 3
+
+
+def test_file_exporter_writes_otlp_json_lines(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracer = Tracer(OTLPFileExporter(path))
+    for name in ("one", "two"):
+        with tracer.span(name) as span:
+            span.add_event("retry", attempt=1)
+    tracer.shutdown()
+
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert [_spans(json.loads(line))[0]["name"] for line in lines] == ["one", "two"]
+    event = _spans(json.loads(lines[0]))[0]["events"][0]
+    assert event["attributes"] == [{"key": "attempt", "value": {"intValue": "1"}}]
+
+
+def test_disabled_tracer_records_nothing():
+    tracer = Tracer()
+    with tracer.span("root") as span:
+        assert span is tracing.NOOP_SPAN
@@ -0,0 +1,89 @@
+"""Token estimation and budget-driven trimming of conversation history."""
+
+import json
+
+# Rough chars-per-token ratio for Portuguese text on Llama tokenizers; we
+# only need an estimate that errs on the generous side.
+CHARS_PER_TOKEN = 3.5
+MESSAGE_OVERHEAD_TOKENS = 4
+
+ELIDED_TOOL_RESULT = json.dumps(
+    {"nota": "Resultado antigo omitido. Volte a consultar a ferramenta se precisar."},
+    ensure_ascii=False,
+)
+# Old tool results shorter than this are kept verbatim.
+ELIDE_MIN_CHARS = 200
+
+
+def estimate_tokens(message: dict) -> int:
+    """Estimate the prompt tokens one chat message costs."""
+    chars = len(message.get("content") or "")
+    for call in message.get("tool_calls") or ():
+        chars += len(call["function"]["name"]) + len(call["function"]["arguments"])
+    return MESSAGE_OVERHEAD_TOKENS + int(chars / CHARS_PER_TOKEN)
+
+
+def estimate_prompt_tokens(messages: list[dict]) -> int:
+    return sum(estimate_tokens(m) for m in messages)
+
+
+def split_turns(messages: list[dict]) -> list[list[dict]]:
+    """Group non-system messages into turns, each starting at a user message.
+
+    A turn carries the assistant ``tool_calls`` message together with its
+    ``tool`` replies, so dropping whole turns never orphans either side.
+    Messages before the first user message (left over from a count-based
+    trim in storage) cannot form a valid turn and are discarded.
+    """
+    turns: list[list[dict]] = []
+    for message in messages:
+        if message["role"] == "user":
+            turns.append([message])
+        elif turns:
+            turns[-1].append(message)
+    return turns
+
+
+def _elide_tool_results(turn: list[dict]) -> list[dict]:
+    return [
+        {**m, "content": ELIDED_TOOL_RESULT}
+        if m["role"] == "tool" and len(m["content"]) > ELIDE_MIN_CHARS
+        else m
+        for m in turn
+    ]
+
+
+def fit_to_budget(messages: list[dict], budget: int) -> list[dict]:
+    """Return ``messages`` trimmed to roughly ``budget`` prompt tokens.
+
+    The leading system messages (the system prompt and any conversation
+    summary) and the latest turn are always kept. When the history does not
+    fit, older turns first lose their bulky tool payloads and are then
+    dropped whole, oldest first.
+    """
+    lead = 1
+    while lead < len(messages) and messages[lead]["role"] == "system":
+        lead += 1
+    system, turns = messages[:lead], split_turns(messages[lead:])
+    if not turns:
+        return system
+
+    current = turns.pop()
+    used = estimate_prompt_tokens(system) + estimate_prompt_tokens(current)
+    older = turns
+    if used + sum(estimate_prompt_tokens(t) for t in older) > budget:
+        older = [_elide_tool_results(t) for t in older]
+
+    kept: list[list[dict]] = []
+    for turn in reversed(older):
+        cost = estimate_prompt_tokens(turn)
+        if used + cost > budget:
+            break
+        kept.append(turn)
+        used += cost
+
+    result = list(system)
+    for turn in reversed(kept):
+        result.extend(turn)
+    result.extend(current)
+    return result
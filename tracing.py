@@ -0,0 +1,345 @@
+"""Lightweight span tracing for the chat pipeline.
+
+Spans nest through a context variable, so concurrent tool calls started
+with ``asyncio.gather`` each get the calling span as parent. A trace's id
+is the request id (``X-Request-ID``) left-padded to 32 hex digits, which
+makes logs and traces joinable.
+
+Completed traces are exported as OTLP/JSON ``TracesData`` objects, one per
+line, which an OpenTelemetry Collector can ingest with its
+``otlpjsonfile`` receiver. Sampling is decided per trace: a head ratio
+picks traces up front, and with a tail threshold every trace is recorded
+but only kept if it was slow or failed.
+"""
+
+import json
+import logging
+import queue
+import random
+import threading
+import time
+import uuid
+from collections.abc import Callable
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from pathlib import Path
+
+from logging_config import request_id_var
+
+logger = logging.getLogger(__name__)
+
+INTERNAL = 1
+SERVER = 2
+CLIENT = 3
+
+SERVICE_NAME = "eredes-chatbot"
+
+
+class Span:
+    __slots__ = (
+        "name",
+        "trace",
+        "span_id",
+        "parent_id",
+        "kind",
+        "start_ns",
+        "end_ns",
+        "attributes",
+        "events",
+        "error",
+    )
+
+    def __init__(self, name, trace, parent_id, kind, attributes):
+        self.name = name
+        self.trace = trace
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes
+        self.events: list[tuple[str, int, dict]] = []
+        self.error: str | None = None
+
+    def set_attribute(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def add_event(self, name: str, **attributes) -> None:
+        self.events.append((name, time.time_ns(), attributes))
+
+    def set_error(self, message: str) -> None:
+        self.error = message
+
+
+class _NoopSpan:
+    """Stands in for spans that are not recorded; every method is a no-op."""
+
+    def set_attribute(self, key: str, value) -> None:
+        pass
+
+    def add_event(self, name: str, **attributes) -> None:
+        pass
+
+    def set_error(self, message: str) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+_current: ContextVar[Span | _NoopSpan | None] = ContextVar(
+    "current_span", default=None
+)
+
+
+class _Trace:
+    __slots__ = ("trace_id", "sampled", "spans")
+
+    def __init__(self, trace_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.spans: list[Span] = []
+
+
+def _new_trace_id() -> str:
+    request_id = request_id_var.get()
+    if request_id:
+        try:
+            int(request_id, 16)
+        except ValueError:
+            pass
+        else:
+            return request_id[-32:].rjust(32, "0")
+    return uuid.uuid4().hex
+
+
+# ── OTLP/JSON encoding ─────────────────────────────────────────────────────
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: dict) -> list[dict]:
+    return [{"key": k, "value": _otlp_value(v)} for k, v in attributes.items()]
+
+
+def to_otlp(spans: list[Span], service_name: str = SERVICE_NAME) -> dict:
+    """Encode one trace's spans as an OTLP/JSON ``TracesData`` object."""
+    encoded = []
+    for span in spans:
+        item = {
+            "traceId": span.trace.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": span.kind,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": _otlp_attributes(span.attributes),
+            "events": [
+                {
+                    "name": name,
+                    "timeUnixNano": str(ts),
+                    "attributes": _otlp_attributes(attrs),
+                }
+                for name, ts, attrs in span.events
+            ],
+            "status": {"code": 2, "message": span.error} if span.error else {},
+        }
+        if span.parent_id:
+            item["parentSpanId"] = span.parent_id
+        encoded.append(item)
+    return {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": _otlp_attributes({"service.name": service_name})
+                },
+                "scopeSpans": [{"scope": {"name": __name__}, "spans": encoded}],
+            }
+        ]
+    }
+
+
+# ── Exporters ──────────────────────────────────────────────────────────────
+class InMemoryExporter:
+    """Keeps encoded traces in a list; for tests and debugging."""
+
+    def __init__(self):
+        self.traces: list[dict] = []
+
+    def export(self, spans: list[Span]) -> None:
+        self.traces.append(to_otlp(spans))
+
+    def shutdown(self) -> None:
+        pass
+
+
+class OTLPFileExporter:
+    """Appends OTLP/JSON traces to a JSON Lines file.
+
+    Encoding and writing happen on a background thread, so exporting from
+    the event loop is a queue put.
+    """
+
+    def __init__(self, path: str | Path, service_name: str = SERVICE_NAME):
+        self.path = Path(path)
+        self.service_name = service_name
+        self._queue: queue.SimpleQueue[list[Span] | None] = queue.SimpleQueue()
+        self._thread: threading.Thread | None = None
+
+    def export(self, spans: list[Span]) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="trace-exporter", daemon=True
+            )
+            self._thread.start()
+        self._queue.put(spans)
+
+    def _run(self) -> None:
+        with self.path.open("a", encoding="utf-8") as f:
+            while (spans := self._queue.get()) is not None:
+                try:
+                    f.write(json.dumps(to_otlp(spans, self.service_name)) + "\n")
+                    f.flush()
+                except (OSError, TypeError, ValueError) as e:
+                    logger.error("trace_export_failed", extra={"error": str(e)})
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """Flush queued traces and stop the writer thread."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+
+# ── Tracer ─────────────────────────────────────────────────────────────────
+class Tracer:
+    """Creates spans and decides, per trace, whether to export it.
+
+    A new trace is head-sampled with probability ``sample_ratio``. With
+    ``tail_threshold_seconds`` > 0 every trace is recorded, and one that
+    was not head-sampled is still exported if its root span took at least
+    that long or any span failed. Without an exporter tracing is off and
+    spans cost one context-variable read.
+    """
+
+    def __init__(
+        self,
+        exporter=None,
+        sample_ratio: float = 1.0,
+        tail_threshold_seconds: float = 0.0,
+        rng: Callable[[], float] = random.random,
+    ):
+        self.exporter = exporter
+        self.sample_ratio = sample_ratio
+        self.tail_threshold_ns = int(tail_threshold_seconds * 1e9)
+        self._rng = rng
+        self.traces_started = 0
+        self.traces_exported = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    @contextmanager
+    def span(self, name: str, kind: int = INTERNAL, **attributes):
+        """Open a span as a child of the current one (or a new trace)."""
+        parent = _current.get()
+        if self.exporter is None or parent is NOOP_SPAN:
+            yield NOOP_SPAN
+            return
+
+        if parent is None:
+            sampled = self._rng() < self.sample_ratio
+            if not sampled and not self.tail_threshold_ns:
+                token = _current.set(NOOP_SPAN)
+                try:
+                    yield NOOP_SPAN
+                finally:
+                    _reset(token)
+                return
+            self.traces_started += 1
+            trace = _Trace(_new_trace_id(), sampled)
+            span = Span(name, trace, None, kind, attributes)
+        else:
+            span = Span(name, parent.trace, parent.span_id, kind, attributes)
+
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            if span.error is None:
+                span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            _reset(token)
+            span.trace.spans.append(span)
+            if parent is None:
+                self._finish(span)
+
+    def _finish(self, root: Span) -> None:
+        trace = root.trace
+        keep = trace.sampled or (
+            root.end_ns - root.start_ns >= self.tail_threshold_ns
+            or any(s.error for s in trace.spans)
+        )
+        if keep:
+            self.traces_exported += 1
+            self.exporter.export(trace.spans)
+
+    def shutdown(self) -> None:
+        if self.exporter is not None:
+            self.exporter.shutdown()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "traces_started": self.traces_started,
+            "traces_exported": self.traces_exported,
+        }
+
+
+def _reset(token) -> None:
+    try:
+        _current.reset(token)
+    except ValueError:
+        # An async generator finalized from another context (e.g. a client
+        # disconnect mid-stream); that context never saw the span.
+        pass
+
+
+tracer = Tracer()
+
+
+def configure(new_tracer: Tracer) -> None:
+    global tracer
+    tracer = new_tracer
+
+
+def span(name: str, kind: int = INTERNAL, **attributes):
+    """Open a span on the configured tracer."""
+    return tracer.span(name, kind, **attributes)
+
+
+def current_span() -> Span | _NoopSpan:
+    return _current.get() or NOOP_SPAN
+
+
+def traced(name: str, kind: int = INTERNAL):
+    """Decorator running a coroutine function inside a span."""
+
+    def decorator(fn):
+        @wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with tracer.span(name, kind):
+                return await fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator